@@ -1,55 +1,101 @@
 # app.py
+import math
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, abort
+import tempfile
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, abort,
+                   jsonify, Response, stream_with_context)
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
-from config import SECRET_KEY, DB_CONFIG, EMAIL_ADDRESS, EMAIL_PASSWORD, SMTP_SERVER, SMTP_PORT
-import smtplib
-from email.message import EmailMessage
+from config import (SECRET_KEY, DB_CONFIG, CACHE_INVALIDATION_LISTENER, MAX_UPLOAD_SIZE, ASYNC_DB,
+                    LOGIN_MAX_FAILURES_PER_USER, LOGIN_MAX_FAILURES_PER_IP, TRUSTED_PROXY_HOPS, BOOK_CATEGORIES,
+                    ARCHIVE_AFTER_MONTHS)
+from mailer import enqueue_overdue_job, job_status
+from catalog_import import detect_format, enqueue_import, import_status
+from pdf_delivery import send_pdf
+from blob_store import PDF_FOLDER, IMMUTABLE_MAX_AGE, is_immutable_name
+from uploads import (UploadRequest, EXTENSIONS as UPLOAD_EXTENSIONS, save_upload, start_resumable,
+                     resumable_status, append_chunk, cancel_resumable, claim_resumable)
+from thumbnails import enqueue_thumbnails, thumbnail_status, cover_sources
+from pdf_indexer import enqueue_pdf_index, index_status
+from exports import FORMATS as EXPORT_FORMATS, parse_filters, export_rows, export_filename
+from instrumentation import instrument_app
 
 # --- Imports for DAOs ---
-from dao.user_dao import UserDAO, hash_password, get_connection as user_get_connection
-from dao.book_dao import BookDAO
-from dao.transaction_dao import TransactionDAO
+from dao.user_dao import UserDAO, PasswordHashingBusy, get_connection as user_get_connection
+from dao.login_throttle_dao import LoginThrottleDAO, user_key, ip_key
+from dao.book_dao import CachedBookDAO
+from dao.transaction_dao import TransactionDAO, BORROW_OK
+from dao.hold_dao import HoldDAO, HOLD_OK
+from dao.stats_dao import StatsDAO
+from dao.pdf_index_dao import PdfIndexDAO
+from dao.db import pool_stats
+from dao.async_db import gather_db, async_pool_stats
+from dao.cache import book_cache, entitlement_cache
+from dao.invalidation import ensure_listener, listener_stats
 
 # --- App Setup ---
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+# Behind the router every request comes from its address: take the client's from X-Forwarded-For
+# (the entry the router added), so the per-IP login throttle counts clients, not the router
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+app.add_template_global(cover_sources)
+# Per-request query counts and timings, slow-query log and /metrics (instrumentation.py)
+instrument_app(app)
+# File parts are streamed to disk with per-kind limits (uploads.py); this caps any one request
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
 
 # DAOs
 user_dao = UserDAO()
-book_dao = BookDAO()
+book_dao = CachedBookDAO()
 tx_dao = TransactionDAO()
+hold_dao = HoldDAO()
+stats_dao = StatsDAO()
+pdf_index_dao = PdfIndexDAO()
+throttle_dao = LoginThrottleDAO()
 
-# Upload folders
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PDF_FOLDER = os.path.join(BASE_DIR, "static", "uploads", "pdfs")
-COVER_FOLDER = os.path.join(BASE_DIR, "static", "uploads", "covers")
-os.makedirs(PDF_FOLDER, exist_ok=True)
-os.makedirs(COVER_FOLDER, exist_ok=True)
+# Uploads are stored by content hash in PDF_FOLDER / COVER_FOLDER (see blob_store.py)
+ALLOWED_PDF = UPLOAD_EXTENSIONS['pdfs']
+ALLOWED_IMAGE = UPLOAD_EXTENSIONS['covers']
 
-ALLOWED_PDF = {'pdf'}
-ALLOWED_IMAGE = {'png', 'jpg', 'jpeg', 'gif'}
+# Rows shown on /admin/transactions (full history is available as an export)
+TRANSACTIONS_PAGE_LIMIT = 200
+
+# Books returned by one in-book (PDF text) search
+PAGE_SEARCH_MAX_RESULTS = 50
 
 def allowed_file(filename, allowed_set):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_set
 
-# --- Helper Functions ---
-def send_overdue_email(to_email, subject, body):
-    if not EMAIL_ADDRESS or not EMAIL_PASSWORD:
-        print("Email credentials not configured; skipping sending")
-        return
-    msg = EmailMessage()
-    msg['Subject'] = subject
-    msg['From'] = EMAIL_ADDRESS
-    msg['To'] = to_email
-    msg.set_content(body)
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
-            smtp.starttls()
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.send_message(msg)
-    except Exception as e:
-        print("Failed to send email:", e)
+# --- Cross-worker cache invalidation ---
+@app.before_request
+def start_invalidation_listener():
+    # Started per worker process on its first request (gunicorn forks after importing app)
+    if CACHE_INVALIDATION_LISTENER:
+        ensure_listener()
+
+@app.after_request
+def cache_stored_covers(response):
+    # Content-addressed covers and their thumbnails never change under the same URL
+    if (request.path.startswith('/static/uploads/covers/') and response.status_code == 200
+            and is_immutable_name(request.path.rsplit('/', 1)[-1])):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def upload_refused(e):
+    # Raised while a form's files stream in (size limits, file signatures)
+    if request.path.startswith('/admin/uploads'):
+        return jsonify({"error": e.description}), e.code
+    flash(e.description, "danger")
+    return redirect(request.referrer or url_for('admin_dashboard'))
 
 # --- Routes ---
 @app.route('/')
@@ -63,12 +109,25 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user = user_dao.authenticate(username, password)
+        # Checked before hashing anything, so brute-force attempts cost one query each
+        limits = {user_key(username): LOGIN_MAX_FAILURES_PER_USER,
+                  ip_key(request.remote_addr): LOGIN_MAX_FAILURES_PER_IP}
+        wait = throttle_dao.retry_after(limits)
+        if wait:
+            flash(f"Too many failed logins — try again in {math.ceil(wait / 60)} min", "danger")
+            return render_template('login.html'), 429, {"Retry-After": str(wait)}
+        try:
+            user = user_dao.authenticate(username, password)
+        except PasswordHashingBusy:
+            flash("Too many people are logging in right now — please try again in a moment", "warning")
+            return render_template('login.html'), 503, {"Retry-After": "2"}
         if user:
+            throttle_dao.clear(user_key(username))
             session['username'] = user['username']
             session['user_type'] = user['user_type']
             flash("Logged in successfully", "success")
             return redirect(url_for('catalog'))
+        throttle_dao.record_failure(limits)
         flash("Invalid credentials", "danger")
     return render_template('login.html')
 
@@ -96,27 +155,50 @@ def logout():
     return redirect(url_for('login'))
 
 # --- Catalog/Search/Filter ---
-BOOK_CATEGORIES = ["Science Fiction", "Romantic", "Mystery", "Biography", "History", "Fantasy", "Self-Help", "Technology"]
-
 @app.route('/catalog', methods=['GET', 'POST'])
 def catalog():
     keyword = request.args.get('keyword') or request.form.get('keyword')
     category = request.args.get('category') or request.form.get('category')
     only_available = request.args.get('only_available') == '1' or (request.form.get('only_available') == 'on')
-    books = book_dao.search_books(keyword=keyword, category=category, only_available=only_available)
-    return render_template('view_books.html', books=books, categories=BOOK_CATEGORIES,
+    page = book_dao.get_books_page(keyword=keyword, category=category, only_available=only_available,
+                                   cursor=request.args.get('cursor'), page_size=request.args.get('per_page'))
+    return render_template('view_books.html', books=page['books'], page=page, categories=BOOK_CATEGORIES,
                            keyword=keyword, category=category, only_available=only_available)
 
 # --- Admin routes ---
+@app.route('/api/search/pages')
+def api_search_pages():
+    # Matches inside book PDFs: books with page numbers and highlighted snippets (pdf_indexer.py).
+    # Students only get snippets from PDFs they have on loan
+    if not session.get('username'):
+        return jsonify({"error": "Login required"}), 401
+    keyword = (request.args.get('q') or '').strip()
+    if not keyword:
+        return jsonify({"error": "'q' is required"}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), PAGE_SEARCH_MAX_RESULTS)
+    results = pdf_index_dao.search_pages(keyword, category=request.args.get('category'),
+                                         only_available=request.args.get('only_available') == '1', limit=limit,
+                                         reader=None if session.get('user_type') == 'Admin' else session['username'])
+    return jsonify({"query": keyword, "results": results})
+
 @app.route('/admin')
-def admin_dashboard():
+async def admin_dashboard():
     if session.get('user_type') != 'Admin':
         flash("Access Denied", "danger")
         return redirect(url_for('login'))
-    books = book_dao.get_all_books()
-    students = user_dao.get_all_students()
-    transactions = tx_dao.get_all_transactions()
-    return render_template('dashboard_admin.html', books=books, students=students, transactions=transactions)
+    cursor, per_page = request.args.get('cursor'), request.args.get('per_page')
+    if ASYNC_DB:
+        # The three queries run concurrently, each on its own connection
+        page, stats, transactions = await gather_db(
+            book_dao.get_books_page_async(cursor=cursor, page_size=per_page),
+            stats_dao.get_dashboard_stats_async(),
+            tx_dao.get_recent_transactions_async())
+    else:
+        page = book_dao.get_books_page(cursor=cursor, page_size=per_page)
+        stats = stats_dao.get_dashboard_stats()
+        transactions = tx_dao.get_recent_transactions()
+    return render_template('dashboard_admin.html', books=page['books'], page=page, stats=stats,
+                           transactions=transactions)
 
 @app.route('/admin/add', methods=['GET', 'POST'])
 def admin_add_book():
@@ -130,16 +212,75 @@ def admin_add_book():
         cover_filename = None
         pdf_filename = None
         if cover and allowed_file(cover.filename, ALLOWED_IMAGE):
-            cover_filename = secure_filename(cover.filename)
-            cover.save(os.path.join(COVER_FOLDER, cover_filename))
-        if pdf and allowed_file(pdf.filename, ALLOWED_PDF):
-            pdf_filename = secure_filename(pdf.filename)
-            pdf.save(os.path.join(PDF_FOLDER, pdf_filename))
+            cover_filename = save_upload(cover, "covers")
+            enqueue_thumbnails(cover_filename)
+        if request.form.get('pdf_upload'):
+            # Sent beforehand in chunks by static/js/resumable_upload.js
+            pdf_filename = claim_resumable(request.form['pdf_upload'], "pdfs", session.get('username')) or pdf_filename
+        elif pdf and allowed_file(pdf.filename, ALLOWED_PDF):
+            pdf_filename = save_upload(pdf, "pdfs")
+        if pdf_filename and (request.form.get('pdf_upload') or pdf):
+            enqueue_pdf_index(pdf_filename)
         book_dao.add_book(title, author, category, isbn, description, cover_filename, pdf_filename)
         flash("Book added", "success")
         return redirect(url_for('admin_dashboard'))
     return render_template('add_book.html')
 
+@app.route('/admin/import', methods=['GET', 'POST'])
+def admin_import_books():
+    if session.get('user_type') != 'Admin':
+        flash("Access Denied", "danger")
+        return redirect(url_for('login'))
+    if request.method == 'POST':
+        upload = request.files.get('catalog_file')
+        fmt = detect_format(upload.filename) if upload and upload.filename else None
+        if fmt is None:
+            flash("Please choose a .csv or .jsonl file.", "danger")
+            return redirect(url_for('admin_import_books'))
+        # Saved to disk (streamed in chunks) so the import can run after the request returns
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        with os.fdopen(fd, "wb") as target:
+            upload.save(target)
+        if enqueue_import(path, fmt, secure_filename(upload.filename)):
+            flash("Import started. Refresh this page to see the report.", "info")
+        else:
+            os.remove(path)
+            flash("An import is already in progress.", "warning")
+        return redirect(url_for('admin_import_books'))
+    return render_template('import_books.html', status=import_status())
+
+# --- Resumable uploads (uploads.py) ---
+@app.route('/admin/uploads', methods=['POST'])
+def admin_start_upload():
+    if session.get('user_type') != 'Admin':
+        return jsonify({"error": "Access Denied"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "'size' must be a number of bytes"}), 400
+    try:
+        return jsonify(start_resumable(data.get('kind'), str(data.get('filename') or ''), size,
+                                       session.get('username'))), 201
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+
+@app.route('/admin/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def admin_resumable_upload(upload_id):
+    if session.get('user_type') != 'Admin':
+        return jsonify({"error": "Access Denied"}), 403
+    username = session.get('username')
+    try:
+        if request.method == 'PATCH':
+            offset = request.headers.get('Upload-Offset', type=int)
+            return jsonify(append_chunk(upload_id, offset, request.stream, request.content_length, username))
+        if request.method == 'DELETE':
+            cancel_resumable(upload_id, username)
+            return '', 204
+        return jsonify(resumable_status(upload_id, username))
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+
 @app.route('/admin/edit/<int:book_id>', methods=['GET', 'POST'])
 def admin_edit_book(book_id):
     if session.get('user_type') != 'Admin':
@@ -156,16 +297,30 @@ def admin_edit_book(book_id):
         cover_filename = book.get('cover_image')
         pdf_filename = book.get('pdf_file')
         if cover and allowed_file(cover.filename, ALLOWED_IMAGE):
-            cover_filename = secure_filename(cover.filename)
-            cover.save(os.path.join(COVER_FOLDER, cover_filename))
-        if pdf and allowed_file(pdf.filename, ALLOWED_PDF):
-            pdf_filename = secure_filename(pdf.filename)
-            pdf.save(os.path.join(PDF_FOLDER, pdf_filename))
+            cover_filename = save_upload(cover, "covers")
+            enqueue_thumbnails(cover_filename)
+        if request.form.get('pdf_upload'):
+            # Sent beforehand in chunks by static/js/resumable_upload.js
+            pdf_filename = claim_resumable(request.form['pdf_upload'], "pdfs", session.get('username')) or pdf_filename
+        elif pdf and allowed_file(pdf.filename, ALLOWED_PDF):
+            pdf_filename = save_upload(pdf, "pdfs")
+        if pdf_filename and (request.form.get('pdf_upload') or pdf):
+            enqueue_pdf_index(pdf_filename)
         book_dao.update_book(book_id, title, author, category, isbn, description, cover_filename, pdf_filename)
+        copies = request.form.get('copies', type=int)
+        if copies is not None and copies != book['copies_total']:
+            outcome = book_dao.set_copies(book_id, copies)
+            if outcome != "ok":
+                flash(COPIES_FAILURE_MESSAGES.get(outcome, "Could not change the number of copies."), "danger")
         flash("Book updated", "success")
         return redirect(url_for('admin_dashboard'))
     return render_template('edit_book.html', book=book)
 
+COPIES_FAILURE_MESSAGES = {
+    "invalid": "A book needs at least one copy.",
+    "in_use": "Copies out on loan or kept for a hold cannot be removed.",
+}
+
 @app.route('/admin/delete/<int:book_id>', methods=['POST'])
 def admin_delete_book(book_id):
     if session.get('user_type') != 'Admin':
@@ -197,43 +352,115 @@ def admin_transactions():
     if session.get('user_type') != 'Admin':
         flash("Access Denied", "danger")
         return redirect(url_for('login'))
-    transactions = tx_dao.get_all_transactions()
-    return render_template('transactions.html', transactions=transactions)
+    # The full history can be millions of rows: the page shows the latest ones, exports stream the rest
+    transactions = tx_dao.get_recent_transactions(limit=TRANSACTIONS_PAGE_LIMIT)
+    return render_template('transactions.html', transactions=transactions, limit=TRANSACTIONS_PAGE_LIMIT,
+                           archive_after_months=ARCHIVE_AFTER_MONTHS)
+
+@app.route('/admin/export/<kind>')
+def admin_export(kind):
+    if session.get('user_type') != 'Admin':
+        flash("Access Denied", "danger")
+        return redirect(url_for('login'))
+    fmt = request.args.get('format', 'csv')
+    try:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError("'format' must be csv or jsonl")
+        filters = parse_filters(kind, request.args)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('admin_transactions'))
+    return Response(stream_with_context(export_rows(kind, fmt, **filters)), mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": f'attachment; filename="{export_filename(kind, fmt)}"',
+                             "X-Accel-Buffering": "no"})  # let nginx pass chunks straight through
+
+@app.route('/admin/monitoring')
+def admin_monitoring():
+    if session.get('user_type') != 'Admin':
+        return jsonify({"error": "Access Denied"}), 403
+    return jsonify({"db_pool": pool_stats(), "async_db_pool": async_pool_stats(), "book_cache": book_cache.stats(),
+                    "entitlement_cache": entitlement_cache.stats(),
+                    "invalidation_listener": listener_stats(), "overdue_job": job_status(),
+                    "catalog_import": import_status(), "thumbnails": thumbnail_status(),
+                    "pdf_index": {"background": index_status(), "documents": pdf_index_dao.get_stats()}})
 
 @app.route('/admin/send_overdue')
 def admin_send_overdue():
     if session.get('user_type') != 'Admin':
         flash("Access Denied", "danger")
         return redirect(url_for('login'))
-    overdue = tx_dao.get_overdue_transactions()
-    for t in overdue:
-        if t.get('email'):
-            subject = f"Overdue notice for '{t['title']}'"
-            body = f"Dear {t['student_username']},\nYour borrowed book '{t['title']}' was due on {t['return_date']}. Please return it as soon as possible."
-            send_overdue_email(t['email'], subject, body)
-    flash(f"Overdue emails processed ({len(overdue)}).", "info")
+    if enqueue_overdue_job():
+        flash("Overdue notices are being sent in the background.", "info")
+    else:
+        flash("An overdue run is already in progress.", "warning")
     return redirect(url_for('admin_dashboard'))
 
 # --- Student actions ---
+BORROW_FAILURE_MESSAGES = {
+    "missing": "This book no longer exists.",
+    "unavailable": "All copies of this book are out — place a hold to join the queue.",
+    "already_borrowed": "You already have a copy of this book.",
+    "limit_reached": "You have reached the maximum number of borrowed books. Return one first.",
+    "borrowed_today": "You already borrowed this book today.",
+}
+
+HOLD_FAILURE_MESSAGES = {
+    "missing": "This book no longer exists.",
+    "available": "A copy is available — borrow it now.",
+    "already_borrowed": "You already have a copy of this book.",
+    "already_held": "You are already in the queue for this book.",
+    "limit_reached": "You have reached the maximum number of holds. Cancel one first.",
+}
+
 @app.route('/borrow/<int:book_id>')
 def borrow(book_id):
     if session.get('user_type') != 'Student':
         flash("This action is for students only.", "danger")
         return redirect(url_for('login'))
-    ok = tx_dao.borrow_book(book_id, session['username'])
-    if ok:
+    status = tx_dao.borrow_book(book_id, session['username'])
+    if status == BORROW_OK:
         flash("Borrowed — check My Books", "success")
     else:
-        flash("Cannot borrow this book.", "danger")
+        flash(BORROW_FAILURE_MESSAGES.get(status, "Cannot borrow this book."), "danger")
+    return redirect(url_for('catalog'))
+
+@app.route('/hold/<int:book_id>')
+def place_hold(book_id):
+    if session.get('user_type') != 'Student':
+        flash("This action is for students only.", "danger")
+        return redirect(url_for('login'))
+    status = hold_dao.place_hold(book_id, session['username'])
+    if status == HOLD_OK:
+        flash("You are in the queue — the book is kept for you when a copy comes back", "success")
+    else:
+        flash(HOLD_FAILURE_MESSAGES.get(status, "Cannot place a hold on this book."), "danger")
     return redirect(url_for('catalog'))
 
+@app.route('/hold/<int:book_id>/cancel')
+def cancel_hold(book_id):
+    if session.get('user_type') != 'Student':
+        flash("This action is for students only.", "danger")
+        return redirect(url_for('login'))
+    if hold_dao.cancel_hold(book_id, session['username']):
+        flash("Hold cancelled.", "info")
+    else:
+        flash("Cannot cancel this hold.", "danger")
+    return redirect(url_for('mybooks'))
+
 @app.route('/mybooks')
-def mybooks():
+async def mybooks():
     if session.get('user_type') != 'Student':
         flash("This action is for students only.", "danger")
         return redirect(url_for('login'))
-    books = tx_dao.get_student_transactions(session['username'])
-    return render_template('my_books.html', books=books)
+    # Loans archived by loan_archive.py are only read on request
+    include_archive = request.args.get('archive') == '1'
+    if ASYNC_DB:
+        books, holds = await gather_db(tx_dao.get_student_transactions_async(session['username'], include_archive),
+                                       hold_dao.get_student_holds_async(session['username']))
+    else:
+        books = tx_dao.get_student_transactions(session['username'], include_archive)
+        holds = hold_dao.get_student_holds(session['username'])
+    return render_template('my_books.html', books=books, holds=holds, include_archive=include_archive)
 
 @app.route('/return/<int:book_id>')
 def return_book(book_id):
@@ -256,13 +483,13 @@ def download_pdf(filename):
 
     # Admin can download any file
     if session.get('user_type') == 'Admin':
-        return send_from_directory(PDF_FOLDER, filename)
+        return send_pdf(PDF_FOLDER, filename)
 
     # Student must have a valid borrow transaction
     if session.get('user_type') == 'Student':
         is_borrowed = tx_dao.check_borrow_status(filename, session.get('username'))
         if is_borrowed:
-            return send_from_directory(PDF_FOLDER, filename)
+            return send_pdf(PDF_FOLDER, filename)
     
     flash("You must borrow this book to download/read its PDF.", "danger")
     return redirect(url_for('mybooks'))
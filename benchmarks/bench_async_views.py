@@ -0,0 +1,99 @@
+# benchmarks/bench_async_views.py
+"""
+Sync vs async database access for the DB-bound views (/admin, /mybooks), per ASYNC_DB.
+
+For each setting, starts `gunicorn app:app` with the same --workers gthread
+workers and --threads threads, with the book and dashboard caches off so every
+request reaches Postgres, then has --clients threads request the admin
+dashboard and a student's "My Books" page in turn for --seconds. Reports
+requests/s and latency per page. With ASYNC_DB=1 the three dashboard queries
+run concurrently on the async pool instead of one after another.
+
+    python -m benchmarks.bench_async_views --workers 2 --threads 4 --clients 16 --seconds 20
+"""
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+import psycopg
+from benchmarks.common import base_parser, summarize, free_port, wait_for, session_cookie
+
+PAGES = ("/admin", "/mybooks")
+
+def busiest_student(dsn: str) -> str:
+    with psycopg.connect(dsn) as conn:
+        row = conn.execute("""
+            SELECT u.username FROM users u LEFT JOIN transactions t ON t.student_username = u.username
+            WHERE u.user_type='Student' GROUP BY u.username ORDER BY count(t.id) DESC LIMIT 1
+        """).fetchone()
+    return row[0] if row else "bench"
+
+def run_clients(port: int, cookies: dict, clients: int, seconds: float) -> dict:
+    """Each client alternates between the pages on its own keep-alive connection until time is up."""
+    latencies = {path: [] for path in PAGES}
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        turn = offset
+        while time.perf_counter() < deadline:
+            path = PAGES[turn % len(PAGES)]
+            turn += 1
+            begin = time.perf_counter()
+            conn.request("GET", path, headers={"Cookie": cookies[path]})
+            response = conn.getresponse()
+            response.read()
+            elapsed = (time.perf_counter() - begin) * 1000
+            with lock:
+                latencies[path].append(elapsed)
+                if response.status != 200:
+                    errors[0] += 1
+        conn.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    total = sum(len(samples) for samples in latencies.values())
+    return {"req_per_s": round(total / wall, 1), "errors": errors[0],
+            "all": summarize([ms for samples in latencies.values() for ms in samples]),
+            **{path: summarize(samples) for path, samples in latencies.items()}}
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (same for both settings)")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=20)
+    args = parser.parse_args()
+
+    cookies = {"/admin": session_cookie("Admin", "bench"),
+               "/mybooks": session_cookie("Student", busiest_student(args.dsn))}
+    for async_db in ("0", "1"):
+        port = free_port()
+        env = dict(os.environ, ASYNC_DB=async_db, BOOK_CACHE_SIZE="0", DASHBOARD_STATS_TTL="0",
+                   CACHE_INVALIDATION_LISTENER="0", REQUEST_LOG="0", DATABASE_URL=args.dsn)
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}",
+                                   "-w", str(args.workers), "-k", "gthread", "--threads", str(args.threads),
+                                   "--log-level", "warning"], env=env)
+        try:
+            wait_for(port)
+            run_clients(port, cookies, args.clients, min(2.0, args.seconds))  # warm up pools
+            result = run_clients(port, cookies, args.clients, args.seconds)
+        finally:
+            server.terminate()
+            server.wait()
+        pages = " | ".join(f"{path} p50 {result[path]['p50_ms']:>6.1f} ms p99 {result[path]['p99_ms']:>6.1f} ms"
+                           for path in PAGES)
+        print(f"ASYNC_DB={async_db} {result['req_per_s']:>7} req/s  p99 {result['all']['p99_ms']:>6.1f} ms | "
+              f"{pages} | errors {result['errors']}")
+
+if __name__ == "__main__":
+    main()
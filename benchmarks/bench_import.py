@@ -0,0 +1,81 @@
+# benchmarks/bench_import.py
+"""
+Throughput of the bulk catalog import versus one INSERT per book.
+
+Writes a generated CSV (with a small share of invalid rows) to a temp file and
+imports it into a throwaway "bench_import" schema twice: once into an empty
+table (all inserts) and once more (all updates). The per-row baseline uses
+BookDAO.add_book, the path the admin form takes.
+
+    python -m benchmarks.bench_import --rows 100000
+"""
+import csv
+import os
+import resource
+import tempfile
+import time
+import psycopg
+from psycopg.conninfo import make_conninfo
+from benchmarks.common import base_parser
+from catalog_import import import_file
+from dao.book_dao import BookDAO
+from dao.db import create_pool, set_pool, close_pool
+from migrations import migrate
+
+SCHEMA = "bench_import"
+FIELDS = ["title", "author", "isbn", "category", "description", "is_available"]
+
+def write_csv(path: str, rows: int) -> int:
+    """Writes the sample file; every 500th row lacks an author. Returns the number of invalid rows."""
+    invalid = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for i in range(rows):
+            author = "" if i % 500 == 499 else f"Author {i % 5000}"
+            invalid += not author
+            writer.writerow([f"Imported Book {i}", author, f"IMP{i:09d}", "Science",
+                             f"Description of imported book {i}", "true"])
+    return invalid
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--baseline-rows", type=int, default=2_000, help="rows inserted one by one")
+    args = parser.parse_args()
+
+    conninfo = make_conninfo(args.dsn, options=f"-c search_path={SCHEMA},public")
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        migrate(conninfo)
+        set_pool(create_pool(conninfo))
+        invalid = write_csv(path, args.rows)
+        print(f"file: {args.rows} rows ({invalid} invalid), {os.path.getsize(path) / 1e6:.1f} MB")
+
+        for label in ("import (inserts)", "re-import (updates)"):
+            summary = import_file(path)
+            rate = summary["rows"] / summary["seconds"]
+            print(f"{label:<20} {summary['seconds']:>8.2f} s  {rate:>10,.0f} rows/s  "
+                  f"inserted {summary['inserted']}  updated {summary['updated']}  rejected {summary['failed']}")
+
+        dao = BookDAO()
+        start = time.perf_counter()
+        for i in range(args.baseline_rows):
+            dao.add_book(f"Form Book {i}", "Author", "Science", f"FORM{i:09d}", "Description", None, None)
+        elapsed = time.perf_counter() - start
+        print(f"{'add_book per row':<20} {elapsed:>8.2f} s  {args.baseline_rows / elapsed:>10,.0f} rows/s  "
+              f"({args.baseline_rows} rows)")
+        # ru_maxrss is in kilobytes on Linux
+        print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    finally:
+        close_pool()
+        os.remove(path)
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# benchmarks/bench_login.py
+"""
+Login throughput under concurrency, per BCRYPT_WORKERS, and the cost of a brute-force run.
+
+Creates --users students in a throwaway "bench_login" schema, then for each
+--bcrypt-workers value starts `gunicorn app:app` (gthread workers) and has
+--clients threads log in with the right password while one bystander thread
+keeps loading the login page, showing how much hashing slows everything else.
+Finally one client guesses wrong passwords for a single user: once the limit is
+reached the attempts are refused (429) without hashing.
+
+    python -m benchmarks.bench_login --rounds 12 --clients 16 --bcrypt-workers 1 2 8 --seconds 15
+"""
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+import bcrypt
+import psycopg
+from psycopg.conninfo import make_conninfo
+from benchmarks.common import base_parser, summarize, free_port, wait_for
+from migrations import migrate
+
+SCHEMA = "bench_login"
+PASSWORD = "bench-password"
+FORM = {"Content-Type": "application/x-www-form-urlencoded"}
+
+def login(conn, username: str, password: str) -> tuple:
+    """Returns (status, Retry-After seconds or 0)."""
+    conn.request("POST", "/login", body=urlencode({"username": username, "password": password}), headers=FORM)
+    response = conn.getresponse()
+    response.read()
+    return response.status, int(response.getheader("Retry-After") or 0)
+
+def run_logins(port: int, users: int, clients: int, seconds: float) -> dict:
+    """
+    Clients log in (302 expected) until time is up, waiting Retry-After when turned
+    away as busy (503); a bystander times GET /login meanwhile.
+    """
+    latencies, bystander, statuses = [], [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(offset):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        turn = offset
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            status, retry_after = login(conn, f"bench_user_{turn % users}", PASSWORD)
+            with lock:
+                latencies.append((time.perf_counter() - begin) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+            if status == 503:
+                conn.close()  # reconnects on the next request; gunicorn drops idle keep-alives
+                time.sleep(retry_after)
+            else:
+                turn += clients
+        conn.close()
+
+    def watch():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            conn.request("GET", "/login")
+            conn.getresponse().read()
+            bystander.append((time.perf_counter() - begin) * 1000)
+            time.sleep(0.05)
+        conn.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)] + [threading.Thread(target=watch)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return {"logins_per_s": round(statuses.get(302, 0) / wall, 1), "statuses": statuses,
+            "latency": summarize(latencies), "bystander": summarize(bystander)}
+
+def run_brute_force(port: int, attempts: int) -> dict:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    statuses, latencies = {}, {}
+    for i in range(attempts):
+        begin = time.perf_counter()
+        status, _ = login(conn, "bench_user_0", f"guess-{i}")
+        statuses[status] = statuses.get(status, 0) + 1
+        latencies.setdefault(status, []).append((time.perf_counter() - begin) * 1000)
+    conn.close()
+    return {status: (count, summarize(latencies[status])["p50_ms"]) for status, count in statuses.items()}
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_ROUNDS")
+    parser.add_argument("--bcrypt-workers", type=int, nargs="+", default=[1, 2, 8])
+    parser.add_argument("--bcrypt-queue", type=int, default=None, help="BCRYPT_QUEUE (default: the app's)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=15)
+    args = parser.parse_args()
+
+    conninfo = make_conninfo(args.dsn, options=f"-c search_path={SCHEMA},public")
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    try:
+        migrate(conninfo)
+        hashed = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(args.rounds)).decode()
+        with psycopg.connect(conninfo) as conn:
+            with conn.cursor() as cursor:
+                cursor.executemany("INSERT INTO users (username, password, user_type) VALUES (%s, %s, 'Student')",
+                                   [(f"bench_user_{i}", hashed) for i in range(args.users)])
+        env = dict(os.environ, DATABASE_URL=conninfo, BCRYPT_ROUNDS=str(args.rounds),
+                   CACHE_INVALIDATION_LISTENER="0", REQUEST_LOG="0")
+        if args.bcrypt_queue is not None:
+            env["BCRYPT_QUEUE"] = str(args.bcrypt_queue)
+
+        for index, bcrypt_workers in enumerate(args.bcrypt_workers):
+            port = free_port()
+            server = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}",
+                                       "-w", str(args.workers), "-k", "gthread", "--threads", str(args.threads),
+                                       "--log-level", "warning"], env=dict(env, BCRYPT_WORKERS=str(bcrypt_workers)))
+            try:
+                wait_for(port)
+                result = run_logins(port, args.users, args.clients, args.seconds)
+                if index == len(args.bcrypt_workers) - 1:
+                    brute_force = run_brute_force(port, 20)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"BCRYPT_WORKERS={bcrypt_workers:<3} {result['logins_per_s']:>6} logins/s  "
+                  f"p50 {result['latency']['p50_ms']:>7.0f} ms p99 {result['latency']['p99_ms']:>7.0f} ms | "
+                  f"bystander GET /login p50 {result['bystander']['p50_ms']:>6.1f} ms "
+                  f"p99 {result['bystander']['p99_ms']:>6.1f} ms | responses {result['statuses']}")
+        print("brute force, 20 wrong passwords for one user (status: count, p50 ms):", brute_force)
+    finally:
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_pdf_download.py
+"""
+Concurrent PDF downloads through gunicorn, per PDF_DELIVERY_MODE.
+
+For each mode, starts `gunicorn app:app` with sync workers, then has --clients
+threads download a generated PDF: first whole files, then 256 KiB Range reads
+at random offsets (how in-browser readers fetch pages). Reports throughput,
+latency and the CPU time gunicorn spent. "flask" is the previous
+send_from_directory behaviour.
+
+    python -m benchmarks.bench_pdf_download --modes flask direct --size-mb 50 --clients 16
+"""
+import http.client
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from benchmarks.common import base_parser, summarize, free_port, wait_for, session_cookie
+
+FILENAME = "bench_download.pdf"
+RANGE_BYTES = 256 * 1024
+
+def run_clients(port: int, cookie: str, clients: int, requests: int, size: int, ranged: bool) -> dict:
+    """Each client makes requests sequential GETs on its own keep-alive connection."""
+    latencies, transferred, errors = [], [0], [0]
+    lock = threading.Lock()
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        for _ in range(requests):
+            headers = {"Cookie": cookie}
+            if ranged:
+                start = rng.randrange(0, size - RANGE_BYTES)
+                headers["Range"] = f"bytes={start}-{start + RANGE_BYTES - 1}"
+            begin = time.perf_counter()
+            conn.request("GET", f"/download/pdf/{FILENAME}", headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            elapsed = (time.perf_counter() - begin) * 1000
+            expected = (206, RANGE_BYTES) if ranged else (200, size)
+            with lock:
+                latencies.append(elapsed)
+                transferred[0] += len(body)
+                if (response.status, len(body)) != expected:
+                    errors[0] += 1
+        conn.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return {"wall_s": round(wall, 2), "mb_per_s": round(transferred[0] / wall / 1e6, 1),
+            "errors": errors[0], "latency": summarize(latencies)}
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--modes", nargs="+", default=["flask", "direct"])
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn sync workers")
+    parser.add_argument("--ranges", type=int, default=50, help="Range requests per client")
+    args = parser.parse_args()
+
+    from app import PDF_FOLDER
+    path = os.path.join(PDF_FOLDER, FILENAME)
+    size = args.size_mb * 1024 * 1024
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n" + os.urandom(size - 9))
+    cookie = session_cookie("Admin", "bench")
+
+    try:
+        for mode in args.modes:
+            port = free_port()
+            env = dict(os.environ, PDF_DELIVERY_MODE=mode, CACHE_INVALIDATION_LISTENER="0",
+                       REQUEST_LOG="0")
+            before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            server = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}",
+                                       "-w", str(args.workers), "--log-level", "warning"], env=env)
+            try:
+                wait_for(port)
+                full = run_clients(port, cookie, args.clients, max(1, args.repeat // 10), size, ranged=False)
+                ranged = run_clients(port, cookie, args.clients, args.ranges, size, ranged=True)
+            finally:
+                server.terminate()
+                server.wait()
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+            print(f"mode={mode:<7} full files: {full['mb_per_s']:>7} MB/s p50 {full['latency']['p50_ms']:>8.1f} ms "
+                  f"p95 {full['latency']['p95_ms']:>8.1f} ms | ranges: {ranged['mb_per_s']:>7} MB/s "
+                  f"p50 {ranged['latency']['p50_ms']:>6.1f} ms p95 {ranged['latency']['p95_ms']:>6.1f} ms | "
+                  f"server CPU {cpu:.2f} s | errors {full['errors'] + ranged['errors']}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_pdf_index.py
+"""
+PDF text indexing throughput per worker count, incremental re-runs and in-book
+search latency.
+
+Generates --books text PDFs of --pages pages in PDF_FOLDER, referenced by books
+in a throwaway "bench_pdf_index" schema, then indexes them with 1 worker and
+with --workers workers (forced), runs the incremental pass (nothing changed)
+and times PdfIndexDAO.search_pages.
+
+    python -m benchmarks.bench_pdf_index --books 40 --pages 200 --workers 4
+"""
+import os
+import random
+import resource
+import time
+import psycopg
+from psycopg.conninfo import make_conninfo
+from benchmarks.common import base_parser, time_calls
+from blob_store import PDF_FOLDER
+from dao.db import create_pool, set_pool, close_pool, get_connection
+from dao.pdf_index_dao import PdfIndexDAO
+from migrations import migrate
+from pdf_indexer import index_pdfs
+
+SCHEMA = "bench_pdf_index"
+WORDS = ("library catalogue reader chapter archive manuscript index volume margin binding shelf "
+         "author preface glossary appendix folio edition printing paper ink lantern harbour").split()
+
+def write_text_pdf(path: str, pages: int, rng: random.Random) -> None:
+    """A minimal PDF whose pages hold lines of random words in Helvetica."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(40)]
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td {text}ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--books", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    conninfo = make_conninfo(args.dsn, options=f"-c search_path={SCHEMA},public")
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    rng = random.Random(7)
+    names = [f"bench_index_{i}.pdf" for i in range(args.books)]
+    try:
+        migrate(conninfo)
+        set_pool(create_pool(conninfo))
+        for name in names:
+            write_text_pdf(os.path.join(PDF_FOLDER, name), args.pages, rng)
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.executemany("INSERT INTO books (title, author, isbn, pdf_file) VALUES (%s, 'Bench', %s, %s)",
+                                   [(f"Indexed Book {i}", f"IDX{i:06d}", name) for i, name in enumerate(names)])
+        size = sum(os.path.getsize(os.path.join(PDF_FOLDER, name)) for name in names) / 1e6
+        print(f"{args.books} PDFs x {args.pages} pages, {size:.1f} MB")
+
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            summary = index_pdfs(force=True, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"workers={workers:<3} {elapsed:>7.2f} s  {summary['pages'] / elapsed:>8,.0f} pages/s  "
+                  f"indexed {summary['indexed']} failed {summary['failed']}")
+
+        start = time.perf_counter()
+        summary = index_pdfs(workers=args.workers)
+        print(f"incremental re-run {time.perf_counter() - start:>7.3f} s  unchanged {summary['unchanged']}")
+
+        dao = PdfIndexDAO()
+        for query in ("manuscript lantern", '"harbour ink"', "glossary -appendix"):
+            stats = time_calls(lambda: dao.search_pages(query), args.repeat)
+            print(f"search {query!r:<24} p50 {stats['p50_ms']:>7.2f} ms  p95 {stats['p95_ms']:>7.2f} ms  "
+                  f"books {len(dao.search_pages(query))}")
+        print(f"peak RSS (this process): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB, "
+              f"(largest worker): {resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024:.0f} MB")
+    finally:
+        close_pool()
+        for name in names:
+            if os.path.exists(os.path.join(PDF_FOLDER, name)):
+                os.remove(os.path.join(PDF_FOLDER, name))
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_search.py
+"""
+Compares the old ILIKE catalog search with the full-text (tsvector + GIN) search.
+
+Builds a throwaway copy of the books table in the "bench_search" schema at each
+requested size, so the real catalog is never touched:
+
+    python -m benchmarks.bench_search --sizes 10000 100000 1000000
+"""
+import json
+import psycopg
+from dao.book_dao import build_prefix_query
+from benchmarks.common import base_parser, time_calls
+
+WORDS = ["history", "galaxy", "garden", "murder", "quantum", "empire", "river", "shadow",
+         "machine", "learning", "ocean", "dragon", "silent", "winter", "network", "kingdom",
+         "secret", "journey", "python", "revolution", "memory", "storm", "island", "theory"]
+
+KEYWORDS = ["revolution", "quantum mach", "dragon", "zzzz-no-match"]
+
+SCHEMA_SQL = """
+    DROP SCHEMA IF EXISTS bench_search CASCADE;
+    CREATE SCHEMA bench_search;
+    CREATE TABLE bench_search.books (
+        id SERIAL PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        author VARCHAR(255) NOT NULL,
+        isbn VARCHAR(50) UNIQUE NOT NULL,
+        is_available BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        category VARCHAR(100),
+        description TEXT,
+        search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(isbn, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'C')
+        ) STORED
+    );
+"""
+
+FILL_SQL = """
+    SELECT setseed(0.42);
+    INSERT INTO bench_search.books (title, author, isbn, description, created_at)
+    SELECT w[1 + (random() * (n - 1))::int] || ' ' || w[1 + (random() * (n - 1))::int] || ' ' || i,
+           'Author ' || w[1 + (random() * (n - 1))::int],
+           'BENCH' || i,
+           repeat(w[1 + (random() * (n - 1))::int] || ' ', 12),
+           now() - (i || ' minutes')::interval
+    FROM generate_series(1, %s) i,
+         (SELECT %s::text[] AS w, cardinality(%s::text[]) AS n) words;
+    CREATE INDEX ON bench_search.books USING GIN (search_vector);
+    CREATE INDEX ON bench_search.books (created_at DESC);
+    ANALYZE bench_search.books;
+"""
+
+ILIKE_SQL = """
+    SELECT id, title FROM bench_search.books
+    WHERE title ILIKE %s OR author ILIKE %s
+    ORDER BY created_at DESC
+"""
+
+FTS_SQL = """
+    SELECT id, title FROM bench_search.books, to_tsquery('english', %s) query
+    WHERE search_vector @@ query
+    ORDER BY ts_rank_cd(search_vector, query) DESC, created_at DESC
+"""
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    results = []
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        for size in args.sizes:
+            conn.execute(SCHEMA_SQL)
+            with conn.cursor() as cur:
+                for statement in FILL_SQL.split(";"):
+                    if statement.strip():
+                        cur.execute(statement, (size, WORDS, WORDS) if "%s" in statement else None)
+            for keyword in KEYWORDS:
+                like = f"%{keyword}%"
+                ilike = time_calls(lambda: conn.execute(ILIKE_SQL, (like, like)).fetchall(), args.repeat)
+                fts = time_calls(lambda: conn.execute(FTS_SQL, (build_prefix_query(keyword) or "",)).fetchall(), args.repeat)
+                results.append({"rows": size, "keyword": keyword, "ilike": ilike, "fulltext": fts})
+                print(f"{size:>9} rows  {keyword!r:<16} ILIKE p50 {ilike['p50_ms']:>9.2f} ms   "
+                      f"full-text p50 {fts['p50_ms']:>9.2f} ms")
+        conn.execute("DROP SCHEMA IF EXISTS bench_search CASCADE")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
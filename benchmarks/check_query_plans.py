@@ -0,0 +1,181 @@
+# benchmarks/check_query_plans.py
+"""
+EXPLAIN-based regression check for the hot query paths.
+
+Applies the migrations to a throwaway "bench_plans" schema, seeds it with a large
+catalog and loan history (mostly returned loans, a small share open / overdue),
+archives the old loans as loan_archive.py does in production, runs ANALYZE and
+fails (exit 1) if the plan of any hot query contains a sequential scan on books or
+(a partition of) transactions. The real tables are never touched.
+
+    python -m benchmarks.check_query_plans --books 200000 --transactions 500000
+"""
+import json
+import re
+import sys
+import psycopg
+from psycopg.conninfo import make_conninfo
+from benchmarks.common import base_parser
+from dao.book_dao import BOOK_SOURCE, on_shelf
+from loan_archive import archive_loans
+from migrations import migrate
+
+SCHEMA = "bench_plans"
+CHECKED_TABLES = {"books", "transactions"}
+PARTITION_SUFFIX = re.compile(r"_y\d{4}m\d{2}$")
+CATEGORIES = ["Technology", "Mystery", "Romance", "Science", "History", "Fantasy", "Biography", "Poetry"]
+
+FILL_SQL = [
+    """
+    INSERT INTO users (username, password, user_type, email)
+    SELECT 'student' || i, 'x', 'Student', 'student' || i || '@example.com'
+    FROM generate_series(1, %(students)s) i
+    """,
+    """
+    INSERT INTO books (title, author, isbn, category, description, pdf_file, copies_total, created_at)
+    SELECT 'Book ' || i, 'Author ' || (i %% 5000), 'PLAN' || i, (%(categories)s::text[])[1 + i %% %(n_categories)s],
+           'Description of book ' || i, 'book' || i || '.pdf', 1 + i %% 3, now() - (i || ' minutes')::interval
+    FROM generate_series(1, %(books)s) i
+    """,
+    # Every tenth book has all its copies out
+    """
+    INSERT INTO book_copies (book_id, copy_no, status)
+    SELECT b.id, n, CASE WHEN b.id %% 10 <> 0 THEN 'shelf' ELSE 'loaned' END
+    FROM books b, generate_series(1, b.copies_total) n
+    """,
+    "SELECT library_create_partitions('transactions', CURRENT_DATE - 3650, CURRENT_DATE)",
+    # ~98% returned history over ten years; the open 2% were borrowed in the last
+    # 16 days, so about one in sixteen open loans is overdue
+    """
+    INSERT INTO transactions (book_id, student_username, borrow_date, return_date, is_returned)
+    SELECT 1 + (i::bigint * 7919) %% %(books)s, 'student' || (1 + i %% %(students)s),
+           borrowed, borrowed + 14, NOT is_open
+    FROM generate_series(1, %(transactions)s) i,
+         LATERAL (SELECT i %% 50 = 0 AS is_open) o,
+         LATERAL (SELECT CURRENT_DATE - CASE WHEN is_open THEN (i / 50) %% 16 ELSE i %% 3650 END AS borrowed) d
+    ON CONFLICT DO NOTHING
+    """,
+]
+
+# The statements below mirror the SQL issued by the DAOs: name -> (sql, params, tables that must not be seq-scanned)
+HOT_QUERIES = {
+    "get_student_transactions": ("""
+        SELECT t.*, b.title, b.pdf_file, b.cover_image
+        FROM transactions t JOIN books b ON t.book_id=b.id
+        WHERE t.student_username=%s
+        ORDER BY t.borrow_date DESC
+    """, ("student42",), CHECKED_TABLES),
+    "get_student_transactions[archive]": ("""
+        SELECT t.*, b.title, b.pdf_file, b.cover_image
+        FROM transactions_all t JOIN books b ON t.book_id=b.id
+        WHERE t.student_username=%s
+        ORDER BY t.borrow_date DESC
+    """, ("student42",), CHECKED_TABLES | {"transactions_archive"}),
+    # Batch report: the open-loan partial index must drive it, but once thousands of loans
+    # qualify, hashing books in one pass is cheaper than a probe per loan
+    "get_overdue_transactions": ("""
+        SELECT t.*, b.title, u.email, u.username as student_username
+        FROM transactions t
+        JOIN books b ON t.book_id=b.id
+        JOIN users u ON t.student_username=u.username
+        WHERE t.is_returned=FALSE AND t.return_date < CURRENT_DATE
+        ORDER BY t.return_date ASC
+    """, (), {"transactions"}),
+    "get_recent_transactions": ("""
+        SELECT t.*, b.title, u.email
+        FROM transactions t
+        JOIN books b ON t.book_id = b.id
+        JOIN users u ON t.student_username = u.username
+        ORDER BY t.borrow_date DESC, t.id DESC
+        LIMIT 10
+    """, (), CHECKED_TABLES),
+    "check_borrow_status": ("""
+        SELECT 1
+        FROM transactions t JOIN books b ON t.book_id=b.id
+        WHERE b.pdf_file=%s AND t.student_username=%s AND t.is_returned=FALSE
+    """, ("book4242.pdf", "student42"), CHECKED_TABLES),
+    "return_book": ("""
+        SELECT id FROM transactions
+        WHERE book_id=%s AND student_username=%s AND is_returned=FALSE
+    """, (4242, "student42"), CHECKED_TABLES),
+    "active_loan_count": ("""
+        SELECT count(*) FROM transactions WHERE student_username=%s AND is_returned=FALSE
+    """, ("student42",), CHECKED_TABLES),
+    "catalog_page_by_category": ("""
+        SELECT * FROM (SELECT id, title, created_at AS sort_key FROM books WHERE TRUE AND category=%s) page
+        ORDER BY sort_key DESC, id DESC LIMIT 25
+    """, ("Science",), CHECKED_TABLES),
+    "catalog_page_available": (f"""
+        SELECT * FROM (SELECT id, title, copies_available, created_at AS sort_key FROM {BOOK_SOURCE}
+                       WHERE TRUE AND {on_shelf()}) page
+        ORDER BY sort_key DESC, id DESC LIMIT 25
+    """, (), CHECKED_TABLES | {"book_copies"}),
+    # library_borrow claiming a copy
+    "claim_copy": ("""
+        SELECT copy_no FROM book_copies WHERE book_id = %s AND status = 'shelf' LIMIT 1 FOR UPDATE SKIP LOCKED
+    """, (4241,), {"book_copies"}),
+    "search_books_fulltext": ("""
+        SELECT id, title FROM books, to_tsquery('english', %s) query
+        WHERE search_vector @@ query AND category=%s
+        ORDER BY ts_rank_cd(search_vector, query) DESC, created_at DESC
+    """, ("4242:*", "Science"), CHECKED_TABLES),
+}
+
+def seq_scans(plan: dict, tables: set, empty: set) -> list:
+    """
+    Returns the given tables that the plan (or any sub-plan) reads with a Seq Scan, partitions
+    included. Empty relations (e.g. the partitions of the coming months) are read that way for free.
+    """
+    found = []
+    if (plan.get("Node Type") == "Seq Scan" and plan["Relation Name"] not in empty
+            and PARTITION_SUFFIX.sub("", plan["Relation Name"]) in tables):
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child, tables, empty))
+    return found
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--transactions", type=int, default=500_000)
+    parser.add_argument("--students", type=int, default=5_000)
+    args = parser.parse_args()
+
+    conninfo = make_conninfo(args.dsn, options=f"-c search_path={SCHEMA},public")
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+
+    failures = []
+    try:
+        migrate(conninfo)
+        with psycopg.connect(conninfo, autocommit=True) as conn:
+            params = {"books": args.books, "transactions": args.transactions, "students": args.students,
+                      "categories": CATEGORIES, "n_categories": len(CATEGORIES)}
+            for statement in FILL_SQL:
+                conn.execute(statement, params)
+        archive_loans(conninfo)
+        with psycopg.connect(conninfo, autocommit=True) as conn:
+            conn.execute("ANALYZE")
+            empty = {row[0] for row in conn.execute("""
+                SELECT relname FROM pg_class WHERE relnamespace = %s::regnamespace AND relkind = 'r' AND relpages = 0
+            """, (SCHEMA,))}
+
+            for name, (sql, query_params, tables) in HOT_QUERIES.items():
+                plan = conn.execute(f"EXPLAIN (FORMAT JSON) {sql}", query_params).fetchone()[0][0]["Plan"]
+                scanned = seq_scans(plan, tables, empty)
+                status = "FAIL" if scanned else "ok"
+                print(f"{status:<4} {name:<34} {plan['Node Type']:<16} cost {plan['Total Cost']:>12.2f}"
+                      + (f"  seq scan on {', '.join(scanned)}" if scanned else ""))
+                if scanned:
+                    failures.append(name)
+                    print(json.dumps(plan, indent=2))
+    finally:
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+    print(f"FAIL: sequential scans in {', '.join(failures)}" if failures else "PASS: no hot query seq-scans")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/common.py
+import argparse
+import os
+import socket
+import socketserver
+import statistics
+import threading
+import time
+
+def base_parser(description: str) -> argparse.ArgumentParser:
+    """Argument parser with the options every benchmark script shares."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"),
+                        help="Postgres connection string (defaults to $DATABASE_URL)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per measurement")
+    return parser
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(samples_ms: list) -> dict:
+    """Summary statistics (milliseconds) for a list of latencies."""
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "max_ms": round(max(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+def time_calls(fn, repeat: int, warmup: int = 2) -> dict:
+    """Calls fn() warmup + repeat times and summarizes the timed runs."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+# ----- Benchmarks against a running gunicorn -----
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(port: int, timeout: float = 15) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+def session_cookie(user_type: str, username: str) -> str:
+    """A signed session cookie for a logged-in user, made with the app's own secret key."""
+    from app import app
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_type': user_type, 'username': username})}"
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    A local stand-in SMTP server that accepts and discards every message, counting
+    them, for running the overdue job without a mail provider (SMTP_USE_TLS=0).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPSinkHandler)
+        self.port = self.server_address[1]
+        self.messages = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(b"220 sink\r\n")
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            if command == b"DATA":
+                self.wfile.write(b"354 go ahead\r\n")
+                for data in self.rfile:
+                    if data == b".\r\n":
+                        break
+                with self.server.lock:
+                    self.server.messages += 1
+            self.wfile.write(b"250 ok\r\n")
@@ -0,0 +1,101 @@
+# benchmarks/compare.py
+"""
+Compares two benchmarks/suite.py result files and flags regressions.
+
+A metric regresses when it got worse than the baseline by more than
+--threshold (a fraction: 0.15 = 15%) and, for latencies, by at least --min-ms
+milliseconds, so sub-millisecond jitter on fast calls is not reported. An
+endpoint that starts answering with errors always regresses. Exits with status
+1 if anything regressed, so it can gate a CI job:
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+import sys
+
+LATENCIES = ("p50_ms", "p95_ms", "p99_ms")
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def metrics(result: dict) -> dict:
+    """Flattens a result into {name: (value, higher_is_better)}."""
+    flat = {}
+    for name, summary in result.get("dao", {}).items():
+        for key in ("p50_ms", "p95_ms"):
+            flat[f"dao {name} {key}"] = (summary[key], False)
+    for name, job in result.get("jobs", {}).items():
+        flat[f"job {name} seconds"] = (job["seconds"], False)
+    http = result.get("http")
+    if http:
+        # Per-endpoint rates follow the random scenario draw; only the total rate is compared
+        flat["http all req_per_s"] = (http["req_per_s"], True)
+        for name, endpoint in http["endpoints"].items():
+            if not endpoint["count"]:
+                continue
+            for key in LATENCIES:
+                flat[f"http {name} {key}"] = (endpoint[key], False)
+            flat[f"http {name} errors"] = (endpoint["errors"], False)
+    return flat
+
+def compare(baseline: dict, current: dict, threshold: float = 0.15, min_ms: float = 1.0) -> list:
+    """
+    Rows (name, baseline value, current value, relative change, verdict) for every
+    metric present in both runs; verdict is "regression", "improvement" or "".
+    """
+    old, new = metrics(baseline), metrics(current)
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        (before, higher_is_better), (after, _) = old[name], new[name]
+        change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+        worse = -change if higher_is_better else change
+        if name.endswith(" errors"):
+            verdict = "regression" if after > before else ""
+        elif name.endswith("_ms") and abs(after - before) < min_ms:
+            verdict = ""
+        elif worse > threshold:
+            verdict = "regression"
+        elif worse < -threshold:
+            verdict = "improvement"
+        else:
+            verdict = ""
+        rows.append((name, before, after, change, verdict))
+    return rows
+
+def same_setup(baseline: dict, current: dict) -> list:
+    """The meta settings (scale, server, clients) that differ between the runs."""
+    old, new = baseline.get("meta", {}), current.get("meta", {})
+    return [key for key in ("scale", "settings", "cpus") if old.get(key) != new.get(key)]
+
+def report(baseline: dict, current: dict, threshold: float = 0.15, min_ms: float = 1.0,
+           verbose: bool = False) -> int:
+    """Prints the comparison and returns the number of regressions."""
+    for key in same_setup(baseline, current):
+        print(f"warning: runs differ in {key}: {baseline['meta'].get(key)} vs {current['meta'].get(key)}")
+    rows = compare(baseline, current, threshold, min_ms)
+    for name, before, after, change, verdict in rows:
+        if verdict or verbose:
+            print(f"{verdict.upper():<12} {name:<70} {before:>11.2f} -> {after:>11.2f}  ({change:+.0%})")
+    regressions = sum(1 for row in rows if row[4] == "regression")
+    print(f"{len(rows)} metrics compared, {regressions} regressions, "
+          f"{sum(1 for row in rows if row[4] == 'improvement')} improvements (threshold {threshold:.0%})")
+    return regressions
+
+def add_compare_arguments(parser) -> None:
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change that counts (0.15 = 15%%)")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore latency changes smaller than this")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--verbose", action="store_true", help="also list unchanged metrics")
+    add_compare_arguments(parser)
+    args = parser.parse_args()
+    regressions = report(load(args.baseline), load(args.current), args.threshold, args.min_ms, args.verbose)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
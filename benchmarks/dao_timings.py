@@ -0,0 +1,163 @@
+# benchmarks/dao_timings.py
+"""
+Micro-benchmarks of the DAO methods against a seeded schema, for benchmarks/suite.py.
+
+Each measurement calls one method (or a write with the call that undoes it,
+e.g. borrow_book + return_book) `repeat` times through the shared pools and
+summarizes the latencies. Reads go through the uncached BookDAO (and
+use_cache=False where a method has it), so they time the database rather than
+the in-process caches; CachedBookDAO is timed separately on a warm cache. The
+bulk paths (BookDAO.import_batch, UserDAO.import_users, PdfIndexDAO.replace_pages)
+have their own benchmarks: bench_import.py and bench_pdf_index.py.
+"""
+import itertools
+import psycopg
+from benchmarks.common import time_calls
+from benchmarks.seed import SEED_PASSWORD
+from dao.async_db import create_async_pool, set_async_pool, close_async_pool, run_db
+from dao.book_dao import BookDAO, CachedBookDAO, on_shelf
+from dao.db import create_pool, set_pool, close_pool
+from dao.hold_dao import HoldDAO
+from dao.login_throttle_dao import LoginThrottleDAO, user_key, ip_key
+from dao.notification_dao import NotificationDAO
+from dao.pdf_index_dao import PdfIndexDAO
+from dao.stats_dao import StatsDAO
+from dao.transaction_dao import TransactionDAO
+from dao.user_dao import UserDAO
+
+def pick_fixtures(conninfo: str, repeat: int) -> dict:
+    """
+    Rows the measurements work on: the student with most loans (archived ones
+    included), a student without open loans, free books (a fresh one per borrow: a
+    book returned today cannot be borrowed again), a book with every copy out, a PDF
+    and the largest category.
+    """
+    with psycopg.connect(conninfo) as conn:
+        busiest = conn.execute("""
+            SELECT student_username FROM transactions_all GROUP BY student_username ORDER BY count(*) DESC LIMIT 1
+        """).fetchone()[0]
+        free_books = [row[0] for row in conn.execute(f"""
+            SELECT id FROM books WHERE {on_shelf()} AND pdf_file IS NULL ORDER BY id DESC LIMIT %s
+        """, (repeat + 3,))]
+        lent_out = conn.execute(f"SELECT id FROM books WHERE NOT {on_shelf()} ORDER BY id LIMIT 1").fetchone()[0]
+        idle_student = conn.execute("""
+            SELECT username FROM users u WHERE user_type = 'Student' AND NOT EXISTS (
+                SELECT 1 FROM transactions t WHERE t.student_username = u.username AND NOT t.is_returned)
+            ORDER BY username DESC LIMIT 1
+        """).fetchone()[0]
+        pdf_file = conn.execute("SELECT pdf_file FROM books WHERE pdf_file IS NOT NULL LIMIT 1").fetchone()[0]
+        category = conn.execute("SELECT category FROM books GROUP BY category ORDER BY count(*) DESC LIMIT 1"
+                                ).fetchone()[0]
+    return {"busiest": busiest, "free_books": free_books, "lent_out": lent_out, "idle_student": idle_student,
+            "pdf_file": pdf_file, "category": category}
+
+def measurements(fixtures: dict) -> dict:
+    """Name -> zero-argument callable."""
+    books, cached = BookDAO(), CachedBookDAO()
+    transactions, users, stats = TransactionDAO(), UserDAO(), StatsDAO()
+    notifications, pdf_index, throttle = NotificationDAO(), PdfIndexDAO(), LoginThrottleDAO()
+    holds = HoldDAO()
+    busiest, idle = fixtures["busiest"], fixtures["idle_student"]
+    free_book, borrowable = fixtures["free_books"][0], iter(fixtures["free_books"][1:])
+    free_copies, lent_out = books.get_book(free_book)["copies_total"], fixtures["lent_out"]
+    category, pdf_file = fixtures["category"], fixtures["pdf_file"]
+    serial = itertools.count()
+    next_page = books.get_books_page()["next_cursor"]
+
+    def add_and_delete_book():
+        isbn = f"DAO-TIMING-{next(serial)}"
+        books.add_book("Timing", "Benchmark", category, isbn, None, None, None)
+        with psycopg.connect(fixtures["conninfo"]) as conn:
+            book_id = conn.execute("SELECT id FROM books WHERE isbn=%s", (isbn,)).fetchone()[0]
+        books.delete_book(book_id)
+
+    def add_and_delete_user():
+        username = f"dao_timing_{next(serial)}"
+        users.add_user(username, SEED_PASSWORD)
+        users.delete_user(username)
+
+    def update_book():
+        book = books.get_book(free_book)
+        books.update_book(free_book, book["title"], book["author"], book["category"], book["isbn"],
+                          book["description"], book["cover_image"], book["pdf_file"])
+
+    def borrow_and_return():
+        book_id = next(borrowable)
+        transactions.borrow_book(book_id, idle)
+        transactions.return_book(book_id, idle)
+
+    def hold_and_cancel():
+        holds.place_hold(lent_out, idle)
+        holds.cancel_hold(lent_out, idle)
+
+    def failure_and_clear():
+        throttle.record_failure([user_key(idle), ip_key("127.0.0.1")])
+        throttle.clear(user_key(idle))
+        throttle.clear(ip_key("127.0.0.1"))
+
+    cached.get_books_page()
+    return {
+        "BookDAO.get_book": lambda: books.get_book(free_book),
+        "BookDAO.get_all_books": books.get_all_books,
+        "BookDAO.iter_books": lambda: sum(1 for _ in books.iter_books(category=category)),
+        "BookDAO.search_books[keyword]": lambda: books.search_books("history"),
+        "BookDAO.search_books[category,available]": lambda: books.search_books(None, category, True),
+        "BookDAO.get_books_page[newest]": books.get_books_page,
+        "BookDAO.get_books_page[next]": lambda: books.get_books_page(cursor=next_page),
+        "BookDAO.get_books_page[keyword]": lambda: books.get_books_page("quantum machine"),
+        "BookDAO.get_books_page[category,available]": lambda: books.get_books_page(None, category, True),
+        "BookDAO.get_books_page_async[keyword]": lambda: run_db(books.get_books_page_async("quantum machine")),
+        "CachedBookDAO.get_books_page[warm]": cached.get_books_page,
+        "BookDAO.is_file_referenced": lambda: books.is_file_referenced("pdf_file", pdf_file),
+        "BookDAO.iter_file_references": lambda: sum(1 for _ in books.iter_file_references("pdf_file")),
+        "BookDAO.set_copies": lambda: books.set_copies(free_book, free_copies),
+        "BookDAO.update_book": update_book,
+        "BookDAO.add_book+delete_book": add_and_delete_book,
+        "TransactionDAO.borrow_book+return_book": borrow_and_return,
+        "TransactionDAO.get_all_transactions": transactions.get_all_transactions,
+        "TransactionDAO.iter_transactions[overdue]": lambda: sum(1 for _ in transactions.iter_transactions(
+            status="overdue")),
+        "TransactionDAO.get_recent_transactions": transactions.get_recent_transactions,
+        "TransactionDAO.get_student_transactions": lambda: transactions.get_student_transactions(busiest),
+        "TransactionDAO.get_student_transactions_async": lambda: run_db(
+            transactions.get_student_transactions_async(busiest)),
+        "TransactionDAO.get_student_transactions[archive]": lambda: transactions.get_student_transactions(
+            busiest, include_archive=True),
+        "TransactionDAO.get_overdue_transactions": transactions.get_overdue_transactions,
+        "TransactionDAO.check_borrow_status": lambda: transactions.check_borrow_status(pdf_file, busiest,
+                                                                                       use_cache=False),
+        "TransactionDAO.create_partitions": transactions.create_partitions,
+        "HoldDAO.place_hold+cancel_hold": hold_and_cancel,
+        "HoldDAO.get_student_holds": lambda: holds.get_student_holds(idle),
+        "HoldDAO.expire_holds": holds.expire_holds,
+        "StatsDAO.get_dashboard_stats": lambda: stats.get_dashboard_stats(use_cache=False),
+        "StatsDAO.get_dashboard_stats_async": lambda: run_db(stats.get_dashboard_stats_async(use_cache=False)),
+        "UserDAO.authenticate": lambda: users.authenticate(busiest, SEED_PASSWORD),
+        "UserDAO.get_all_students": users.get_all_students,
+        "UserDAO.iter_students": lambda: sum(1 for _ in users.iter_students()),
+        "UserDAO.add_user+delete_user": add_and_delete_user,
+        "NotificationDAO.get_pending_overdue": notifications.get_pending_overdue,
+        "NotificationDAO.get_delivery_summary": notifications.get_delivery_summary,
+        "PdfIndexDAO.get_index_state": pdf_index.get_index_state,
+        "PdfIndexDAO.get_stats": pdf_index.get_stats,
+        "PdfIndexDAO.search_pages": lambda: pdf_index.search_pages("history"),
+        "LoginThrottleDAO.retry_after": lambda: throttle.retry_after({user_key(busiest): 5, ip_key("127.0.0.1"): 50}),
+        "LoginThrottleDAO.record_failure+clear": failure_and_clear,
+    }
+
+def run_dao_timings(conninfo: str, repeat: int, only: list = None) -> dict:
+    """Times every measurement (or those whose name contains one of `only`); name -> latency summary."""
+    set_pool(create_pool(conninfo))
+    set_async_pool(create_async_pool(conninfo))
+    try:
+        fixtures = dict(pick_fixtures(conninfo, repeat), conninfo=conninfo)
+        results = {}
+        for name, fn in measurements(fixtures).items():
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = time_calls(fn, repeat)
+            print(f"  {name:<50} p50 {results[name]['p50_ms']:>9.2f} ms  p95 {results[name]['p95_ms']:>9.2f} ms")
+        return results
+    finally:
+        close_async_pool()
+        close_pool()
@@ -0,0 +1,69 @@
+# benchmarks/seed.py
+"""
+A throwaway schema of synthetic library data for the benchmarks.
+
+Drops and recreates --schema, applies the migrations and fills it with
+datagen.py: students student_<n> and one admin (ADMIN_USERNAME), all with
+SEED_PASSWORD, and --pdf-files dummy PDFs in the blob store. Returned loans
+older than ARCHIVE_AFTER_MONTHS are then archived by loan_archive.py, as in
+production. The same --seed and scale give the same rows.
+
+Used by benchmarks/suite.py; on its own it leaves the schema in place to poke at:
+
+    python -m benchmarks.seed --schema bench_suite --books 100000 --students 5000 --years 5
+"""
+import time
+import psycopg
+from psycopg.conninfo import make_conninfo
+from benchmarks.common import base_parser
+from datagen import add_arguments, generate, generate_options, admin_name
+from loan_archive import archive_loans
+from migrations import migrate
+
+SEED_PASSWORD = "seed-password"
+ADMIN_USERNAME = admin_name("", 1)
+
+def schema_conninfo(dsn: str, schema: str) -> str:
+    """Connection string whose sessions resolve unqualified tables in schema."""
+    return make_conninfo(dsn, options=f"-c search_path={schema},public")
+
+def drop_schema(dsn: str, schema: str) -> None:
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+
+def seed(dsn: str, schema: str, **options) -> dict:
+    """
+    Builds the schema with datagen.generate(**options), archives the old loans and
+    returns the summary (rows, files, seconds, archive) with the schema's "conninfo".
+    """
+    drop_schema(dsn, schema)
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {schema}")
+    conninfo = schema_conninfo(dsn, schema)
+    migrate(conninfo)
+    result = generate(conninfo, prefix="", password=SEED_PASSWORD, **options)
+    start = time.perf_counter()
+    result["archive"] = archive_loans(conninfo)
+    result["seconds"]["archive"] = round(time.perf_counter() - start, 2)
+    return dict(result, conninfo=conninfo)
+
+def add_scale_arguments(parser) -> None:
+    """The datagen options, with a scale that seeds in seconds (shared with benchmarks/suite.py)."""
+    add_arguments(parser)
+    parser.set_defaults(books=10_000, students=1_000, pdf_files=8)
+
+def scale_options(args) -> dict:
+    return generate_options(args)
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--schema", default="bench_suite")
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    result = seed(args.dsn, args.schema, **scale_options(args))
+    print(f"seeded schema {args.schema} in {result['seconds']['total']} s: {result['rows']}, "
+          f"archived {result['archive']['loans_archived']} loans in {result['seconds']['archive']} s")
+    print(f"DATABASE_URL={result['conninfo']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# benchmarks/stress_borrow.py
+"""
+Concurrency stress check for borrowing one popular title with several copies.
+
+Creates one fresh book with --copies copies and N throwaway students, then runs
+four rounds, each releasing its threads at once:
+
+1. borrow   all N students borrow the book: exactly --copies must win, the rest
+            get "unavailable", and no copy may be left on the shelf (no lost update)
+2. hold     the losers place holds: every one is queued once
+3. return   the winners return their copies: each goes to the oldest waiting
+            hold, none back to the shelf
+4. collect  the students whose hold is ready borrow their copy
+
+A monitor samples pg_stat_activity meanwhile and reports the most sessions ever
+waiting on a lock at once, to show whether borrowers pile up behind one row lock
+(they claim separate copy rows, see migrations.py). Exits non-zero if any check fails.
+
+    python -m benchmarks.stress_borrow --students 300 --copies 30
+"""
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+import psycopg
+from benchmarks.common import base_parser, summarize
+from dao.db import create_pool, set_pool, get_connection
+from dao.hold_dao import HoldDAO, HOLD_OK
+from dao.transaction_dao import TransactionDAO, BORROW_OK, BORROW_UNAVAILABLE
+
+class LockMonitor:
+    """Samples the number of sessions waiting on a lock every `interval` seconds, in a thread."""
+
+    def __init__(self, dsn: str, interval: float = 0.005):
+        self.conn = psycopg.connect(dsn, autocommit=True)
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            waiting = self.conn.execute("""
+                SELECT count(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND wait_event_type = 'Lock'
+            """).fetchone()[0]
+            self.peak = max(self.peak, waiting)
+            time.sleep(self.interval)
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.thread.join()
+        self.conn.close()
+        return self.peak
+
+def storm(action, usernames: list) -> tuple:
+    """Calls action(username) from one thread per username, all released at once; (outcomes, latency summary)."""
+    barrier = threading.Barrier(len(usernames))
+    outcomes, latencies = [], []
+    lock = threading.Lock()
+
+    def worker(username):
+        barrier.wait()
+        start = time.perf_counter()
+        outcome = action(username)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            outcomes.append((username, outcome))
+            latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(u,)) for u in usernames]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes, summarize(latencies)
+
+def book_state(book_id: int) -> dict:
+    with get_connection() as conn:
+        return conn.execute("""
+            SELECT b.copies_total,
+                   (SELECT count(*) FROM book_copies c WHERE c.book_id = b.id AND c.status = 'shelf') AS on_shelf,
+                   (SELECT count(*) FROM book_copies c WHERE c.book_id = b.id AND c.status = 'loaned') AS loaned,
+                   (SELECT count(*) FROM book_copies c WHERE c.book_id = b.id AND c.status = 'held') AS held,
+                   (SELECT count(*) FROM transactions t WHERE t.book_id = b.id AND NOT t.is_returned) AS open_loans,
+                   (SELECT count(*) FROM holds h WHERE h.book_id = b.id AND h.status = 'waiting') AS waiting,
+                   (SELECT count(*) FROM holds h WHERE h.book_id = b.id AND h.status = 'ready') AS ready
+            FROM books b WHERE b.id = %s
+        """, (book_id,)).fetchone()
+
+def main():
+    parser = base_parser(__doc__)
+    parser.add_argument("--students", type=int, default=300, help="simultaneous borrowers")
+    parser.add_argument("--copies", type=int, default=30, help="copies of the contended book")
+    parser.add_argument("--pool-size", type=int, default=50, help="max DB connections used by the threads")
+    args = parser.parse_args()
+    if not 0 < args.copies < args.students:
+        parser.error("--copies must be between 1 and --students - 1")
+
+    set_pool(create_pool(args.dsn, min_size=args.pool_size, max_size=args.pool_size, timeout=60))
+    tag = uuid.uuid4().hex[:8]
+    usernames = [f"stress_{tag}_{i}" for i in range(args.students)]
+    with get_connection() as conn:
+        book_id = conn.execute("""
+            INSERT INTO books (title, author, isbn, copies_total)
+            VALUES (%s, 'Stress Test', %s, %s) RETURNING id
+        """, (f"Stress {tag}", f"STRESS-{tag}", args.copies)).fetchone()["id"]
+        conn.execute("INSERT INTO book_copies (book_id, copy_no) SELECT %s, n FROM generate_series(1, %s) n",
+                     (book_id, args.copies))
+        with conn.cursor() as cursor:
+            cursor.executemany("INSERT INTO users (username, password, user_type) VALUES (%s, 'x', 'Student')",
+                               [(u,) for u in usernames])
+
+    transactions, holds = TransactionDAO(), HoldDAO()
+    failures = []
+
+    def check(name: str, ok: bool) -> None:
+        print(f"  {'ok' if ok else 'FAIL':<4} {name}")
+        if not ok:
+            failures.append(name)
+
+    def run_round(name: str, action, students: list) -> dict:
+        monitor = LockMonitor(args.dsn)
+        outcomes, latency = storm(action, students)
+        peak = monitor.stop()
+        counts = Counter(outcome for _, outcome in outcomes)
+        state = book_state(book_id)
+        print(f"{name}: {len(students)} students  outcomes {dict(counts)}  p50 {latency['p50_ms']:.1f} ms "
+              f"p99 {latency['p99_ms']:.1f} ms max {latency['max_ms']:.1f} ms  peak lock waits {peak}")
+        print(f"  book: {dict(state)}")
+        return {"outcomes": outcomes, "counts": counts, "state": state}
+
+    try:
+        borrowed = run_round("borrow", lambda u: transactions.borrow_book(book_id, u), usernames)
+        winners = [u for u, outcome in borrowed["outcomes"] if outcome == BORROW_OK]
+        losers = [u for u, outcome in borrowed["outcomes"] if outcome != BORROW_OK]
+        check(f"exactly {args.copies} borrows won", len(winners) == args.copies)
+        check("every other borrower was told the book is unavailable",
+              borrowed["counts"][BORROW_UNAVAILABLE] == args.students - args.copies)
+        check("one open loan per copy, none left on the shelf",
+              borrowed["state"]["open_loans"] == args.copies == borrowed["state"]["loaned"]
+              and borrowed["state"]["on_shelf"] == 0)
+
+        queued = run_round("hold", lambda u: holds.place_hold(book_id, u), losers)
+        check("every loser queued once", queued["counts"][HOLD_OK] == len(losers)
+              and queued["state"]["waiting"] == len(losers))
+
+        returned = run_round("return", lambda u: transactions.return_book(book_id, u), winners)
+        check("every return succeeded", returned["counts"][True] == len(winners))
+        check("each returned copy went to a hold, none to the shelf",
+              returned["state"]["ready"] == len(winners) == returned["state"]["held"]
+              and returned["state"]["on_shelf"] == 0 and returned["state"]["open_loans"] == 0)
+        with get_connection() as conn:
+            ready = [row["student_username"] for row in conn.execute("""
+                SELECT student_username FROM holds WHERE book_id = %s AND status = 'ready' ORDER BY id
+            """, (book_id,))]
+            first_in_line = [row["student_username"] for row in conn.execute("""
+                SELECT student_username FROM holds WHERE book_id = %s ORDER BY id LIMIT %s
+            """, (book_id, len(winners)))]
+        check("the oldest holds were served first", ready == first_in_line)
+
+        collected = run_round("collect", lambda u: transactions.borrow_book(book_id, u), ready)
+        check("every ready hold was collected", collected["counts"][BORROW_OK] == len(ready)
+              and collected["state"]["open_loans"] == len(ready) == collected["state"]["loaned"]
+              and collected["state"]["ready"] == collected["state"]["held"] == 0
+              and collected["state"]["on_shelf"] == 0)
+    finally:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM books WHERE id=%s", (book_id,))
+            conn.execute("DELETE FROM users WHERE username = ANY(%s)", (usernames,))
+
+    print(f"FAIL: {', '.join(failures)}" if failures else "PASS: no lost updates, double borrows or skipped holds")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
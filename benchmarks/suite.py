@@ -0,0 +1,141 @@
+# benchmarks/suite.py
+"""
+The reproducible benchmark suite: seeds a schema, times the DAOs, the overdue
+job and a mixed HTTP workload, and saves everything as JSON.
+
+1. seed       --books/--students/--years... of synthetic data in --schema, and --pdf-files
+              dummy PDFs of --pdf-kb, old loans archived (benchmarks/seed.py, datagen.py)
+2. dao        every DAO method, --repeat times (benchmarks/dao_timings.py)
+3. overdue    one `python mailer.py` run sending every overdue notice to a local SMTP sink
+4. http       `gunicorn app:app` (--workers gthread workers, --threads threads) under
+              --clients clients running the MIX of benchmarks/workload.py for --seconds,
+              after --warmup seconds; throughput and p50/p95/p99 per endpoint
+
+The result goes to --output (default benchmarks/results/<time>-<commit>.json).
+With --baseline, it is compared with an earlier result and the exit status is 1
+if anything regressed (see benchmarks/compare.py). The same --seed and scale give
+the same data, so results from different commits are comparable on one machine.
+
+    python -m benchmarks.suite --books 1000000 --students 50000 --years 5 --seconds 60
+    python -m benchmarks.suite --baseline benchmarks/results/main.json --sections dao
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from benchmarks.common import base_parser, free_port, wait_for, SMTPSink
+from benchmarks.compare import add_compare_arguments, load, report
+from benchmarks.seed import add_scale_arguments, scale_options, seed, drop_schema
+from blob_store import blob_path
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SECTIONS = ("dao", "overdue", "http")
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_overdue(env: dict, sink: SMTPSink) -> dict:
+    """Times one overdue run from the command line, as cron would start it."""
+    before = sink.messages
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "mailer.py"], env=env, check=True, stdout=subprocess.DEVNULL)
+    seconds = time.perf_counter() - start
+    sent = sink.messages - before
+    return {"seconds": round(seconds, 3), "notices": sent, "notices_per_s": round(sent / seconds, 1)}
+
+def run_http(args, env: dict, conninfo: str) -> dict:
+    from benchmarks.workload import load_borrowable, load_clients, run_mix
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}",
+                               "-w", str(args.workers), "-k", "gthread", "--threads", str(args.threads),
+                               "--log-level", "warning"], env=env)
+    book_ids = load_borrowable(conninfo)
+    clients = load_clients(conninfo, args.clients)
+    try:
+        wait_for(port)
+        if args.warmup:
+            run_mix(port, clients, args.warmup, book_ids, seed=1000)
+        return run_mix(port, clients, args.seconds, book_ids)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = base_parser(__doc__)
+    add_scale_arguments(parser)
+    parser.add_argument("--schema", default="bench_suite")
+    parser.add_argument("--keep-schema", action="store_true", help="leave the seeded schema in place")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--only", nargs="+", help="DAO measurements whose name contains one of these")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=30, help="measured HTTP run")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured HTTP run before it")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare with")
+    add_compare_arguments(parser)
+    args = parser.parse_args()
+
+    started = datetime.now(timezone.utc)
+    result = {"meta": {"started_at": started.isoformat(timespec="seconds"), "commit": git_commit(),
+                       "python": platform.python_version(), "cpus": os.cpu_count(),
+                       "scale": scale_options(args),
+                       "settings": {"workers": args.workers, "threads": args.threads, "clients": args.clients,
+                                    "seconds": args.seconds, "repeat": args.repeat}}}
+    seeded = seed(args.dsn, args.schema, **scale_options(args))
+    conninfo = seeded.pop("conninfo")
+    files = seeded.pop("files")
+    result["seed"] = seeded
+    print(f"seeded {args.schema} in {seeded['seconds']['total']} s: {seeded['rows']}, "
+          f"archived {seeded['archive']['loans_archived']} loans")
+
+    sink = SMTPSink()
+    env = dict(os.environ, DATABASE_URL=conninfo, REQUEST_LOG="0", SMTP_SERVER="127.0.0.1",
+               SMTP_PORT=str(sink.port), SMTP_USE_TLS="0")
+    try:
+        if "dao" in args.sections:
+            from benchmarks.dao_timings import run_dao_timings
+            print("DAO methods:")
+            result["dao"] = run_dao_timings(conninfo, args.repeat, args.only)
+        if "overdue" in args.sections:
+            result["jobs"] = {"overdue_run": run_overdue(env, sink)}
+            print(f"overdue run: {result['jobs']['overdue_run']}")
+        if "http" in args.sections:
+            http = result["http"] = run_http(args, env, conninfo)
+            print(f"HTTP mix: {http['req_per_s']} req/s, p99 {http['all']['p99_ms']} ms, {http['errors']} errors")
+            for name, endpoint in http["endpoints"].items():
+                print(f"  {name:<16} {endpoint['count']:>6} requests {endpoint['req_per_s']:>7} req/s  "
+                      f"p50 {endpoint['p50_ms']:>8.1f} ms p95 {endpoint['p95_ms']:>8.1f} ms "
+                      f"p99 {endpoint['p99_ms']:>8.1f} ms  errors {endpoint['errors']}")
+    finally:
+        sink.shutdown()
+        for kind, names in files.items():
+            for name in names:
+                os.remove(blob_path(kind, name))
+        if not args.keep_schema:
+            drop_schema(args.dsn, args.schema)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{started:%Y%m%dT%H%M%S}-{result['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {output}")
+
+    if args.baseline:
+        regressions = report(load(args.baseline), result, args.threshold, args.min_ms)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# benchmarks/workload.py
+"""
+A mixed library workload against a running `gunicorn app:app`, for benchmarks/suite.py.
+
+Every client is a student without open loans, with one PDF book of its own
+that it borrows first and keeps (a book returned today cannot be borrowed
+again until tomorrow), and also holds an admin session. Each turn it picks a
+scenario from MIX by weight (from its own seeded random generator) and makes
+the scenario's requests on its keep-alive connection. Latencies are kept per endpoint; a
+response with another status than the endpoint's EXPECTED_STATUS is an error.
+"""
+import http.client
+import random
+import threading
+import time
+from urllib.parse import urlencode
+import psycopg
+from benchmarks.common import summarize, session_cookie
+from benchmarks.seed import ADMIN_USERNAME
+from config import BOOK_CATEGORIES
+from dao.book_dao import on_shelf
+from datagen import TITLE_WORDS
+
+# Scenario -> relative weight
+MIX = {
+    "catalog_search": 30,   # keyword search
+    "catalog_browse": 15,   # one category, available books only
+    "mybooks": 20,
+    "borrow_return": 12,    # borrow a random book (often already out) and hand it back
+    "read_pdf": 10,         # download the client's PDF book
+    "admin_dashboard": 10,
+    "overdue_run": 3,       # admin starts the background overdue notices
+}
+
+EXPECTED_STATUS = {
+    "catalog_search": 200, "catalog_browse": 200, "mybooks": 200, "borrow": 302, "return": 302,
+    "pdf_download": 200, "admin_dashboard": 200, "overdue_run": 302,
+}
+
+def load_borrowable(conninfo: str) -> list:
+    """Ids of the books without a PDF, for borrow_return (the PDF books belong to the clients)."""
+    with psycopg.connect(conninfo) as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM books WHERE pdf_file IS NULL ORDER BY id")]
+
+def load_clients(conninfo: str, clients: int) -> list:
+    """(student, pdf book id, pdf file) per client: students without open loans, distinct available PDF books."""
+    with psycopg.connect(conninfo) as conn:
+        students = [row[0] for row in conn.execute("""
+            SELECT username FROM users u
+            WHERE user_type = 'Student'
+              AND NOT EXISTS (SELECT 1 FROM transactions t WHERE t.student_username = u.username AND NOT t.is_returned)
+            ORDER BY username LIMIT %s
+        """, (clients,))]
+        books = conn.execute(f"""
+            SELECT id, pdf_file FROM books
+            WHERE pdf_file IS NOT NULL AND {on_shelf()} ORDER BY id LIMIT %s
+        """, (clients,)).fetchall()
+    if len(students) < clients or len(books) < clients:
+        raise ValueError(f"{clients} clients need as many students without loans and available PDF books "
+                         f"(found {len(students)} and {len(books)}); seed more students or PDF books")
+    return [(student, book_id, pdf_file) for student, (book_id, pdf_file) in zip(students, books)]
+
+class Client:
+    def __init__(self, port: int, student: str, pdf_book: int, pdf_file: str, categories: list,
+                 book_ids: list, seed: int):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        self.student_cookie = session_cookie("Student", student)
+        self.admin_cookie = session_cookie("Admin", ADMIN_USERNAME)
+        self.pdf_book, self.pdf_file = pdf_book, pdf_file
+        self.categories, self.book_ids = categories, book_ids
+        self.rng = random.Random(seed)
+        self.samples = []  # (endpoint, ms, ok)
+
+    def get(self, endpoint: str, path: str, cookie: str) -> None:
+        begin = time.perf_counter()
+        self.conn.request("GET", path, headers={"Cookie": cookie})
+        response = self.conn.getresponse()
+        response.read()
+        self.samples.append((endpoint, (time.perf_counter() - begin) * 1000,
+                             response.status == EXPECTED_STATUS[endpoint]))
+
+    def run_scenario(self, scenario: str) -> None:
+        student, admin = self.student_cookie, self.admin_cookie
+        if scenario == "catalog_search":
+            query = urlencode({"keyword": " ".join(self.rng.sample(TITLE_WORDS, self.rng.choice((1, 1, 2))))})
+            self.get("catalog_search", f"/catalog?{query}", student)
+        elif scenario == "catalog_browse":
+            query = urlencode({"category": self.rng.choice(self.categories), "only_available": "1"})
+            self.get("catalog_browse", f"/catalog?{query}", student)
+        elif scenario == "mybooks":
+            self.get("mybooks", "/mybooks", student)
+        elif scenario == "borrow_return":
+            book_id = self.rng.choice(self.book_ids)
+            self.get("borrow", f"/borrow/{book_id}", student)
+            self.get("return", f"/return/{book_id}", student)
+        elif scenario == "read_pdf":
+            self.get("pdf_download", f"/download/pdf/{self.pdf_file}", student)
+        elif scenario == "admin_dashboard":
+            self.get("admin_dashboard", "/admin", admin)
+        elif scenario == "overdue_run":
+            self.get("overdue_run", "/admin/send_overdue", admin)
+
+    def run(self, deadline: float) -> None:
+        scenarios, weights = list(MIX), list(MIX.values())
+        self.get("borrow", f"/borrow/{self.pdf_book}", self.student_cookie)
+        while time.perf_counter() < deadline:
+            self.run_scenario(self.rng.choices(scenarios, weights)[0])
+        self.conn.close()
+
+def run_mix(port: int, clients: list, seconds: float, book_ids: list, seed: int = 42) -> dict:
+    """
+    Runs the mix for seconds with the clients from load_clients (reuse them across
+    runs: they hold their PDF books), borrow_return picking from book_ids
+    (load_borrowable). Returns requests/s and errors overall and per endpoint, with latencies.
+    """
+    workers = [Client(port, student, book_id, pdf_file, BOOK_CATEGORIES, book_ids, seed + i)
+               for i, (student, book_id, pdf_file) in enumerate(clients)]
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker.run, args=(deadline,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    samples = [sample for worker in workers for sample in worker.samples]
+    endpoints = {}
+    for endpoint in EXPECTED_STATUS:
+        latencies = [ms for name, ms, _ in samples if name == endpoint]
+        endpoints[endpoint] = {"req_per_s": round(len(latencies) / wall, 2),
+                               "errors": sum(1 for name, _, ok in samples if name == endpoint and not ok),
+                               **summarize(latencies)}
+    return {"wall_s": round(wall, 2), "req_per_s": round(len(samples) / wall, 1),
+            "errors": sum(1 for _, _, ok in samples if not ok),
+            "all": summarize([ms for _, ms, _ in samples]), "endpoints": endpoints}
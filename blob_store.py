@@ -0,0 +1,186 @@
+# blob_store.py
+"""
+Content-addressed storage for uploaded covers and PDFs.
+
+Uploads are hashed (SHA-256) while they are streamed to a temp file (see
+uploads.py) and then stored once as "<digest>.<ext>" in their folder, so the
+same file uploaded for several books, or under several names, takes the space
+of one. A blob is shared
+by every book row that names it; BookDAO removes it once no book references it
+any more. Blob names never change meaning, so public covers and thumbnails are
+served with immutable, long-lived cache headers; PDFs are access-controlled and
+revalidated on every use (see pdf_delivery.py).
+
+Covers also have resized copies in COVER_FOLDER/thumbs, named
+"<cover stem>-<width>x<height>.<ext>" (see thumbnails.py). They are removed
+together with their cover, and swept by gc once their cover is gone.
+
+A blob written in the last BLOB_GC_GRACE seconds is never removed: its upload
+may not have reached the books table yet. Leftovers (and files orphaned by
+imports) are swept by:
+
+    python blob_store.py gc [--dry-run] [--include-legacy]
+"""
+import argparse
+import errno
+import glob
+import os
+import re
+import shutil
+import tempfile
+import time
+from config import BLOB_GC_GRACE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PDF_FOLDER = os.path.join(BASE_DIR, "static", "uploads", "pdfs")
+COVER_FOLDER = os.path.join(BASE_DIR, "static", "uploads", "covers")
+THUMB_FOLDER = os.path.join(COVER_FOLDER, "thumbs")
+
+# kind -> (folder, books column referencing it)
+BLOB_KINDS = {
+    "covers": (COVER_FOLDER, "cover_image"),
+    "pdfs": (PDF_FOLDER, "pdf_file"),
+}
+
+CHUNK_SIZE = 64 * 1024
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+THUMB_NAME = re.compile(r"^(?P<stem>.+)-\d+x\d+\.(webp|jpg)$")
+TEMP_PREFIX = ".upload-"
+
+# A year: the longest max-age caches honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+for _folder, _ in BLOB_KINDS.values():
+    os.makedirs(_folder, exist_ok=True)
+os.makedirs(THUMB_FOLDER, exist_ok=True)
+
+# ----- Helper functions -----
+def blob_name(digest: str, extension: str) -> str:
+    """The name a blob with this SHA-256 digest is stored under."""
+    return f"{digest}.{extension.lower()}"
+
+def is_blob_name(name: str) -> bool:
+    """True for content-addressed names; older uploads keep their original file names."""
+    return bool(name and BLOB_NAME.match(name))
+
+def is_immutable_name(name: str) -> bool:
+    """True for blobs and for thumbnails of blobs: their content never changes under that name."""
+    match = THUMB_NAME.match(name or "")
+    return is_blob_name(name) or bool(match and re.fullmatch(r"[0-9a-f]{64}", match["stem"]))
+
+def blob_path(kind: str, name: str) -> str:
+    return os.path.join(BLOB_KINDS[kind][0], name)
+
+def cover_stem(name: str) -> str:
+    """The part of a cover's file name its thumbnails are named after."""
+    return name.rsplit(".", 1)[0]
+
+def _remove_thumbnails(name: str) -> None:
+    for path in glob.glob(os.path.join(THUMB_FOLDER, glob.escape(cover_stem(name)) + "-*")):
+        match = THUMB_NAME.match(os.path.basename(path))
+        if match and match["stem"] == cover_stem(name):
+            os.remove(path)
+
+def _recently_written(path: str) -> bool:
+    return time.time() - os.path.getmtime(path) < BLOB_GC_GRACE
+
+# ----- Storing -----
+def adopt_blob(temp_path: str, digest: str, kind: str, extension: str) -> str:
+    """
+    Moves a fully written upload (temp_path, whose SHA-256 is digest) into the store and
+    returns its blob name. If the blob already exists, the temp file is dropped instead.
+    uploads.py writes and hashes uploads while they stream in, then hands them over here.
+    """
+    folder = BLOB_KINDS[kind][0]
+    name = blob_name(digest, extension)
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        os.utime(path)  # restart the grace period: a new book is about to reference it
+        os.remove(temp_path)
+        return name
+    try:
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Staged on another file system: copy next to the target, then rename
+        fd, staged = tempfile.mkstemp(dir=folder, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as target, open(temp_path, "rb") as source:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+            os.chmod(staged, 0o644)
+            os.replace(staged, path)
+        except BaseException:
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+        os.remove(temp_path)
+    return name
+
+# ----- Removal -----
+def remove_blob(kind: str, name: str) -> bool:
+    """
+    Removes a file no book references any more (the caller checks references).
+    Files written within BLOB_GC_GRACE seconds are kept for the gc sweep.
+    Returns True if the file was removed.
+    """
+    if not name or os.path.basename(name) != name:
+        return False
+    path = blob_path(kind, name)
+    try:
+        if _recently_written(path):
+            return False
+        os.remove(path)
+        if kind == "covers":
+            _remove_thumbnails(name)
+        return True
+    except FileNotFoundError:
+        return False
+
+def collect_garbage(dry_run: bool = False, include_legacy: bool = False) -> dict:
+    """
+    Removes blobs that no book references, and abandoned temp files, older than BLOB_GC_GRACE.
+    Files with original (non content-addressed) names are only considered with include_legacy.
+    Thumbnails are removed once no book references their cover.
+    Returns the number of files removed per kind.
+    """
+    from dao.book_dao import BookDAO  # imported here: BookDAO itself uses this module
+
+    removed = {}
+    for kind, (folder, column) in BLOB_KINDS.items():
+        referenced = set(BookDAO().iter_file_references(column))
+        removed[kind] = 0
+        for entry in os.scandir(folder):
+            if not entry.is_file() or time.time() - entry.stat().st_mtime < BLOB_GC_GRACE:
+                continue
+            stale_temp = entry.name.startswith(TEMP_PREFIX)
+            orphan = (is_blob_name(entry.name) or include_legacy) and entry.name not in referenced
+            if stale_temp or orphan:
+                if not dry_run:
+                    os.remove(entry.path)
+                removed[kind] += 1
+        if kind == "covers":
+            removed["thumbnails"] = _collect_thumbnails({cover_stem(name) for name in referenced}, dry_run)
+    return removed
+
+def _collect_thumbnails(referenced_stems: set, dry_run: bool) -> int:
+    removed = 0
+    for entry in os.scandir(THUMB_FOLDER):
+        if not entry.is_file() or time.time() - entry.stat().st_mtime < BLOB_GC_GRACE:
+            continue
+        match = THUMB_NAME.match(entry.name)
+        if entry.name.startswith(TEMP_PREFIX) or (match and match["stem"] not in referenced_stems):
+            if not dry_run:
+                os.remove(entry.path)
+            removed += 1
+    return removed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blob store maintenance.")
+    parser.add_argument("command", choices=["gc"])
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be removed")
+    parser.add_argument("--include-legacy", action="store_true",
+                        help="also remove unreferenced files stored under their original names")
+    args = parser.parse_args()
+    print(collect_garbage(args.dry_run, args.include_legacy))
@@ -0,0 +1,205 @@
+# catalog_import.py
+"""
+Bulk catalog import from CSV or JSON Lines.
+
+Records are streamed from the file, validated one at a time and upserted on isbn
+in batches of IMPORT_BATCH_SIZE (COPY into a staging table, then one INSERT ...
+ON CONFLICT per batch), so memory stays bounded whatever the file size. Invalid
+rows are reported with their line number and skipped; the rest of the file is
+still imported.
+
+CSV files need a header row with at least title, author and isbn; optional columns
+are category, description, cover_image, pdf_file and copies (how many copies the
+library owns, 1 if omitted; existing books keep their count). New copies start on
+the shelf: other columns, such as the is_available of a catalog export, are ignored,
+since only loans take copies off the shelf. JSON Lines files hold one object per
+line with the same keys.
+
+    python catalog_import.py books.csv
+    python catalog_import.py books.jsonl --batch-size 10000
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
+from config import IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS
+from dao.book_dao import BookDAO
+
+book_dao = BookDAO()
+
+FORMATS = {"csv": "csv", "jsonl": "jsonl", "ndjson": "jsonl"}
+
+# Column limits from the books table (see migrations.py)
+REQUIRED_FIELDS = {"title": 255, "author": 255, "isbn": 50}
+OPTIONAL_FIELDS = {"category": 100, "description": None, "cover_image": 255, "pdf_file": 255}
+
+# One import at a time per process; imports run in the background like overdue runs
+_import_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-import")
+_import_state = {"running": False, "filename": None, "last_result": None}
+_import_state_lock = threading.Lock()
+
+# ----- Helper functions -----
+def detect_format(filename: str) -> str | None:
+    """Returns "csv" or "jsonl" from the file extension, or None if unsupported."""
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return FORMATS.get(extension)
+
+def iter_records(stream, fmt: str, required=REQUIRED_FIELDS):
+    """
+    Yields (line_no, record) from a text stream, where record is a dict, or an error
+    message for lines that cannot be parsed. CSV headers must name every required field.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        missing = set(required) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV header is missing column(s): {', '.join(sorted(missing))}")
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"invalid JSON: {e}"
+            continue
+        yield line_no, record if isinstance(record, dict) else "expected a JSON object"
+
+def _text(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def validate_record(line_no: int, record: dict) -> tuple:
+    """
+    Returns the staging row for a record, as expected by BookDAO.import_batch.
+    Raises ValueError with a readable message for invalid records.
+    """
+    values = {}
+    for field, limit in {**REQUIRED_FIELDS, **OPTIONAL_FIELDS}.items():
+        value = _text(record.get(field))
+        if value is None and field in REQUIRED_FIELDS:
+            raise ValueError(f"{field} is required")
+        if value is not None:
+            if "\x00" in value:
+                raise ValueError(f"{field} contains a NUL character")
+            if "\ufffd" in value:
+                raise ValueError(f"{field} is not valid UTF-8")
+            if limit and len(value) > limit:
+                raise ValueError(f"{field} is longer than {limit} characters")
+        values[field] = value
+    for field in ("cover_image", "pdf_file"):
+        # Stored names are later joined onto the upload folders (and deleted with the book)
+        if values[field] and secure_filename(values[field]) != values[field]:
+            raise ValueError(f"{field} must be a plain file name")
+
+    copies = _text(record.get("copies"))
+    if copies is not None:
+        if not copies.isdigit() or int(copies) < 1:
+            raise ValueError("copies must be a whole number of at least 1")
+        copies = int(copies)
+
+    return (line_no, values["title"], values["author"], values["isbn"], values["category"],
+            values["description"], values["cover_image"], values["pdf_file"], copies)
+
+# ----- Import -----
+def import_books(stream, fmt: str, batch_size: int = None) -> dict:
+    """
+    Imports every record of a text stream ("csv" or "jsonl") and returns a summary:
+    inserted / updated / skipped (superseded by a later row with the same isbn) / failed
+    counts, the first IMPORT_MAX_ERRORS (line, error) pairs and the elapsed time.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    result = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "failed": 0, "errors": [], "seconds": 0.0}
+    start = time.perf_counter()
+
+    def report(line_no, error):
+        result["failed"] += 1
+        if len(result["errors"]) < IMPORT_MAX_ERRORS:
+            result["errors"].append((line_no, error))
+
+    def flush(batch):
+        outcome = book_dao.import_batch(batch)
+        result["inserted"] += outcome["inserted"]
+        result["updated"] += outcome["updated"]
+        result["skipped"] += len(outcome["skipped"])
+        for line_no, error in outcome["failed"]:
+            report(line_no, error)
+
+    batch = []
+    for line_no, record in iter_records(stream, fmt):
+        result["rows"] += 1
+        if isinstance(record, str):
+            report(line_no, record)
+            continue
+        try:
+            batch.append(validate_record(line_no, record))
+        except ValueError as e:
+            report(line_no, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+def import_file(path: str, fmt: str = None, batch_size: int = None) -> dict:
+    """Imports a CSV / JSON Lines file from disk (format taken from the extension unless given)."""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise ValueError("Unsupported file type; use .csv or .jsonl")
+    # utf-8-sig drops the BOM spreadsheet exports often start with; undecodable bytes
+    # are replaced so validate_record rejects just the affected rows
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as stream:
+        return import_books(stream, fmt, batch_size)
+
+# ----- Background jobs (admin upload) -----
+def _run_in_background(path: str, fmt: str) -> None:
+    try:
+        result = import_file(path, fmt)
+    except Exception as e:
+        print(f"Catalog import failed: {e}")
+        result = {"error": str(e)}
+    finally:
+        os.remove(path)
+    with _import_state_lock:
+        _import_state["running"] = False
+        _import_state["last_result"] = result
+
+def enqueue_import(path: str, fmt: str, filename: str) -> bool:
+    """
+    Imports an uploaded file (already saved to path, removed afterwards) in the background.
+    Returns False if an import is already running in this process.
+    """
+    with _import_state_lock:
+        if _import_state["running"]:
+            return False
+        _import_state.update(running=True, filename=filename)
+    _import_executor.submit(_run_in_background, path, fmt)
+    return True
+
+def import_status() -> dict:
+    """Returns whether an import is running and the summary of the last one."""
+    with _import_state_lock:
+        return dict(_import_state)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import books from a CSV or JSON Lines file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    summary = import_file(args.path, args.format, args.batch_size)
+    for line_no, error in summary.pop("errors"):
+        print(f"line {line_no}: {error}")
+    print(summary)
@@ -10,15 +10,123 @@ DB_CONFIG = {
     "url": DATABASE_URL
 }
 
-# File uploads
+# Connection pool shared by all DAOs (sizes are per gunicorn worker)
+DB_POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+    "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 300)),          # seconds before an idle connection is closed
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),  # seconds before a connection is recycled
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),             # seconds to wait for a free connection
+    "check_on_checkout": os.getenv("DB_POOL_CHECK", "1") == "1",    # ping connections before handing them out
+}
+ASYNC_DB = os.getenv("ASYNC_DB", "0") == "1"  # async views query through a second, async pool (dao/async_db.py)
+
+# Catalog
+BOOK_CATEGORIES = ["Science Fiction", "Romantic", "Mystery", "Biography", "History", "Fantasy", "Self-Help", "Technology"]
+
+# Catalog search
+SEARCH_FUZZY = os.getenv("SEARCH_FUZZY", "1") == "1"  # trigram fallback when full-text finds nothing (needs pg_trgm)
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", 0.3))  # pg_trgm similarity cut-off
+
+# PDF full-text index (pdf_indexer.py)
+PDF_INDEX_WORKERS = int(os.getenv("PDF_INDEX_WORKERS", 2))             # processes extracting PDF text
+PDF_INDEX_ON_UPLOAD = os.getenv("PDF_INDEX_ON_UPLOAD", "1") == "1"     # index new PDFs in the background
+PDF_INDEX_MAX_PAGE_CHARS = int(os.getenv("PDF_INDEX_MAX_PAGE_CHARS", 100_000))  # text kept per page
+PDF_SEARCH_PAGES_PER_BOOK = int(os.getenv("PDF_SEARCH_PAGES_PER_BOOK", 3))     # matching pages shown per book
+
+# Passwords and login (dao/user_dao.py, dao/login_throttle_dao.py)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))    # work factor; hashes at another cost are redone on login
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", 2))   # threads hashing passwords at once (per gunicorn worker)
+BCRYPT_QUEUE = int(os.getenv("BCRYPT_QUEUE", 4))       # logins waiting for a hashing thread before "busy" (503)
+LOGIN_FAILURE_WINDOW = int(os.getenv("LOGIN_FAILURE_WINDOW", 900))        # seconds failed logins are counted
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", 5))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", 50))
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 1))  # proxies in front of gunicorn (the router); 0 if none
+
+# Instrumentation (instrumentation.py)
+REQUEST_LOG = os.getenv("REQUEST_LOG", "1") == "1"             # one JSON line per request on stdout
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))          # statements at least this slow are logged; 0 disables
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"  # include the EXPLAIN plan of slow statements
+METRICS_DIR = os.getenv("METRICS_DIR")                          # shared dir so /metrics sums all gunicorn workers
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")                      # bearer token for scrapers (admins need none)
+
+# Pagination (catalog and admin listings)
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 24))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 100))
+
+# In-process catalog read cache (per gunicorn worker)
+BOOK_CACHE_SIZE = int(os.getenv("BOOK_CACHE_SIZE", 1024))  # max cached lookups/pages; 0 disables caching
+BOOK_CACHE_TTL = float(os.getenv("BOOK_CACHE_TTL", 60))    # seconds before a cached entry expires
+
+# PDF download authorization cache (per gunicorn worker); only granted checks are cached
+ENTITLEMENT_CACHE_SIZE = int(os.getenv("ENTITLEMENT_CACHE_SIZE", 4096))
+ENTITLEMENT_CACHE_TTL = float(os.getenv("ENTITLEMENT_CACHE_TTL", 60))  # seconds; returns revoke immediately
+
+# Lending rules
+MAX_ACTIVE_BORROWS = int(os.getenv("MAX_ACTIVE_BORROWS", 5))  # un-returned loans allowed per student
+LOAN_PERIOD_DAYS = int(os.getenv("LOAN_PERIOD_DAYS", 14))
+MAX_ACTIVE_HOLDS = int(os.getenv("MAX_ACTIVE_HOLDS", 5))  # titles a student can queue for at once
+HOLD_PICKUP_DAYS = int(os.getenv("HOLD_PICKUP_DAYS", 3))  # days a returned copy is kept for the next in the queue
+
+# Loan history archival (loan_archive.py)
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", 12))  # returned loans older than this leave transactions
+TRANSACTION_PARTITIONS_AHEAD = int(os.getenv("TRANSACTION_PARTITIONS_AHEAD", 3))  # monthly partitions kept ready
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 10_000))    # loans per transaction out of transactions_legacy
+ARCHIVE_LOCK_TIMEOUT = float(os.getenv("ARCHIVE_LOCK_TIMEOUT", 0.2))  # seconds a partition move waits for books/users
+ARCHIVE_LOCK_RETRIES = int(os.getenv("ARCHIVE_LOCK_RETRIES", 6))      # retries per move before leaving it to the next run
+ARCHIVE_LOCK_BACKOFF = float(os.getenv("ARCHIVE_LOCK_BACKOFF", 0.5))  # seconds; doubles on each retry
+
+# Scheduled upkeep (maintenance.py, the Procfile's clock process)
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", 3600))  # seconds between partition and hold expiry runs
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 24 * 3600))     # seconds between loan archive runs
+
+# Cross-worker cache invalidation (Postgres LISTEN/NOTIFY)
+CACHE_INVALIDATION_LISTENER = os.getenv("CACHE_INVALIDATION_LISTENER", "1") == "1"
+CACHE_FALLBACK_TTL = float(os.getenv("CACHE_FALLBACK_TTL", 5))  # cache TTL (seconds) while the listener is down
+
+# Admin dashboard
+DASHBOARD_STATS_TTL = float(os.getenv("DASHBOARD_STATS_TTL", 30))  # seconds the dashboard counters are cached
+
+# Bulk catalog import (catalog_import.py)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 5000))  # rows COPYed and upserted per transaction
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", 1000))  # invalid rows listed in an import report
+
+# Synthetic data generator (datagen.py)
+DATAGEN_WORKERS = int(os.getenv("DATAGEN_WORKERS", os.cpu_count() or 1))  # processes generating and COPYing rows
+DATAGEN_CHUNK_ROWS = int(os.getenv("DATAGEN_CHUNK_ROWS", 50_000))          # rows per chunk (one COPY each)
+
+# Streaming exports (exports.py)
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", 2000))  # rows fetched per server-side cursor round-trip
+
+# Content-addressed upload storage (blob_store.py)
+BLOB_GC_GRACE = float(os.getenv("BLOB_GC_GRACE", 600))  # seconds a fresh upload is protected from removal
+
+# Cover thumbnails (thumbnails.py)
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", 2))  # background threads resizing uploaded covers
+
+# File uploads (uploads.py)
 UPLOAD_FOLDER = "uploads"
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 256 * 1024 * 1024))  # bytes per request (MAX_CONTENT_LENGTH)
+MAX_COVER_SIZE = int(os.getenv("MAX_COVER_SIZE", 10 * 1024 * 1024))     # bytes per cover image
+MAX_PDF_SIZE = int(os.getenv("MAX_PDF_SIZE", 1024 * 1024 * 1024))       # bytes per PDF (large ones upload in chunks)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))  # bytes per resumable upload chunk
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))    # seconds an idle resumable upload is kept
 ALLOWED_EXTENSIONS = {"pdf", "png", "jpg", "jpeg", "gif"}
 
+# PDF delivery (pdf_delivery.py): direct, x-accel (nginx), x-sendfile (Apache/lighttpd) or flask
+PDF_DELIVERY_MODE = os.getenv("PDF_DELIVERY_MODE", "direct")
+PDF_ACCEL_PREFIX = os.getenv("PDF_ACCEL_PREFIX", "/protected-pdfs")  # nginx internal location for x-accel
+
 # Email configuration
 SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = os.getenv("SMTP_PORT", 587) # A non-sensitive fallback can be used here
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587)) # A non-sensitive fallback can be used here
 EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "1") == "1"            # STARTTLS (disable for a local test server)
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+SMTP_CONCURRENCY = int(os.getenv("SMTP_CONCURRENCY", 4))        # parallel SMTP sessions per overdue run
+SMTP_MAX_RETRIES = int(os.getenv("SMTP_MAX_RETRIES", 3))        # retries per message for transient failures
+SMTP_RETRY_BACKOFF = float(os.getenv("SMTP_RETRY_BACKOFF", 2))  # seconds; doubles on each retry
 
 # Add a check to ensure critical variables are set for production
 if not all([SECRET_KEY, DATABASE_URL, EMAIL_ADDRESS, EMAIL_PASSWORD]):
@@ -0,0 +1,109 @@
+# dao/async_db.py
+"""
+Async database access for the async views (ASYNC_DB=1).
+
+Flask runs each async view in a fresh event loop that is closed when the
+request ends, but an AsyncConnectionPool (its connections and maintenance
+tasks) belongs to the loop it was opened in. So the pool lives on one
+long-running "db" loop in a daemon thread per process, and views hand their
+DAO coroutines to it with gather_db(), which runs them concurrently there.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import asynccontextmanager
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from config import DB_CONFIG, DB_POOL_CONFIG
+from instrumentation import InstrumentedAsyncCursor, record_pool_wait
+
+_loop = None
+_pool = None
+_lock = threading.RLock()  # get_async_pool starts the loop while holding it
+
+# ----- Loop and pool management -----
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Starts the db loop thread on first use (after gunicorn forks, like the sync pool)."""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-db", daemon=True).start()
+                _loop = loop
+    return _loop
+
+async def _open_pool(conninfo: str, overrides: dict) -> AsyncConnectionPool:
+    options = dict(DB_POOL_CONFIG)
+    options.update(overrides)
+    check_on_checkout = options.pop("check_on_checkout")
+    pool = AsyncConnectionPool(
+        conninfo,
+        kwargs={"row_factory": dict_row, "cursor_factory": InstrumentedAsyncCursor},
+        check=AsyncConnectionPool.check_connection if check_on_checkout else None,
+        name="elibrary-async",
+        open=False,
+        **options,
+    )
+    await pool.open()
+    return pool
+
+def create_async_pool(conninfo: str = None, **overrides) -> AsyncConnectionPool:
+    """Opens an async pool on the db loop, using DB_POOL_CONFIG with keyword overrides."""
+    return run_db(_open_pool(conninfo or DB_CONFIG["url"], overrides))
+
+def get_async_pool() -> AsyncConnectionPool:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = create_async_pool()
+    return _pool
+
+def set_async_pool(pool: AsyncConnectionPool | None) -> None:
+    """Replaces the shared async pool (e.g. with one pointing at a local test database)."""
+    global _pool
+    with _lock:
+        old, _pool = _pool, pool
+    if old is not None and old is not pool:
+        run_db(old.close())
+
+def close_async_pool() -> None:
+    set_async_pool(None)
+
+# ----- Helper functions -----
+@asynccontextmanager
+async def get_async_connection():
+    """
+    Borrows a connection from the async pool; only valid in coroutines running on the db loop.
+    Use as an async context manager: committed (or rolled back) and returned on exit.
+    """
+    start = time.perf_counter()
+    async with get_async_pool().connection() as conn:
+        record_pool_wait("async", time.perf_counter() - start)
+        yield conn
+
+def run_db(coro):
+    """Runs a coroutine on the db loop and blocks until it finishes (for sync callers)."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+async def gather_db(*coros) -> list:
+    """Awaits DAO coroutines, run concurrently on the db loop; results in argument order."""
+    get_async_pool()  # opened before the coroutines run, outside the db loop
+    context = contextvars.copy_context()
+
+    async def gather():
+        # Tasks on the db loop start from its own context: carry the caller's over (request stats)
+        for var, value in context.items():
+            var.set(value)
+        return await asyncio.gather(*coros)
+
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(gather(), _get_loop()))
+
+def async_pool_stats() -> dict:
+    if _pool is None:
+        return {"pool_open": False}
+    stats = _pool.get_stats()
+    stats["pool_open"] = not _pool.closed
+    return stats
@@ -1,144 +1,497 @@
 import psycopg
-from psycopg.rows import dict_row
-from config import DB_CONFIG
-import os
+from dao.db import get_connection, stream_rows
+from dao.async_db import get_async_connection
+from dao.pagination import clamp_page_size, encode_cursor, decode_cursor
+from dao.cache import book_cache, invalidate_book, revoke_entitlements
+from dao.invalidation import publish
+from blob_store import BLOB_KINDS, remove_blob
+from config import SEARCH_FUZZY, SEARCH_FUZZY_THRESHOLD, HOLD_PICKUP_DAYS
+from instrumentation import instrument_dao
+import re
 
-# ----- Helper function -----
-def get_connection():
-    """Returns a new connection to the database with dict-like row access."""
-    return psycopg.connect(DB_CONFIG["url"], row_factory=dict_row)
+def on_shelf(table: str = "books.") -> str:
+    """SQL condition: the book (qualified with table, e.g. "b.") has a copy on the shelf (idx_book_copies_shelf)."""
+    return f"EXISTS (SELECT 1 FROM book_copies c WHERE c.book_id = {table}id AND c.status = 'shelf')"
+
+def shelf_join(table: str = "books.") -> str:
+    """Join adding shelf.copies_available, counted once per book; borrows claim a book_copies row, not the book."""
+    return (f" CROSS JOIN LATERAL (SELECT count(*)::int AS copies_available FROM book_copies c"
+            f" WHERE c.book_id = {table}id AND c.status = 'shelf') shelf")
+
+def book_columns(table: str = "") -> str:
+    """
+    Columns returned to callers (search_vector is internal to search), qualified with table (e.g. "b.").
+    The query joins shelf_join(table).
+    """
+    return (f"{table}id, {table}title, {table}author, {table}isbn, shelf.copies_available > 0 AS is_available, "
+            f"{table}copies_total, shelf.copies_available, {table}created_at, {table}category, "
+            f"{table}description, {table}cover_image, {table}pdf_file")
+
+BOOK_COLUMNS = book_columns()
+
+# Catalog reads select BOOK_COLUMNS FROM BOOK_SOURCE
+BOOK_SOURCE = "books" + shelf_join()
+
+# Session-local table each import batch is COPYed into before the upsert
+IMPORT_STAGING_TABLE = "books_import_staging"
+
+# Text search configuration used by books.search_vector (see migrations.py)
+SEARCH_CONFIG = "english"
+
+# Sets the pg_trgm cut-off for the current transaction only
+FUZZY_THRESHOLD_SQL = "SELECT set_config('pg_trgm.similarity_threshold', %s, true)"
+
+# ----- Helper functions -----
+def build_prefix_query(keyword: str) -> str | None:
+    """
+    Turns free text into a tsquery string where every word is a prefix match,
+    e.g. "artif intell" -> "artif:* & intell:*". Returns None if there are no words.
+    """
+    words = re.findall(r"\w+", keyword or "")
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+def build_filters(category=None, only_available=False, table: str = "books.") -> tuple[str, list]:
+    """
+    Returns the extra WHERE conditions (as " AND ..." SQL) and params for catalog filters,
+    on the books row qualified with table.
+    """
+    filters = ""
+    params = []
+    if category:
+        filters += " AND category=%s"
+        params.append(category)
+    if only_available:
+        filters += f" AND {on_shelf(table)}"
+    return filters, params
+
+# Export filters: status -> SQL condition on books
+BOOK_STATUSES = {"available": on_shelf(), "borrowed": f"NOT {on_shelf()}"}
 
 # ----- DAO Class -----
+@instrument_dao
 class BookDAO:
-    def add_book(self, title, author, category, isbn, description, cover_image, pdf_file) -> bool:
-        """Adds a new book to the database."""
+    def add_book(self, title, author, category, isbn, description, cover_image, pdf_file, copies: int = 1) -> bool:
+        """Adds a new book to the database, with `copies` copies on the shelf."""
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO books (title, author, category, isbn, description, cover_image, pdf_file, is_available)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE)
-                """, (title, author, category, isbn, description, cover_image, pdf_file))
-                conn.commit()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        WITH book AS (
+                            INSERT INTO books (title, author, category, isbn, description, cover_image, pdf_file,
+                                               copies_total)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                            RETURNING id, copies_total
+                        )
+                        INSERT INTO book_copies (book_id, copy_no)
+                        SELECT book.id, n FROM book, generate_series(1, book.copies_total) n
+                    """, (title, author, category, isbn, description, cover_image, pdf_file, copies))
+                    publish(cursor, "book_added")
+                    conn.commit()
+            invalidate_book()
             return True
         except Exception as e:
             print(f"Error adding book: {e}")
             return False
-        finally:
-            conn.close()
 
     def update_book(self, book_id, title, author, category, isbn, description, cover_image, pdf_file) -> bool:
-        """Updates an existing book."""
+        """Updates an existing book, removing a replaced cover / PDF that no other book uses."""
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    UPDATE books
-                    SET title=%s, author=%s, category=%s, isbn=%s, description=%s,
-                        cover_image=%s, pdf_file=%s
-                    WHERE id=%s
-                """, (title, author, category, isbn, description, cover_image, pdf_file, book_id))
-                conn.commit()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT cover_image, pdf_file FROM books WHERE id=%s FOR UPDATE", (book_id,))
+                    previous = cursor.fetchone() or {}
+                    cursor.execute("""
+                        UPDATE books
+                        SET title=%s, author=%s, category=%s, isbn=%s, description=%s,
+                            cover_image=%s, pdf_file=%s
+                        WHERE id=%s
+                    """, (title, author, category, isbn, description, cover_image, pdf_file, book_id))
+                    publish(cursor, "book_updated", book_id)
+                    conn.commit()
+            invalidate_book(book_id)
+            revoke_entitlements()  # the PDF name may now belong to another book
+            current = {"cover_image": cover_image, "pdf_file": pdf_file}
+            self._release_files({column: name for column, name in previous.items() if name != current[column]})
             return True
         except Exception as e:
             print(f"Error updating book: {e}")
             return False
-        finally:
-            conn.close()
 
     def delete_book(self, book_id) -> bool:
-        """Deletes a book from the database and removes associated files from disk."""
+        """
+        Deletes a book from the database and removes its cover / PDF from disk,
+        unless another book shares the same stored file.
+        """
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                # 1. Get filenames before deleting
-                cursor.execute("SELECT cover_image, pdf_file FROM books WHERE id=%s", (book_id,))
-                book = cursor.fetchone()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM books WHERE id=%s RETURNING cover_image, pdf_file", (book_id,))
+                    book = cursor.fetchone()
 
-                if not book:
-                    print("Book not found for deletion")
-                    return False
-
-                cover_image = book.get("cover_image")
-                pdf_file = book.get("pdf_file")
-
-                # 2. Delete DB record
-                cursor.execute("DELETE FROM books WHERE id=%s", (book_id,))
-                conn.commit()
-
-                # 3. Remove files from disk (if they exist)
-                if cover_image:
-                    cover_path = os.path.join("static", "uploads", "covers", cover_image)
-                    if os.path.exists(cover_path):
-                        os.remove(cover_path)
-
-                if pdf_file:
-                    pdf_path = os.path.join("static", "uploads", "pdfs", pdf_file)
-                    if os.path.exists(pdf_path):
-                        os.remove(pdf_path)
+                    if not book:
+                        print("Book not found for deletion")
+                        return False
 
+                    publish(cursor, "book_deleted", book_id)
+                    conn.commit()
+            invalidate_book(book_id)
+            revoke_entitlements()
+            self._release_files(book)
             return True
         except Exception as e:
             print(f"Error deleting book: {e}")
             return False
-        finally:
-            conn.close()
+
+    def is_file_referenced(self, column: str, name: str) -> bool:
+        """True if any book uses the stored file (column is "cover_image" or "pdf_file")."""
+        column = {"cover_image": "cover_image", "pdf_file": "pdf_file"}[column]
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM books WHERE {column}=%s) AS used", (name,))
+                return cursor.fetchone()["used"]
+
+    def iter_file_references(self, column: str):
+        """Streams every distinct file name used in the column ("cover_image" or "pdf_file")."""
+        column = {"cover_image": "cover_image", "pdf_file": "pdf_file"}[column]
+        return (row[column] for row in stream_rows(
+            f"SELECT DISTINCT {column} FROM books WHERE {column} IS NOT NULL", name="file_references"))
+
+    def _release_files(self, files: dict) -> None:
+        """Removes stored files ({column: name}) that no book references any more."""
+        for kind, (_, column) in BLOB_KINDS.items():
+            name = files.get(column)
+            if name and not self.is_file_referenced(column, name):
+                remove_blob(kind, name)
+
+    def import_batch(self, rows: list) -> dict:
+        """
+        Upserts a batch of imported books keyed on isbn, via COPY into a temp staging table.
+        rows: (line_no, title, author, isbn, category, description, cover_image, pdf_file, copies) tuples.
+        When an isbn repeats within the batch the last row wins and the earlier ones are skipped. New books
+        get `copies` copies (default 1), all on the shelf. Existing books keep their copies and any optional
+        field the import leaves empty. If the set-based upsert fails, the rows that are not skipped are
+        retried one by one so a bad row is reported instead of aborting the batch.
+        Returns {"inserted": n, "updated": n, "skipped": [line_no, ...], "failed": [(line_no, error), ...]}.
+        """
+        result = {"inserted": 0, "updated": 0, "skipped": [], "failed": []}
+        if not rows:
+            return result
+        # The row applied for each isbn (the last one); earlier ones are superseded
+        offered = {row[3]: row[0] for row in sorted(rows)}
+        result["skipped"] = [row[0] for row in rows if offered[row[3]] != row[0]]
+        upsert = f"""
+            WITH latest AS (
+                SELECT DISTINCT ON (isbn) * FROM {IMPORT_STAGING_TABLE}
+                WHERE %(line_no)s::int IS NULL OR line_no = %(line_no)s
+                ORDER BY isbn, line_no DESC
+            ), upserted AS (
+                INSERT INTO books (title, author, isbn, category, description, cover_image, pdf_file, copies_total)
+                SELECT title, author, isbn, category, description, cover_image, pdf_file, COALESCE(copies, 1)
+                FROM latest
+                ON CONFLICT (isbn) DO UPDATE
+                SET title=EXCLUDED.title, author=EXCLUDED.author,
+                    category=COALESCE(EXCLUDED.category, books.category),
+                    description=COALESCE(EXCLUDED.description, books.description),
+                    cover_image=COALESCE(EXCLUDED.cover_image, books.cover_image),
+                    pdf_file=COALESCE(EXCLUDED.pdf_file, books.pdf_file)
+                RETURNING id, copies_total, (xmax = 0) AS inserted
+            ), copies AS (
+                INSERT INTO book_copies (book_id, copy_no)
+                SELECT u.id, n FROM upserted u, generate_series(1, u.copies_total) n
+                WHERE u.inserted
+            )
+            SELECT inserted FROM upserted
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    CREATE TEMP TABLE IF NOT EXISTS {IMPORT_STAGING_TABLE} (
+                        line_no INT, title TEXT, author TEXT, isbn TEXT, category TEXT, description TEXT,
+                        cover_image TEXT, pdf_file TEXT, copies INT
+                    ) ON COMMIT DELETE ROWS
+                """)
+                with cursor.copy(f"COPY {IMPORT_STAGING_TABLE} FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                try:
+                    with conn.transaction():
+                        cursor.execute(upsert, {"line_no": None})
+                        outcomes = [row["inserted"] for row in cursor.fetchall()]
+                except psycopg.Error:
+                    outcomes = []
+                    for row in rows:
+                        if offered[row[3]] != row[0]:
+                            continue
+                        try:
+                            with conn.transaction():
+                                cursor.execute(upsert, {"line_no": row[0]})
+                                outcomes.extend(r["inserted"] for r in cursor.fetchall())
+                        except psycopg.Error as e:
+                            result["failed"].append((row[0], str(e).splitlines()[0]))
+                result["inserted"] = sum(1 for inserted in outcomes if inserted)
+                result["updated"] = len(outcomes) - result["inserted"]
+                if outcomes:
+                    publish(cursor, "books_imported")
+                conn.commit()
+        if outcomes:
+            invalidate_book()
+            revoke_entitlements()
+        return result
 
     def get_all_books(self) -> list:
         """Returns all books, newest first."""
-        try:
-            conn = get_connection()
+        with get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM books ORDER BY created_at DESC")
+                cursor.execute(f"SELECT {BOOK_COLUMNS} FROM {BOOK_SOURCE} ORDER BY created_at DESC")
                 books = cursor.fetchall()
                 for book in books:
                     if not book["description"]:
                         book["description"] = "No description available"
                 return books
-        finally:
-            conn.close()
+
+    def iter_books(self, category: str = None, status: str = None):
+        """Streams the catalog in id order, for exports. status is one of BOOK_STATUSES or None."""
+        filters, params = build_filters(category)
+        if status:
+            filters += f" AND {BOOK_STATUSES[status]}"
+        return stream_rows(f"SELECT {BOOK_COLUMNS} FROM {BOOK_SOURCE} WHERE TRUE{filters} ORDER BY id",
+                           params, name="export_books")
 
     def get_book(self, book_id):
         """Returns a single book by ID."""
-        try:
-            conn = get_connection()
+        with get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM books WHERE id=%s", (book_id,))
+                cursor.execute(f"SELECT {BOOK_COLUMNS} FROM {BOOK_SOURCE} WHERE id=%s", (book_id,))
                 return cursor.fetchone()
-        finally:
-            conn.close()
 
-    def search_books(self, keyword=None, category=None, only_available=False) -> list:
-        """Search books by keyword, category, and availability."""
-        try:
-            conn = get_connection()
+    def search_books(self, keyword=None, category=None, only_available=False, fuzzy=None) -> list:
+        """
+        Search books by keyword, category, and availability.
+        Keyword searches use the full-text index (title, author, description, ISBN) with
+        prefix matching and are ordered by relevance. If nothing matches and fuzzy search
+        is enabled, falls back to trigram similarity on title/author to tolerate typos.
+        """
+        filters, filter_params = build_filters(category, only_available)
+        tsquery = build_prefix_query(keyword)
+        with get_connection() as conn:
             with conn.cursor() as cursor:
-                query = "SELECT * FROM books WHERE 1=1"
-                params = []
-                if keyword:
-                    query += " AND (title ILIKE %s OR author ILIKE %s)"
-                    params.extend([f"%{keyword}%", f"%{keyword}%"])
-                if category:
-                    query += " AND category=%s"
-                    params.append(category)
-                if only_available:
-                    query += " AND is_available=TRUE"
-                query += " ORDER BY created_at DESC"
-                cursor.execute(query, tuple(params))
-                return cursor.fetchall()
-        finally:
-            conn.close()
-
-    def set_availability(self, book_id: int, is_available: bool) -> bool:
-        """Updates the availability of a book."""
+                if not tsquery:
+                    cursor.execute(
+                        f"SELECT {BOOK_COLUMNS} FROM {BOOK_SOURCE} WHERE 1=1{filters} ORDER BY created_at DESC",
+                        tuple(filter_params))
+                    return cursor.fetchall()
+
+                cursor.execute(f"""
+                    SELECT {BOOK_COLUMNS}
+                    FROM {BOOK_SOURCE}, to_tsquery('{SEARCH_CONFIG}', %s) query
+                    WHERE search_vector @@ query{filters}
+                    ORDER BY ts_rank_cd(search_vector, query) DESC, created_at DESC
+                """, (tsquery, *filter_params))
+                books = cursor.fetchall()
+
+        if not books and (SEARCH_FUZZY if fuzzy is None else fuzzy):
+            books = self._fuzzy_search(keyword.strip(), filters, filter_params)
+        return books
+
+    def _fuzzy_search(self, keyword, filters, filter_params) -> list:
+        """Typo-tolerant fallback using pg_trgm similarity on title and author."""
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("UPDATE books SET is_available=%s WHERE id=%s", (is_available, book_id))
-                conn.commit()
-            return True
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(FUZZY_THRESHOLD_SQL, (str(SEARCH_FUZZY_THRESHOLD),))
+                    cursor.execute(f"""
+                        SELECT {BOOK_COLUMNS}
+                        FROM {BOOK_SOURCE}
+                        WHERE (title %% %s OR author %% %s){filters}
+                        ORDER BY GREATEST(similarity(title, %s), similarity(author, %s)) DESC, created_at DESC
+                        LIMIT 50
+                    """, (keyword, keyword, *filter_params, keyword, keyword))
+                    return cursor.fetchall()
         except Exception as e:
-            print(f"Error setting book availability: {e}")
-            return False
-        finally:
-            conn.close()
+            print(f"Error in fuzzy book search (is pg_trgm installed?): {e}")
+            return []
+
+    def get_books_page(self, keyword=None, category=None, only_available=False,
+                       cursor=None, page_size=None, fuzzy=None) -> dict:
+        """
+        Returns one page of the catalog using keyset pagination.
+        Without a keyword books are ordered newest first on (created_at, id), which the
+        idx_books_created_at_id index serves directly; keyword searches are ordered by
+        relevance (rank, id). Pass the returned next_cursor/prev_cursor back as `cursor`
+        to move between pages. Result: {"books": [...], "next_cursor": str|None, "prev_cursor": str|None}
+        """
+        page_size, position, tsquery, mode = self._plan_page(keyword, cursor, page_size)
+        books = self._fetch_page(mode, keyword, tsquery, category, only_available, position, page_size)
+        if (not books and position is None and mode == "fulltext"
+                and (SEARCH_FUZZY if fuzzy is None else fuzzy)):
+            mode = "fuzzy"
+            books = self._fetch_page(mode, keyword, tsquery, category, only_available, None, page_size)
+        return self._finish_page(books, mode, position, page_size)
+
+    async def get_books_page_async(self, keyword=None, category=None, only_available=False,
+                                   cursor=None, page_size=None, fuzzy=None) -> dict:
+        """get_books_page on the async pool (see dao/async_db.py)."""
+        page_size, position, tsquery, mode = self._plan_page(keyword, cursor, page_size)
+        books = await self._fetch_page_async(mode, keyword, tsquery, category, only_available, position, page_size)
+        if (not books and position is None and mode == "fulltext"
+                and (SEARCH_FUZZY if fuzzy is None else fuzzy)):
+            mode = "fuzzy"
+            books = await self._fetch_page_async(mode, keyword, tsquery, category, only_available, None, page_size)
+        return self._finish_page(books, mode, position, page_size)
+
+    def _plan_page(self, keyword, cursor, page_size) -> tuple:
+        """Returns (page_size, position, tsquery, mode) for a page request."""
+        page_size = clamp_page_size(page_size)
+        position = decode_cursor(cursor)
+        tsquery = build_prefix_query(keyword)
+        if position and position["mode"] in ("fulltext", "fuzzy") and not tsquery:
+            position = None  # stale cursor from a different search
+        if position:
+            mode = position["mode"]
+        else:
+            mode = "fulltext" if tsquery else "recent"
+        return page_size, position, tsquery, mode
+
+    def _finish_page(self, books, mode, position, page_size) -> dict:
+        """Trims the page_size + 1 fetched rows into a page with its cursors."""
+        direction = position["direction"] if position else "next"
+        has_more = len(books) > page_size
+        books = books[:page_size]
+        if direction == "prev":
+            books.reverse()
+        has_next = has_more if direction == "next" else True
+        has_prev = has_more if direction == "prev" else position is not None
+
+        keys = [(book.pop("sort_key"), book["id"]) for book in books]
+        return {
+            "books": books,
+            "next_cursor": encode_cursor(mode, keys[-1], "next") if books and has_next else None,
+            "prev_cursor": encode_cursor(mode, keys[0], "prev") if books and has_prev else None,
+        }
+
+    def _page_query(self, mode, keyword, tsquery, category, only_available, position, page_size) -> tuple:
+        """
+        Builds the keyset query for one page; fetches page_size + 1 rows to detect more pages.
+        Ranks are cast to float8 so the value echoed back in a cursor compares exactly.
+        """
+        filters, filter_params = build_filters(category, only_available)
+        if mode == "recent":
+            source, match, sort_key, params = BOOK_SOURCE, "TRUE", "created_at", []
+        elif mode == "fulltext":
+            source = f"{BOOK_SOURCE}, to_tsquery('{SEARCH_CONFIG}', %s) query"
+            match, sort_key, params = "search_vector @@ query", "ts_rank_cd(search_vector, query)::float8", [tsquery]
+        else:
+            keyword = keyword.strip()
+            source, match = BOOK_SOURCE, "(title %% %s OR author %% %s)"
+            sort_key = "GREATEST(similarity(title, %s), similarity(author, %s))::float8"
+            params = [keyword] * 4  # two similarity() args in SELECT, two % operands in WHERE
+
+        query = f"""
+            SELECT * FROM (
+                SELECT {BOOK_COLUMNS}, {sort_key} AS sort_key
+                FROM {source}
+                WHERE {match}{filters}
+            ) page
+        """
+        params = params + filter_params
+
+        backwards = position is not None and position["direction"] == "prev"
+        if position:
+            query += f" WHERE (sort_key, id) {'>' if backwards else '<'} (%s, %s)"
+            params.extend(position["key"])
+        order = "ASC" if backwards else "DESC"
+        query += f" ORDER BY sort_key {order}, id {order} LIMIT %s"
+        params.append(page_size + 1)
+        return query, tuple(params)
+
+    def _fetch_page(self, mode, *args) -> list:
+        query, params = self._page_query(mode, *args)
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    if mode == "fuzzy":
+                        cursor.execute(FUZZY_THRESHOLD_SQL, (str(SEARCH_FUZZY_THRESHOLD),))
+                    cursor.execute(query, params)
+                    return cursor.fetchall()
+        except Exception as e:
+            if mode != "fuzzy":
+                raise
+            print(f"Error in fuzzy book search (is pg_trgm installed?): {e}")
+            return []
+
+    async def _fetch_page_async(self, mode, *args) -> list:
+        query, params = self._page_query(mode, *args)
+        try:
+            async with get_async_connection() as conn:
+                async with conn.cursor() as cursor:
+                    if mode == "fuzzy":
+                        await cursor.execute(FUZZY_THRESHOLD_SQL, (str(SEARCH_FUZZY_THRESHOLD),))
+                    await cursor.execute(query, params)
+                    return await cursor.fetchall()
+        except Exception as e:
+            if mode != "fuzzy":
+                raise
+            print(f"Error in fuzzy book search (is pg_trgm installed?): {e}")
+            return []
+
+    def set_copies(self, book_id: int, copies: int) -> str:
+        """
+        Sets how many copies of a book the library owns (see library_set_copies in migrations.py).
+        Added copies go to the hold queue first. Returns "ok", "missing", "invalid" (fewer than
+        one copy), "in_use" (the removed copies are out on loan or kept for a hold) or "error".
+        """
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT library_set_copies(%s, %s, %s) AS status",
+                                   (book_id, copies, HOLD_PICKUP_DAYS))
+                    status = cursor.fetchone()["status"]
+                    if status == "ok":
+                        publish(cursor, "availability", book_id)
+                    conn.commit()
+            if status == "ok":
+                invalidate_book(book_id)
+            return status
+        except Exception as e:
+            print(f"Error setting book copies: {e}")
+            return "error"
+
+def normalize_keyword(keyword) -> str:
+    """Canonical form of a search keyword for cache keys ("  Foo  BAR" -> "foo bar")."""
+    return " ".join((keyword or "").lower().split())
+
+@instrument_dao
+class CachedBookDAO(BookDAO):
+    """
+    BookDAO with an in-process read cache (dao.cache.book_cache) in front of the catalog reads.
+    Writes go through BookDAO/TransactionDAO, which invalidate the cache.
+    """
+
+    def get_book(self, book_id):
+        return book_cache.get_or_load(("book", book_id), lambda: super(CachedBookDAO, self).get_book(book_id))
+
+    def get_all_books(self) -> list:
+        return book_cache.get_or_load(("all",), super().get_all_books)
+
+    def search_books(self, keyword=None, category=None, only_available=False, fuzzy=None) -> list:
+        key = ("search", normalize_keyword(keyword), category or None, bool(only_available), fuzzy)
+        return book_cache.get_or_load(
+            key, lambda: super(CachedBookDAO, self).search_books(keyword, category, only_available, fuzzy))
+
+    def get_books_page(self, keyword=None, category=None, only_available=False,
+                       cursor=None, page_size=None, fuzzy=None) -> dict:
+        key = ("page", normalize_keyword(keyword), category or None, bool(only_available),
+               cursor or None, clamp_page_size(page_size), fuzzy)
+        return book_cache.get_or_load(
+            key, lambda: super(CachedBookDAO, self).get_books_page(
+                keyword, category, only_available, cursor, page_size, fuzzy))
+
+    async def get_books_page_async(self, keyword=None, category=None, only_available=False,
+                                   cursor=None, page_size=None, fuzzy=None) -> dict:
+        key = ("page", normalize_keyword(keyword), category or None, bool(only_available),
+               cursor or None, clamp_page_size(page_size), fuzzy)
+        return await book_cache.get_or_load_async(
+            key, lambda: super(CachedBookDAO, self).get_books_page_async(
+                keyword, category, only_available, cursor, page_size, fuzzy))
@@ -0,0 +1,153 @@
+# dao/cache.py
+import threading
+import time
+from collections import OrderedDict
+from dao.invalidation import subscribe, register_cache
+from config import BOOK_CACHE_SIZE, BOOK_CACHE_TTL, ENTITLEMENT_CACHE_SIZE, ENTITLEMENT_CACHE_TTL
+
+_MISSING = object()
+
+# ----- Cache Class -----
+class TTLCache:
+    """
+    A thread-safe, bounded LRU cache whose entries also expire after `ttl` seconds.
+    Cached values are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, name: str = "cache"):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by every invalidation
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default if it is missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self._counters["misses"] += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl: float = None, generation: int = None) -> None:
+        """
+        Stores a value, evicting the least recently used entries beyond max_entries.
+        If generation is given and an invalidation happened since it was read, the value
+        may predate that write and is not stored.
+        """
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def get_or_load(self, key, loader, cache_if=None):
+        """
+        Returns the cached value, calling loader() and caching its result on a miss.
+        cache_if(value) -> bool can restrict which results are cached.
+        """
+        generation = self._generation
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if cache_if is None or cache_if(value):
+                self.set(key, value, generation=generation)
+        return value
+
+    async def get_or_load_async(self, key, loader, cache_if=None):
+        """get_or_load for async callers: loader() returns an awaitable."""
+        generation = self._generation
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = await loader()
+            if cache_if is None or cache_if(value):
+                self.set(key, value, generation=generation)
+        return value
+
+    def invalidate(self, key) -> None:
+        """Removes a single entry."""
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self._counters["invalidations"] += 1
+
+    def invalidate_where(self, predicate) -> None:
+        """Removes every entry whose key satisfies predicate(key)."""
+        with self._lock:
+            self._generation += 1
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            self._counters["invalidations"] += len(stale)
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._generation += 1
+            self._counters["invalidations"] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters and the current size, for monitoring."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        stats.update(name=self.name, max_entries=self.max_entries, ttl=self.ttl)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+# ----- Shared caches -----
+book_cache = TTLCache(BOOK_CACHE_SIZE, BOOK_CACHE_TTL, name="books")
+
+def invalidate_book(book_id: int = None) -> None:
+    """
+    Call after any write that touches books. Drops the cached book (or every cached
+    book when book_id is None) and every cached listing, since listings embed
+    titles and availability.
+    """
+    if book_id is None:
+        book_cache.clear()
+        return
+    book_cache.invalidate_where(lambda key: key[0] != "book" or key[1] == book_id)
+
+# Events published by other workers' writes (see dao/invalidation.py)
+BOOK_EVENTS = {"book_added", "book_updated", "book_deleted", "books_imported", "availability", "borrowed", "returned"}
+subscribe(lambda event: invalidate_book(event.get("book_id")), kinds=BOOK_EVENTS)
+register_cache(book_cache)
+
+# PDF download authorization: ("pdf", student_username, filename) -> True
+entitlement_cache = TTLCache(ENTITLEMENT_CACHE_SIZE, ENTITLEMENT_CACHE_TTL, name="entitlements")
+
+def revoke_entitlements(student_username: str = None) -> None:
+    """
+    Call after a student returns a book (or loses their loans). Drops every cached grant
+    of that student, or all grants when student_username is None.
+    """
+    if student_username is None:
+        entitlement_cache.clear()
+        return
+    entitlement_cache.invalidate_where(lambda key: key[1] == student_username)
+
+# A return revokes the student's grants; a book edit may point a PDF name at another book
+subscribe(lambda event: revoke_entitlements(event.get("student")), kinds={"returned"})
+subscribe(lambda event: revoke_entitlements(), kinds={"book_updated", "book_deleted", "books_imported"})
+register_cache(entitlement_cache)
@@ -0,0 +1,87 @@
+# dao/db.py
+import threading
+import time
+from contextlib import contextmanager
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+from config import DB_CONFIG, DB_POOL_CONFIG, EXPORT_FETCH_SIZE
+from instrumentation import InstrumentedCursor, record_pool_wait
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# ----- Pool management -----
+def create_pool(conninfo: str = None, **overrides) -> ConnectionPool:
+    """
+    Builds a connection pool using DB_POOL_CONFIG, with dict-like row access and
+    timed statements (instrumentation.py). Keyword overrides take precedence over
+    the configured values.
+    """
+    options = dict(DB_POOL_CONFIG)
+    options.update(overrides)
+    check_on_checkout = options.pop("check_on_checkout")
+    return ConnectionPool(
+        conninfo or DB_CONFIG["url"],
+        kwargs={"row_factory": dict_row, "cursor_factory": InstrumentedCursor},
+        check=ConnectionPool.check_connection if check_on_checkout else None,
+        name="elibrary",
+        open=True,
+        **options,
+    )
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide pool, creating it on first use.
+    The pool is created lazily so each gunicorn worker opens its own after forking.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = create_pool()
+    return _pool
+
+def set_pool(pool: ConnectionPool | None) -> None:
+    """Replaces the shared pool (e.g. with one pointing at a local test database)."""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, pool
+    if old is not None and old is not pool:
+        old.close()
+
+def close_pool() -> None:
+    """Closes the shared pool, if one was opened."""
+    set_pool(None)
+
+# ----- Helper functions -----
+@contextmanager
+def get_connection():
+    """
+    Borrows a connection from the shared pool.
+    Use as a context manager: the transaction is committed (or rolled back on error)
+    and the connection returned to the pool when the block exits.
+    """
+    start = time.perf_counter()
+    with get_pool().connection() as conn:
+        record_pool_wait("sync", time.perf_counter() - start)
+        yield conn
+
+def stream_rows(query: str, params=(), name: str = "stream"):
+    """
+    Yields the rows of a query from a server-side (named) cursor, EXPORT_FETCH_SIZE
+    rows per round-trip, so large results never sit in memory at once. The pooled
+    connection is held until the generator is exhausted or closed.
+    """
+    with get_connection() as conn:
+        with conn.cursor(name=name) as cursor:
+            cursor.itersize = EXPORT_FETCH_SIZE
+            cursor.execute(query, params)
+            yield from cursor
+
+def pool_stats() -> dict:
+    """Returns pool usage counters (size, waiting requests, errors...) for monitoring."""
+    if _pool is None:
+        return {"pool_open": False}
+    stats = _pool.get_stats()
+    stats["pool_open"] = not _pool.closed
+    return stats
@@ -0,0 +1,110 @@
+# dao/hold_dao.py
+"""
+The holds queue: students line up for a title whose copies are all out. A returned
+copy goes to the oldest waiting hold, which becomes "ready" and keeps the copy for
+HOLD_PICKUP_DAYS; the student collects it with an ordinary borrow. The queue logic
+lives in SQL functions next to library_borrow (see migrations.py, migration 10), so
+every change is one round-trip, and holds, returns and expiries of a title take its
+books row lock among themselves.
+"""
+from dao.db import get_connection
+from dao.async_db import get_async_connection
+from dao.cache import invalidate_book
+from dao.invalidation import publish
+from config import MAX_ACTIVE_HOLDS, HOLD_PICKUP_DAYS
+from instrumentation import instrument_dao
+
+# ----- Hold outcomes -----
+HOLD_OK = "ok"
+HOLD_MISSING = "missing"                    # no such book
+HOLD_AVAILABLE = "available"                # a copy is free: borrow it instead
+HOLD_ALREADY_BORROWED = "already_borrowed"  # student has a copy of this book
+HOLD_ALREADY_HELD = "already_held"          # student is already in this book's queue
+HOLD_LIMIT_REACHED = "limit_reached"        # student already has MAX_ACTIVE_HOLDS open holds
+HOLD_UNKNOWN_STUDENT = "unknown_student"
+HOLD_ERROR = "error"
+
+# Open holds of a student, with queue positions (shared by the sync and async methods)
+STUDENT_HOLDS_SQL = """
+    SELECT h.id, h.book_id, h.status, h.created_at, h.ready_until, b.title,
+           CASE WHEN h.status = 'waiting' THEN (
+               SELECT count(*) FROM holds q
+               WHERE q.book_id = h.book_id AND q.status = 'waiting' AND q.id <= h.id
+           ) END AS position
+    FROM holds h
+    JOIN books b ON h.book_id = b.id
+    WHERE h.student_username = %s AND h.status IN ('waiting','ready')
+    ORDER BY h.id
+"""
+
+# ----- DAO Class -----
+@instrument_dao
+class HoldDAO:
+    def place_hold(self, book_id: int, student_username: str) -> str:
+        """
+        Queues the student for a book whose copies are all out. Returns HOLD_OK or the
+        reason the hold was refused: HOLD_MISSING, HOLD_AVAILABLE, HOLD_ALREADY_BORROWED,
+        HOLD_ALREADY_HELD, HOLD_LIMIT_REACHED, HOLD_UNKNOWN_STUDENT or HOLD_ERROR.
+        """
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT library_hold(%s, %s, %s) AS status",
+                                   (book_id, student_username, MAX_ACTIVE_HOLDS))
+                    return cursor.fetchone()["status"]
+        except Exception as e:
+            print(f"Error placing hold: {e}")
+            return HOLD_ERROR
+
+    def cancel_hold(self, book_id: int, student_username: str) -> bool:
+        """
+        Cancels the student's open hold on a book; a copy it was keeping goes to the
+        next in line. Returns True if there was a hold to cancel.
+        """
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT library_cancel_hold(%s, %s, %s) AS cancelled",
+                                   (book_id, student_username, HOLD_PICKUP_DAYS))
+                    if not cursor.fetchone()["cancelled"]:
+                        print("No open hold found for this user/book.")
+                        return False
+                    publish(cursor, "availability", book_id)
+                    conn.commit()
+            invalidate_book(book_id)
+            return True
+        except Exception as e:
+            print(f"Error cancelling hold: {e}")
+            return False
+
+    def get_student_holds(self, student_username: str) -> list:
+        """
+        Returns the student's open holds, oldest first, with the book title, the status
+        ("waiting" or "ready"), ready_until for ready ones and the queue position of waiting ones.
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(STUDENT_HOLDS_SQL, (student_username,))
+                return cursor.fetchall()
+
+    async def get_student_holds_async(self, student_username: str) -> list:
+        async with get_async_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(STUDENT_HOLDS_SQL, (student_username,))
+                return await cursor.fetchall()
+
+    def expire_holds(self) -> int:
+        """
+        Lapses ready holds whose copy was not collected by ready_until, passing each copy
+        to the next in line or back to the shelf. Returns the number of holds expired.
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT library_expire_holds(%s) AS expired", (HOLD_PICKUP_DAYS,))
+                expired = cursor.fetchone()["expired"]
+                if expired:
+                    publish(cursor, "availability")
+                conn.commit()
+        if expired:
+            invalidate_book()
+        return expired
@@ -0,0 +1,146 @@
+# dao/invalidation.py
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+DAO writes call publish() inside their own transaction, so the event is only
+delivered once the write commits. Every worker runs one listener thread that
+forwards events to the subscribed handlers (e.g. evicting cached books). While the
+listener is disconnected, cached entries fall back to a short TTL so staleness
+stays bounded, and the caches are flushed on reconnect since events may have been missed.
+"""
+import json
+import os
+import socket
+import threading
+import psycopg
+from config import DB_CONFIG, CACHE_FALLBACK_TTL
+
+CHANNEL = "library_changes"
+
+_handlers = []          # list of (kinds or None, handler)
+_degradable_caches = []  # TTLCaches whose TTL is shortened while the listener is down
+_listener = None
+_listener_lock = threading.Lock()
+
+# ----- Publishing -----
+def process_origin() -> str:
+    """Identifies this worker process across hosts, so a worker can ignore its own events."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def event_payload(kind: str, book_id: int = None, **details) -> str:
+    """
+    Serializes a change event, for statements that call pg_notify(CHANNEL, payload) themselves.
+    kind: e.g. "book_added", "book_updated", "book_deleted", "borrowed", "returned"
+    """
+    return json.dumps({"kind": kind, "book_id": book_id, "origin": process_origin(), **details})
+
+def publish(cursor, kind: str, book_id: int = None, **details) -> None:
+    """Queues a change event on the cursor's transaction (delivered on commit)."""
+    cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, event_payload(kind, book_id, **details)))
+
+# ----- Subscribing -----
+def subscribe(handler, kinds=None) -> None:
+    """Registers handler(event: dict) for the given event kinds (all kinds when None)."""
+    _handlers.append((set(kinds) if kinds else None, handler))
+
+def register_cache(cache) -> None:
+    """Registers a TTLCache to be flushed on reconnect and shortened to CACHE_FALLBACK_TTL while disconnected."""
+    cache.base_ttl = cache.ttl
+    _degradable_caches.append(cache)
+
+def dispatch(event: dict) -> None:
+    """Delivers an event to every matching handler; a failing handler does not stop the others."""
+    for kinds, handler in list(_handlers):
+        if kinds is None or event.get("kind") in kinds:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"Error handling invalidation event {event}: {e}")
+
+# ----- Listener -----
+class InvalidationListener(threading.Thread):
+    """Background thread holding a dedicated LISTEN connection, reconnecting with backoff."""
+
+    def __init__(self, conninfo: str, poll_interval: float = 5.0, max_backoff: float = 30.0):
+        super().__init__(name="invalidation-listener", daemon=True)
+        self.conninfo = conninfo
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.events = 0
+        self.reconnects = 0
+        self.last_error = None
+        self.pid = os.getpid()
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    self._set_connected(True)
+                    backoff = 1.0
+                    while not self._stop_event.is_set():
+                        for notify in conn.notifies(timeout=self.poll_interval):
+                            self._handle(notify.payload)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Invalidation listener disconnected: {e}")
+            self._set_connected(False)
+            if self._stop_event.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff)
+            self.reconnects += 1
+
+    def _set_connected(self, connected: bool) -> None:
+        self.connected = connected
+        for cache in _degradable_caches:
+            if connected:
+                cache.clear()  # events may have been missed while disconnected
+                cache.ttl = cache.base_ttl
+            else:
+                cache.ttl = min(cache.base_ttl, CACHE_FALLBACK_TTL)
+
+    def _handle(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        self.events += 1
+        if event.get("origin") == process_origin():
+            return  # this worker already invalidated locally
+        dispatch(event)
+
+    def stats(self) -> dict:
+        return {"alive": self.is_alive(), "connected": self.connected, "events": self.events,
+                "reconnects": self.reconnects, "last_error": self.last_error}
+
+def ensure_listener() -> None:
+    """Starts this process's listener if it is not running (safe to call on every request, and after fork)."""
+    global _listener
+    if _listener is not None and _listener.is_alive() and _listener.pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive() or _listener.pid != os.getpid():
+            for cache in _degradable_caches:
+                cache.ttl = min(cache.base_ttl, CACHE_FALLBACK_TTL)
+            _listener = InvalidationListener(DB_CONFIG["url"])
+            _listener.start()
+
+def stop_listener() -> None:
+    """Stops the listener thread (e.g. at shutdown or in tests)."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def listener_stats() -> dict:
+    """Returns listener health counters for monitoring."""
+    if _listener is None:
+        return {"alive": False, "connected": False}
+    return _listener.stats()
@@ -0,0 +1,52 @@
+# dao/login_throttle_dao.py
+"""
+Failed-login counters per key ("user:<name>", "ip:<address>"), kept in Postgres
+so every gunicorn worker sees the same counts. Each key counts failures in a
+fixed window of LOGIN_FAILURE_WINDOW seconds from its first failure; a key at
+its limit is refused before any password is hashed.
+"""
+from dao.db import get_connection
+from config import LOGIN_FAILURE_WINDOW
+from instrumentation import instrument_dao
+
+# ----- Helper functions -----
+def user_key(username: str) -> str:
+    return f"user:{username.strip().lower()}"
+
+def ip_key(address: str) -> str:
+    return f"ip:{address}"
+
+# ----- DAO Class -----
+@instrument_dao
+class LoginThrottleDAO:
+    def retry_after(self, limits: dict) -> int:
+        """
+        limits maps keys to their allowed failures. Returns the seconds until the
+        longest-blocked key may try again, or 0 if none is at its limit.
+        """
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT key, failures,
+                       ceil(extract(epoch FROM window_start + make_interval(secs => %s) - CURRENT_TIMESTAMP))::int
+                           AS remaining
+                FROM login_failures
+                WHERE key = ANY(%s) AND window_start > CURRENT_TIMESTAMP - make_interval(secs => %s)
+            """, (LOGIN_FAILURE_WINDOW, list(limits), LOGIN_FAILURE_WINDOW)).fetchall()
+        return max((row["remaining"] for row in rows if row["failures"] >= limits[row["key"]]), default=0)
+
+    def record_failure(self, keys) -> None:
+        """Counts a failed login against every key, starting a new window where the last one expired."""
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM login_failures WHERE window_start <= CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """, (LOGIN_FAILURE_WINDOW,))
+                cursor.executemany("""
+                    INSERT INTO login_failures (key, failures) VALUES (%s, 1)
+                    ON CONFLICT (key) DO UPDATE SET failures = login_failures.failures + 1
+                """, [(key,) for key in keys])
+
+    def clear(self, key: str) -> None:
+        """Forgets the failures of a key (e.g. a user who has just logged in)."""
+        with get_connection() as conn:
+            conn.execute("DELETE FROM login_failures WHERE key=%s", (key,))
@@ -0,0 +1,72 @@
+# dao/notification_dao.py
+from contextlib import contextmanager
+from dao.db import get_connection
+from instrumentation import instrument_dao
+
+# Advisory lock key that serializes overdue-notice runs across all workers
+OVERDUE_JOB_LOCK = 7_310_001
+
+# ----- DAO Class -----
+@instrument_dao
+class NotificationDAO:
+    @contextmanager
+    def overdue_job_lock(self):
+        """
+        Holds a Postgres advisory lock for the duration of an overdue run.
+        Yields True if acquired, False if another worker is already running the job.
+        """
+        with get_connection() as conn:
+            acquired = conn.execute("SELECT pg_try_advisory_lock(%s) AS locked", (OVERDUE_JOB_LOCK,)).fetchone()["locked"]
+            conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.execute("SELECT pg_advisory_unlock(%s)", (OVERDUE_JOB_LOCK,))
+
+    def get_pending_overdue(self) -> list:
+        """
+        Returns overdue, un-returned loans whose notice has not been delivered yet
+        (no notification row, or a previous attempt failed transiently).
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT t.id AS transaction_id, t.student_username, t.return_date, b.title, u.email
+                    FROM transactions t
+                    JOIN books b ON t.book_id=b.id
+                    JOIN users u ON t.student_username=u.username
+                    LEFT JOIN overdue_notifications n ON n.transaction_id=t.id
+                    WHERE t.is_returned=FALSE AND t.return_date < CURRENT_DATE
+                      AND u.email IS NOT NULL
+                      AND (n.transaction_id IS NULL OR n.status='failed')
+                    ORDER BY t.return_date ASC
+                """)
+                return cursor.fetchall()
+
+    def record_delivery(self, transaction_id: int, status: str, error: str = None) -> None:
+        """
+        Records the outcome of a notice: 'sent', 'failed' (transient, retried on the next run)
+        or 'rejected' (permanent, not retried).
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO overdue_notifications (transaction_id, status, attempts, last_error, updated_at, sent_at)
+                    VALUES (%(tx)s, %(status)s, 1, %(error)s, CURRENT_TIMESTAMP,
+                            CASE WHEN %(sent)s THEN CURRENT_TIMESTAMP END)
+                    ON CONFLICT (transaction_id) DO UPDATE
+                    SET status=EXCLUDED.status,
+                        attempts=overdue_notifications.attempts + 1,
+                        last_error=EXCLUDED.last_error,
+                        updated_at=EXCLUDED.updated_at,
+                        sent_at=EXCLUDED.sent_at
+                """, {"tx": transaction_id, "status": status, "error": error, "sent": status == "sent"})
+                conn.commit()
+
+    def get_delivery_summary(self) -> dict:
+        """Returns the number of notices per delivery status."""
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT status, count(*) AS total FROM overdue_notifications GROUP BY status")
+                return {row["status"]: row["total"] for row in cursor.fetchall()}
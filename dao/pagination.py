@@ -0,0 +1,50 @@
+# dao/pagination.py
+import base64
+import json
+from datetime import datetime
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# ----- Helper functions -----
+def clamp_page_size(page_size) -> int:
+    """Returns a page size within 1..MAX_PAGE_SIZE, falling back to the default."""
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"ts": value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict) and "ts" in value:
+        return datetime.fromisoformat(value["ts"])
+    return value
+
+def encode_cursor(mode: str, key: tuple, direction: str) -> str:
+    """
+    Builds an opaque, URL-safe cursor token.
+    mode: which ordering produced the page ("recent", "fulltext", "fuzzy")
+    key: the sort key of the boundary row, e.g. (created_at, id)
+    direction: "next" (rows after key) or "prev" (rows before key)
+    """
+    payload = {"m": mode, "k": [_encode_value(v) for v in key], "d": direction}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(token: str | None) -> dict | None:
+    """Parses a cursor token. Returns None for a missing or malformed token (i.e. first page)."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        return {
+            "mode": str(payload["m"]),
+            "key": tuple(_decode_value(v) for v in payload["k"]),
+            "direction": "prev" if payload["d"] == "prev" else "next",
+        }
+    except (ValueError, KeyError, TypeError):
+        return None
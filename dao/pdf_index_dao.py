@@ -0,0 +1,163 @@
+# dao/pdf_index_dao.py
+from html import escape
+from dao.db import get_connection
+from dao.book_dao import SEARCH_CONFIG, book_columns, build_filters, shelf_join
+from config import PDF_SEARCH_PAGES_PER_BOOK
+from instrumentation import instrument_dao
+
+# Book columns qualified for joins (pdf_pages also has a pdf_file column), with shelf_join("b.")
+BOOK_SELECT = book_columns("b.")
+
+# Markers ts_headline puts around matches; swapped for <mark> once the snippet is escaped
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\x02", "\x03"
+HEADLINE_OPTIONS = (f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, "
+                    "MaxWords=25, MinWords=10, MaxFragments=2, FragmentDelimiter=\" … \"")
+
+# ----- Helper functions -----
+def render_snippet(headline: str) -> str:
+    """HTML-safe snippet with the matched words wrapped in <mark>."""
+    return escape(headline).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>")
+
+# ----- DAO Class -----
+@instrument_dao
+class PdfIndexDAO:
+    def get_index_state(self) -> list:
+        """
+        Every PDF referenced by a book, with the content key it was last indexed under
+        (None if never indexed) and the outcome ("indexed" / "failed").
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT f.pdf_file, d.content_key, d.status
+                    FROM (SELECT DISTINCT pdf_file FROM books WHERE pdf_file IS NOT NULL) f
+                    LEFT JOIN pdf_documents d ON d.pdf_file = f.pdf_file
+                """)
+                return cursor.fetchall()
+
+    def get_content_key(self, pdf_file: str) -> str | None:
+        with get_connection() as conn:
+            row = conn.execute("SELECT content_key FROM pdf_documents WHERE pdf_file=%s", (pdf_file,)).fetchone()
+        return row["content_key"] if row else None
+
+    def replace_pages(self, pdf_file: str, content_key: str, pages) -> int:
+        """
+        Replaces the indexed text of a PDF with pages, an iterable of (page_no, text)
+        that is consumed while it is COPYed, in one transaction: searches see either
+        the old or the new text. Returns the number of pages stored.
+        """
+        count = 0
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO pdf_documents (pdf_file, content_key, status)
+                    VALUES (%s, %s, 'indexing')
+                    ON CONFLICT (pdf_file) DO UPDATE SET content_key=EXCLUDED.content_key, status='indexing'
+                """, (pdf_file, content_key))
+                cursor.execute("DELETE FROM pdf_pages WHERE pdf_file=%s", (pdf_file,))
+                with cursor.copy("COPY pdf_pages (pdf_file, page_no, content) FROM STDIN") as copy:
+                    for page_no, text in pages:
+                        copy.write_row((pdf_file, page_no, text))
+                        count += 1
+                cursor.execute("""
+                    UPDATE pdf_documents
+                    SET status='indexed', page_count=%s, error=NULL, indexed_at=CURRENT_TIMESTAMP
+                    WHERE pdf_file=%s
+                """, (count, pdf_file))
+        return count
+
+    def record_failure(self, pdf_file: str, content_key: str, error: str) -> None:
+        """Marks a PDF as unreadable under this content key, so it is not retried until it changes."""
+        with get_connection() as conn:
+            conn.execute("""
+                INSERT INTO pdf_documents (pdf_file, content_key, status, error)
+                VALUES (%s, %s, 'failed', %s)
+                ON CONFLICT (pdf_file) DO UPDATE
+                SET content_key=EXCLUDED.content_key, status='failed', error=EXCLUDED.error,
+                    page_count=NULL, indexed_at=CURRENT_TIMESTAMP
+            """, (pdf_file, content_key, error[:1000]))
+            conn.execute("DELETE FROM pdf_pages WHERE pdf_file=%s", (pdf_file,))
+
+    def purge_unreferenced(self) -> int:
+        """Drops the text of PDFs no book references any more. Returns the number removed."""
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM pdf_documents d
+                    WHERE NOT EXISTS (SELECT 1 FROM books b WHERE b.pdf_file = d.pdf_file)
+                """)
+                return cursor.rowcount
+
+    def get_stats(self) -> dict:
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT status, count(*) AS files, coalesce(sum(page_count), 0) AS pages
+                FROM pdf_documents GROUP BY status
+            """).fetchall()
+        return {row["status"]: {"files": row["files"], "pages": int(row["pages"])} for row in rows}
+
+    def search_pages(self, keyword: str, category=None, only_available=False, limit: int = 20,
+                     pages_per_book: int = PDF_SEARCH_PAGES_PER_BOOK, reader: str = None) -> list:
+        """
+        Full-text search inside PDFs. keyword uses web search syntax ("quoted phrases",
+        or, -excluded). Returns up to limit books, best match first, each with its
+        total number of matching pages and the best pages_per_book pages as
+        {"page": number, "snippet": HTML-safe text with <mark>ed matches}.
+        With a reader (a student's username) pages of a PDF the student does not have
+        on loan come without "snippet", so searches cannot piece its text together.
+        """
+        filters, filter_params = build_filters(category, only_available)
+        book_filters, _ = build_filters(category, only_available, table="b.")
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                # ts_headline re-parses page text, so it only runs on the pages that are returned
+                cursor.execute(f"""
+                    WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS query),
+                    hits AS (
+                        SELECT p.pdf_file, p.page_no, p.content,
+                               ts_rank_cd(p.content_vector, q.query) AS rank
+                        FROM pdf_pages p, q
+                        WHERE p.content_vector @@ q.query
+                    ),
+                    ranked AS (
+                        SELECT pdf_file, page_no, content,
+                               row_number() OVER (PARTITION BY pdf_file ORDER BY rank DESC, page_no) AS position,
+                               count(*) OVER (PARTITION BY pdf_file) AS page_hits,
+                               max(rank) OVER (PARTITION BY pdf_file) AS best
+                        FROM hits
+                    ),
+                    top_files AS (
+                        SELECT DISTINCT r.pdf_file, r.best, r.page_hits
+                        FROM ranked r
+                        WHERE EXISTS (SELECT 1 FROM books WHERE books.pdf_file = r.pdf_file{filters})
+                        ORDER BY r.best DESC, r.pdf_file
+                        LIMIT %s
+                    )
+                    SELECT {BOOK_SELECT},
+                           t.page_hits, r.page_no,
+                           CASE WHEN %s::varchar IS NULL OR EXISTS (
+                               SELECT 1 FROM transactions tx JOIN books lent ON lent.id = tx.book_id
+                               WHERE lent.pdf_file = t.pdf_file AND tx.student_username = %s
+                                 AND tx.is_returned = FALSE)
+                           THEN ts_headline('{SEARCH_CONFIG}', r.content, q.query, %s) END AS headline
+                    FROM top_files t
+                    JOIN ranked r ON r.pdf_file = t.pdf_file AND r.position <= %s
+                    JOIN books b ON b.pdf_file = t.pdf_file{shelf_join("b.")}
+                    CROSS JOIN q
+                    WHERE 1=1{book_filters}
+                    ORDER BY t.best DESC, t.pdf_file, b.id, r.position
+                """, (keyword, *filter_params, limit, reader, reader, HEADLINE_OPTIONS, pages_per_book,
+                      *filter_params))
+                rows = cursor.fetchall()
+
+        results = {}
+        for row in rows:
+            book_id = row["id"]
+            if book_id not in results:
+                book = {key: value for key, value in row.items() if key not in ("page_hits", "page_no", "headline")}
+                results[book_id] = {"book": book, "page_hits": row["page_hits"], "matches": []}
+            match = {"page": row["page_no"]}
+            if row["headline"] is not None:
+                match["snippet"] = render_snippet(row["headline"])
+            results[book_id]["matches"].append(match)
+        return list(results.values())
@@ -0,0 +1,61 @@
+# dao/stats_dao.py
+from dao.db import get_connection
+from dao.async_db import get_async_connection
+from dao.cache import TTLCache
+from config import DASHBOARD_STATS_TTL
+from instrumentation import instrument_dao
+
+# ----- Cached summary shared by all requests in this worker -----
+stats_cache = TTLCache(8, DASHBOARD_STATS_TTL, name="dashboard_stats")
+
+# All dashboard counters in one round-trip (shared by the sync and async methods)
+DASHBOARD_STATS_SQL = """
+    SELECT
+        (SELECT count(*) FROM books) AS total_books,
+        (SELECT count(*) FROM users WHERE user_type='Student') AS total_students,
+        (SELECT count(*) FROM transactions WHERE is_returned=FALSE) AS active_borrows,
+        (SELECT count(*) FROM transactions
+         WHERE is_returned=FALSE AND return_date < CURRENT_DATE) AS overdue,
+        (SELECT coalesce(json_agg(json_build_object('day', d.day, 'borrows', coalesce(c.borrows, 0))
+                                  ORDER BY d.day), '[]'::json)
+         FROM (SELECT generate_series(CURRENT_DATE - (%(days)s - 1), CURRENT_DATE, interval '1 day')::date AS day) d
+         LEFT JOIN (
+             SELECT borrow_date, count(*) AS borrows
+             FROM transactions
+             WHERE borrow_date > CURRENT_DATE - %(days)s
+             GROUP BY borrow_date
+         ) c ON c.borrow_date = d.day) AS borrows_per_day
+"""
+
+# ----- DAO Class -----
+@instrument_dao
+class StatsDAO:
+    def get_dashboard_stats(self, days: int = 14, use_cache: bool = True) -> dict:
+        """
+        Returns the admin dashboard counters, computed with SQL aggregates in one round-trip:
+        total_books, total_students, active_borrows, overdue and borrows_per_day
+        (a list of {"day", "borrows"} for the last `days` days, oldest first).
+        Results are cached for DASHBOARD_STATS_TTL seconds and not invalidated by writes: the
+        counters may lag that long, but busy borrowing never forces them to be recomputed.
+        """
+        if not use_cache:
+            return self._query_stats(days)
+        return stats_cache.get_or_load(("dashboard", days), lambda: self._query_stats(days))
+
+    async def get_dashboard_stats_async(self, days: int = 14, use_cache: bool = True) -> dict:
+        """get_dashboard_stats on the async pool (see dao/async_db.py)."""
+        if not use_cache:
+            return await self._query_stats_async(days)
+        return await stats_cache.get_or_load_async(("dashboard", days), lambda: self._query_stats_async(days))
+
+    def _query_stats(self, days: int) -> dict:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(DASHBOARD_STATS_SQL, {"days": days})
+                return cursor.fetchone()
+
+    async def _query_stats_async(self, days: int) -> dict:
+        async with get_async_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(DASHBOARD_STATS_SQL, {"days": days})
+                return await cursor.fetchone()
@@ -1,128 +1,216 @@
 # dao/transaction_dao.py
 import psycopg
-from psycopg.rows import dict_row
-from datetime import date, timedelta
-from config import DB_CONFIG
+from dao.db import get_connection, stream_rows
+from dao.async_db import get_async_connection
+from dao.cache import invalidate_book, entitlement_cache, revoke_entitlements
+from dao.invalidation import CHANNEL, event_payload
+from config import MAX_ACTIVE_BORROWS, LOAN_PERIOD_DAYS, HOLD_PICKUP_DAYS, TRANSACTION_PARTITIONS_AHEAD
+from instrumentation import instrument_dao
 
-# ----- Helper function -----
-def get_connection():
+# ----- Borrow outcomes -----
+BORROW_OK = "ok"
+BORROW_MISSING = "missing"                  # no such book
+BORROW_UNAVAILABLE = "unavailable"          # every copy is out on loan or kept for a hold
+BORROW_ALREADY_BORROWED = "already_borrowed"  # student already has a copy of this book
+BORROW_LIMIT_REACHED = "limit_reached"      # student already has MAX_ACTIVE_BORROWS loans
+BORROW_SAME_DAY = "borrowed_today"          # already borrowed (and returned) this book today
+BORROW_UNKNOWN_STUDENT = "unknown_student"
+BORROW_ERROR = "error"
+
+# Export filters: status -> SQL condition on transactions t
+TRANSACTION_STATUSES = {
+    "open": "t.is_returned=FALSE",
+    "returned": "t.is_returned=TRUE",
+    "overdue": "t.is_returned=FALSE AND t.return_date < CURRENT_DATE",
+}
+
+# Missing monthly partitions of transactions, from this month to N months ahead (shared with loan_archive.py)
+CREATE_PARTITIONS_SQL = """
+    SELECT library_create_partitions('transactions', CURRENT_DATE,
+                                     (CURRENT_DATE + make_interval(months => %s))::date) AS created
+"""
+
+def is_missing_partition(error: psycopg.Error) -> bool:
+    """True if a row was refused because transactions has no partition for its borrow month."""
+    return "no partition of relation" in (error.diag.message_primary or "")
+
+def loan_history(include_archive: bool = False) -> str:
     """
-    Returns a new connection to the database with dict-like row access.
+    The table listings read: transactions (open loans and the last ARCHIVE_AFTER_MONTHS
+    months), or with include_archive the transactions_all view over the archive as well.
     """
-    return psycopg.connect(DB_CONFIG["url"], row_factory=dict_row)
+    return "transactions_all" if include_archive else "transactions"
+
+# ----- Queries shared by the sync and async methods -----
+RECENT_TRANSACTIONS_SQL = """
+    SELECT t.*, b.title, u.email
+    FROM transactions t
+    JOIN books b ON t.book_id = b.id
+    JOIN users u ON t.student_username = u.username
+    ORDER BY t.borrow_date DESC, t.id DESC
+    LIMIT %s
+"""
+
+# {loans} is loan_history(include_archive)
+STUDENT_TRANSACTIONS_SQL = """
+    SELECT t.*, b.title, b.pdf_file, b.cover_image
+    FROM {loans} t
+    JOIN books b ON t.book_id=b.id
+    WHERE t.student_username=%s
+    ORDER BY t.borrow_date DESC
+"""
 
 # ----- DAO Class -----
+@instrument_dao
 class TransactionDAO:
-    def borrow_book(self, book_id: int, student_username: str) -> bool:
+    def borrow_book(self, book_id: int, student_username: str) -> str:
         """
-        Borrows a book if available. Returns True if successful.
+        Borrows a copy of a book if one is free (or kept for the student by a ready hold),
+        atomically and in a single statement (see library_borrow in migrations.py). Returns
+        BORROW_OK or the reason the borrow failed: BORROW_MISSING, BORROW_UNAVAILABLE,
+        BORROW_ALREADY_BORROWED, BORROW_LIMIT_REACHED, BORROW_SAME_DAY, BORROW_UNKNOWN_STUDENT
+        or BORROW_ERROR.
         """
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                # Check availability in a single query
-                cursor.execute("SELECT is_available FROM books WHERE id=%s", (book_id,))
-                book = cursor.fetchone()
-                
-                # If book does not exist or is unavailable
-                if not book or not book["is_available"]:
-                    return False
-
-                # Insert transaction with borrow and return date
-                borrow_date = date.today()
-                return_date = borrow_date + timedelta(weeks=2)  # 2 weeks borrow period
-                
-                cursor.execute(
-                    """
-                    INSERT INTO transactions (book_id, student_username, borrow_date, return_date)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (book_id, student_username, borrow_date, return_date)
-                )
-
-                # Update book availability to FALSE
-                cursor.execute("UPDATE books SET is_available=FALSE WHERE id=%s", (book_id,))
-                conn.commit()
-            return True
+            try:
+                status = self._borrow(book_id, student_username)
+            except psycopg.errors.CheckViolation as e:
+                if not is_missing_partition(e):
+                    raise
+                # The upkeep that creates partitions ahead (maintenance.py) has not run: create this month's
+                self.create_partitions()
+                status = self._borrow(book_id, student_username)
+            if status == BORROW_OK:
+                invalidate_book(book_id)
+            return status
         except Exception as e:
             print(f"Error borrowing book: {e}")
-            return False
-        finally:
-            if conn:
-                conn.close()
+            return BORROW_ERROR
+
+    def _borrow(self, book_id: int, student_username: str) -> str:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    WITH result AS (
+                        SELECT * FROM library_borrow(%s, %s, %s, %s)
+                    ), notified AS (
+                        SELECT pg_notify(%s, %s) FROM result WHERE status = 'ok'
+                    )
+                    SELECT status, transaction_id, (SELECT count(*) FROM notified) AS notified
+                    FROM result
+                """, (book_id, student_username, MAX_ACTIVE_BORROWS, LOAN_PERIOD_DAYS,
+                      CHANNEL, event_payload("borrowed", book_id, student=student_username)))
+                return cursor.fetchone()["status"]
 
     def return_book(self, book_id: int, student_username: str) -> bool:
         """
-        Returns a borrowed book. Returns True if successful.
+        Returns a borrowed book in a single statement (see library_return in migrations.py):
+        the copy goes to the oldest hold on the book, or back on the shelf. Returns True if successful.
         """
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    UPDATE transactions SET is_returned=TRUE
-                    WHERE book_id=%s AND student_username=%s AND is_returned=FALSE
-                """, (book_id, student_username))
-                
-                if cursor.rowcount == 0:
-                    # No un-returned transaction found
-                    print("No un-returned transaction found for this user/book.")
-                    return False
-
-                # Update book availability to TRUE
-                cursor.execute("UPDATE books SET is_available=TRUE WHERE id=%s", (book_id,))
-                conn.commit()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        WITH result AS (
+                            SELECT * FROM library_return(%s, %s, %s)
+                        ), notified AS (
+                            SELECT pg_notify(%s, %s) FROM result WHERE status = 'ok'
+                        )
+                        SELECT status, (SELECT count(*) FROM notified) AS notified
+                        FROM result
+                    """, (book_id, student_username, HOLD_PICKUP_DAYS,
+                          CHANNEL, event_payload("returned", book_id, student=student_username)))
+                    if cursor.fetchone()["status"] != "ok":
+                        # No un-returned transaction found
+                        print("No un-returned transaction found for this user/book.")
+                        return False
+            revoke_entitlements(student_username)
+            invalidate_book(book_id)
             return True
         except Exception as e:
             print(f"Error returning book: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
 
-    def get_all_transactions(self) -> list:
+    def get_all_transactions(self, include_archive: bool = False) -> list:
         """
-        Returns all transactions, with book title and student email.
+        Returns all transactions, with book title and student email; archived loans
+        only with include_archive.
         """
-        try:
-            conn = get_connection()
+        with get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT t.*, b.title, u.email
-                    FROM transactions t
+                    FROM {loan_history(include_archive)} t
                     JOIN books b ON t.book_id = b.id
                     JOIN users u ON t.student_username = u.username
                     ORDER BY t.borrow_date DESC
                 """)
                 return cursor.fetchall()
-        finally:
-            if conn:
-                conn.close()
 
-    def get_student_transactions(self, student_username: str) -> list:
+    def iter_transactions(self, date_from=None, date_to=None, status: str = None, include_archive: bool = False):
         """
-        Returns all transactions for a given student.
+        Streams transactions (oldest first) with book and student details, for exports.
+        date_from / date_to bound the borrow date (inclusive), which also skips the
+        partitions of other months; status is one of TRANSACTION_STATUSES or None for all.
+        Archived loans are included only with include_archive.
         """
-        try:
-            conn = get_connection()
+        conditions, params = [], []
+        if date_from:
+            conditions.append("t.borrow_date >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("t.borrow_date <= %s")
+            params.append(date_to)
+        if status:
+            conditions.append(TRANSACTION_STATUSES[status])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return stream_rows(f"""
+            SELECT t.id, t.student_username, u.email, t.book_id, b.title, b.isbn,
+                   t.borrow_date, t.return_date, t.is_returned
+            FROM {loan_history(include_archive)} t
+            JOIN books b ON t.book_id = b.id
+            JOIN users u ON t.student_username = u.username
+            {where}
+            ORDER BY t.borrow_date, t.id
+        """, params, name="export_transactions")
+
+    def get_recent_transactions(self, limit: int = 10) -> list:
+        """
+        Returns the most recent transactions, with book title and student email.
+        """
+        with get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT t.*, b.title, b.pdf_file, b.cover_image
-                    FROM transactions t
-                    JOIN books b ON t.book_id=b.id
-                    WHERE t.student_username=%s
-                    ORDER BY t.borrow_date DESC
-                """, (student_username,))
+                cursor.execute(RECENT_TRANSACTIONS_SQL, (limit,))
                 return cursor.fetchall()
-        finally:
-            if conn:
-                conn.close()
+
+    async def get_recent_transactions_async(self, limit: int = 10) -> list:
+        async with get_async_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(RECENT_TRANSACTIONS_SQL, (limit,))
+                return await cursor.fetchall()
+
+    def get_student_transactions(self, student_username: str, include_archive: bool = False) -> list:
+        """
+        Returns all transactions for a given student; archived loans only with include_archive.
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(STUDENT_TRANSACTIONS_SQL.format(loans=loan_history(include_archive)),
+                               (student_username,))
+                return cursor.fetchall()
+
+    async def get_student_transactions_async(self, student_username: str, include_archive: bool = False) -> list:
+        async with get_async_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(STUDENT_TRANSACTIONS_SQL.format(loans=loan_history(include_archive)),
+                                     (student_username,))
+                return await cursor.fetchall()
 
     def get_overdue_transactions(self) -> list:
         """
         Returns all overdue transactions with student emails for notifications.
         """
-        try:
-            conn = get_connection()
+        with get_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute("""
                     SELECT t.*, b.title, u.email, u.username as student_username
@@ -133,27 +221,40 @@ class TransactionDAO:
                     ORDER BY t.return_date ASC
                 """)
                 return cursor.fetchall()
-        finally:
-            if conn:
-                conn.close()
 
-    def check_borrow_status(self, filename: str, student_username: str) -> bool:
+    def check_borrow_status(self, filename: str, student_username: str, use_cache: bool = True) -> bool:
         """
         Checks if a student has a valid, un-returned borrow transaction for a given PDF file.
+        Granted checks are cached for ENTITLEMENT_CACHE_TTL seconds so the many range requests
+        of a PDF reader skip the database; return_book revokes them immediately.
         """
+        if not use_cache:
+            return self._query_borrow_status(filename, student_username)
+        return entitlement_cache.get_or_load(("pdf", student_username, filename),
+                                             lambda: self._query_borrow_status(filename, student_username),
+                                             cache_if=bool)
+
+    def _query_borrow_status(self, filename: str, student_username: str) -> bool:
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT 1
-                    FROM transactions t
-                    JOIN books b ON t.book_id=b.id
-                    WHERE b.pdf_file=%s AND t.student_username=%s AND t.is_returned=FALSE
-                """, (filename, student_username))
-                return cursor.fetchone() is not None
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 1
+                        FROM transactions t
+                        JOIN books b ON t.book_id=b.id
+                        WHERE b.pdf_file=%s AND t.student_username=%s AND t.is_returned=FALSE
+                    """, (filename, student_username))
+                    return cursor.fetchone() is not None
         except Exception as e:
             print(f"Error checking borrow status: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
+
+    def create_partitions(self, months_ahead: int = TRANSACTION_PARTITIONS_AHEAD) -> int:
+        """
+        Creates the monthly partitions of transactions up to months_ahead months from now
+        that do not exist yet, so new loans always have one. Returns the number created.
+        """
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(CREATE_PARTITIONS_SQL, (months_ahead,))
+                return cursor.fetchone()["created"]
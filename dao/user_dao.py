@@ -1,42 +1,105 @@
 # dao/user_dao.py
+import hashlib
+import hmac
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import psycopg
-from psycopg.rows import dict_row
-from config import DB_CONFIG
+from dao.db import get_connection, stream_rows
+from dao.cache import invalidate_book, revoke_entitlements
+from dao.invalidation import publish
+from config import BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_QUEUE, HOLD_PICKUP_DAYS
+from instrumentation import instrument_dao
 import bcrypt # Using bcrypt for secure password hashing
 
+# bcrypt releases the GIL, so hashing runs on a few dedicated threads: at most
+# BCRYPT_WORKERS hashes use CPU at once per worker process, however many requests
+# log in, and the rest of the app keeps running. Beyond BCRYPT_QUEUE waiting
+# hashes, callers get PasswordHashingBusy instead of queueing without bound.
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_QUEUE)
+
+class PasswordHashingBusy(Exception):
+    """Too many passwords are waiting to be hashed; the caller should retry later."""
+
+# Session-local table each user import batch is COPYed into before the insert
+USER_STAGING_TABLE = "users_import_staging"
+
+# Recognised stored hash formats; anything but bcrypt at BCRYPT_ROUNDS is upgraded on login
+BCRYPT_HASH = re.compile(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$")
+SHA256_HASH = re.compile(r"^[0-9a-fA-F]{64}$")  # legacy: unsalted hashlib.sha256 hex digest (old init_db.py)
+
 # ----- Helper functions -----
-def get_connection():
-    """Returns a new connection to the database with dict-like row access."""
-    return psycopg.connect(DB_CONFIG["url"], row_factory=dict_row)
+def hash_scheme(hashed: str) -> str | None:
+    """Returns "bcrypt" or "sha256" for a stored hash, or None if the format is unknown."""
+    if BCRYPT_HASH.match(hashed):
+        return "bcrypt"
+    if SHA256_HASH.match(hashed):
+        return "sha256"
+    return None
+
+def _run_bcrypt(fn, *args):
+    if not _bcrypt_slots.acquire(blocking=False):
+        raise PasswordHashingBusy("Too many logins at once")
+    try:
+        return _bcrypt_pool.submit(fn, *args).result()
+    finally:
+        _bcrypt_slots.release()
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+def _check(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 def hash_password(password: str) -> str:
-    """Hashes a password using bcrypt."""
+    """Hashes a password using bcrypt with BCRYPT_ROUNDS, on the hashing threads."""
     # bcrypt automatically handles salting and is designed to be slow
-    hashed_bytes = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    return hashed_bytes.decode('utf-8')
+    return _run_bcrypt(_hash, password)
 
 def check_password(password: str, hashed: str) -> bool:
-    """Checks a password against a bcrypt hash."""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    """
+    Checks a password against a stored hash of any recognised scheme: bcrypt on the
+    hashing threads, legacy SHA-256 directly (it is cheap). Unknown formats never match.
+    """
+    scheme = hash_scheme(hashed)
+    if scheme == "bcrypt":
+        return _run_bcrypt(_check, password, hashed)
+    if scheme == "sha256":
+        return hmac.compare_digest(hashlib.sha256(password.encode('utf-8')).hexdigest(), hashed.lower())
+    return False
+
+def needs_rehash(hashed: str) -> bool:
+    """True unless hashed is bcrypt ("$2b$<cost>$...") made with BCRYPT_ROUNDS."""
+    return hash_scheme(hashed) != "bcrypt" or int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+
+# Export filters: status -> SQL condition on users u
+STUDENT_STATUSES = {
+    "active": "EXISTS (SELECT 1 FROM transactions t WHERE t.student_username=u.username AND t.is_returned=FALSE)",
+    "overdue": """EXISTS (SELECT 1 FROM transactions t WHERE t.student_username=u.username
+                          AND t.is_returned=FALSE AND t.return_date < CURRENT_DATE)""",
+}
 
 # ----- DAO Class -----
+@instrument_dao
 class UserDAO:
     def add_user(self, username: str, password: str, user_type: str = 'Student', email: str = None) -> bool:
         """Adds a new user. Returns True if successful."""
-        conn = None
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                hashed = hash_password(password)
-                cursor.execute(
-                    """
-                    INSERT INTO users (username, password, user_type, email)
-                    VALUES (%s, %s, %s, %s)
-                    """,
-                    (username, hashed, user_type, email)
-                )
-                conn.commit()
+            hashed = hash_password(password)  # before borrowing a connection: hashing is slow
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO users (username, password, user_type, email)
+                        VALUES (%s, %s, %s, %s)
+                        """,
+                        (username, hashed, user_type, email)
+                    )
+                    conn.commit()
             return True
+        except PasswordHashingBusy:
+            raise
         except psycopg.IntegrityError as e:
             # Handle unique constraint violation (e.g., username or email already exists)
             print(f"Error adding user: {e}")
@@ -44,60 +107,149 @@ class UserDAO:
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
+
+    def import_users(self, rows: list) -> dict:
+        """
+        Inserts a batch of users with already-hashed passwords, stored as given (no hashing
+        here; legacy hashes are upgraded when each user first logs in), via COPY into a temp
+        staging table. rows: (line_no, username, password_hash, user_type, email) tuples; when a
+        username repeats within the batch the last row wins. Existing users are left untouched.
+        Returns {"inserted": n, "skipped": [line_no, ...]}: every other row, because its username or
+        email is already taken or a later row of the batch has the same username.
+        """
+        result = {"inserted": 0, "skipped": []}
+        if not rows:
+            return result
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    CREATE TEMP TABLE IF NOT EXISTS {USER_STAGING_TABLE} (
+                        line_no INT, username TEXT, password TEXT, user_type TEXT, email TEXT
+                    ) ON COMMIT DELETE ROWS
+                """)
+                with cursor.copy(f"COPY {USER_STAGING_TABLE} FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                cursor.execute(f"""
+                    INSERT INTO users (username, password, user_type, email)
+                    SELECT username, password, user_type, email
+                    FROM (
+                        SELECT DISTINCT ON (username) * FROM {USER_STAGING_TABLE}
+                        ORDER BY username, line_no DESC
+                    ) latest
+                    ORDER BY line_no
+                    ON CONFLICT DO NOTHING
+                    RETURNING username
+                """)
+                inserted = {row["username"] for row in cursor.fetchall()}
+        result["inserted"] = len(inserted)
+        # The row that was offered for each username (the last one); earlier ones were dropped
+        offered = {row[1]: row[0] for row in sorted(rows)}
+        result["skipped"] = [row[0] for row in rows if row[1] not in inserted or offered[row[1]] != row[0]]
+        return result
 
     def authenticate(self, username: str, password: str) -> dict | None:
-        """Authenticates a user. Returns user dict if valid, else None."""
-        conn = None
+        """
+        Authenticates a user. Returns user dict if valid, else None.
+        Raises PasswordHashingBusy when the hashing threads are saturated.
+        """
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT username, user_type, email, password FROM users WHERE username=%s",
-                    (username,)
-                )
-                user = cursor.fetchone()
-                if user and check_password(password, user['password']):
-                    # Remove the password hash before returning the user dict
-                    del user['password']
-                    return user
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT username, user_type, email, password FROM users WHERE username=%s",
+                        (username,)
+                    )
+                    user = cursor.fetchone()
+            # Hash check happens after the connection is back in the pool
+            if user and check_password(password, user['password']):
+                if needs_rehash(user['password']):
+                    self._rehash_later(user['username'], user['password'], password)
+                # Remove the password hash before returning the user dict
+                del user['password']
+                return user
             return None
+        except PasswordHashingBusy:
+            raise
         except Exception as e:
             print(f"Error authenticating user: {e}")
             return None
-        finally:
-            if conn:
-                conn.close()
-    
+
+    def _rehash_later(self, username: str, old_hash: str, password: str) -> None:
+        """
+        Re-hashes a just-verified password with bcrypt at BCRYPT_ROUNDS (legacy hashes
+        included) on the hashing threads, without delaying the login. Skipped when they
+        are busy: the next login retries.
+        """
+        if not _bcrypt_slots.acquire(blocking=False):
+            return
+
+        def rehash():
+            try:
+                new_hash = _hash(password)
+                with get_connection() as conn:
+                    # Only if the password was not changed in the meantime
+                    conn.execute("UPDATE users SET password=%s WHERE username=%s AND password=%s",
+                                 (new_hash, username, old_hash))
+            except Exception as e:
+                print(f"Error rehashing password for {username}: {e}")
+            finally:
+                _bcrypt_slots.release()
+
+        _bcrypt_pool.submit(rehash)
+
     def get_all_students(self) -> list:
         """Returns a list of all student users."""
-        conn = None
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT username, email FROM users WHERE user_type='Student'")
-                return cursor.fetchall()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT username, email FROM users WHERE user_type='Student'")
+                    return cursor.fetchall()
         except Exception as e:
             print(f"Error retrieving students: {e}")
             return []
-        finally:
-            if conn:
-                conn.close()
+
+    def iter_students(self, status: str = None):
+        """
+        Streams students with their number of open loans, for exports.
+        status is one of STUDENT_STATUSES or None for all students.
+        """
+        condition = f" AND {STUDENT_STATUSES[status]}" if status else ""
+        return stream_rows(f"""
+            SELECT u.username, u.email,
+                   (SELECT count(*) FROM transactions t
+                    WHERE t.student_username=u.username AND t.is_returned=FALSE) AS active_loans
+            FROM users u
+            WHERE u.user_type='Student'{condition}
+            ORDER BY u.username
+        """, name="export_students")
 
     def delete_user(self, username: str) -> bool:
-        """Deletes a user by username. Returns True if successful."""
-        conn = None
+        """
+        Deletes a user by username. Their open loans are returned and their holds cancelled
+        first, so the copies go back into circulation. Returns True if successful.
+        """
         try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                cursor.execute("DELETE FROM users WHERE username=%s", (username,))
-                conn.commit()
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT count(*) AS released FROM (
+                            SELECT (library_return(book_id, student_username, %(pickup)s)).status FROM transactions
+                            WHERE student_username=%(username)s AND is_returned=FALSE
+                            UNION ALL
+                            SELECT library_cancel_hold(book_id, student_username, %(pickup)s)::text FROM holds
+                            WHERE student_username=%(username)s AND status IN ('waiting','ready')
+                        ) released
+                    """, {"username": username, "pickup": HOLD_PICKUP_DAYS})
+                    released = cursor.fetchone()["released"]
+                    cursor.execute("DELETE FROM users WHERE username=%s", (username,))
+                    if released:
+                        publish(cursor, "availability")
+                    conn.commit()
+            revoke_entitlements(username)  # their loans were deleted with them
+            if released:
+                invalidate_book()
             return True
         except Exception as e:
             print(f"Error deleting user: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
@@ -0,0 +1,403 @@
+# datagen.py
+"""
+Synthetic library data at scale, for load and scaling tests.
+
+Generates books, students and loan histories that satisfy every constraint of
+the schema and loads them with COPY from DATAGEN_WORKERS processes:
+
+- books with valid ISBN-13s (978 + the book id + check digit), categories from
+  BOOK_CATEGORIES and titles / descriptions from a small vocabulary,
+- students (<prefix>student_<n>) and admins (<prefix>admin_<n>), all with the
+  same password, hashed once with bcrypt,
+- returned loans spread over --years, about --loans-per-year per student (some
+  students read far more than others), and open loans for --active-share of
+  the students, --overdue of them past their return date. Books are picked with
+  a Zipf distribution (exponent --zipf), so a few titles get most of the loans,
+  as in a real library. Popular titles have more copies (up to --max-copies);
+  a book never has more open loans than copies, nor two for the same student.
+
+Each table is generated in chunks of DATAGEN_CHUNK_ROWS rows, every chunk from
+its own random generator seeded with (--seed, table, chunk), so the same seed
+and options give the same rows whatever the number of workers. Dates count
+back from --as-of (default today).
+
+With --pdf-files / --cover-files it also writes that many distinct dummy PDFs
+(a few pages of text, padded to --pdf-kb) and JPEG covers (padded to --cover-kb)
+into the blob store, and --pdf-share / --cover-share of the books reference them.
+
+New rows never collide with existing ones: book ids continue after the highest
+one, and usernames carry --prefix. Loans go straight into transactions, in monthly
+partitions created for the whole history; `python loan_archive.py` then moves the
+old returned ones to the archive, as the nightly run would.
+
+    python datagen.py --books 2000000 --students 300000 --years 5 --workers 8
+    python datagen.py --books 20000 --students 2000 --pdf-files 50 --pdf-kb 4096 --pdf-share 0.2 --prefix load_
+"""
+import argparse
+import collections
+import hashlib
+import io
+import itertools
+import math
+import os
+import random
+import tempfile
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+import psycopg
+from config import (DB_CONFIG, BOOK_CATEGORIES, LOAN_PERIOD_DAYS, MAX_ACTIVE_BORROWS, DATAGEN_WORKERS,
+                    DATAGEN_CHUNK_ROWS)
+from blob_store import TEMP_PREFIX, BLOB_KINDS, adopt_blob
+
+TITLE_WORDS = ["history", "galaxy", "garden", "murder", "quantum", "empire", "river", "shadow",
+               "machine", "learning", "ocean", "dragon", "silent", "winter", "network", "kingdom",
+               "secret", "journey", "python", "revolution", "memory", "storm", "island", "theory",
+               "midnight", "crown", "letters", "summer", "engine", "atlas", "forest", "signal",
+               "mountain", "city", "stars", "glass", "code", "harbor", "fire", "science"]
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Jane", "Mary", "Isaac", "Toni", "Chinua", "Haruki", "Elena",
+               "Gabriel", "Ursula", "Leo", "Virginia", "Jorge", "Octavia", "Italo", "Zadie", "Kazuo", "Agatha"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Austen", "Shelley", "Asimov", "Morrison", "Achebe",
+              "Murakami", "Ferrante", "Marquez", "Le Guin", "Tolstoy", "Woolf", "Borges", "Butler",
+              "Calvino", "Smith", "Ishiguro", "Christie"]
+
+OPEN_LOANS_MAX = min(3, MAX_ACTIVE_BORROWS)  # open loans of an active student: 1 to this many
+OPEN_LOAN_PROBES = 20                        # books tried for an open loan before giving it up
+
+BOOK_COLUMNS = ("id", "title", "author", "isbn", "category", "description", "cover_image", "pdf_file",
+                "copies_total", "created_at")
+USER_COLUMNS = ("username", "password", "user_type", "email")
+TRANSACTION_COLUMNS = ("book_id", "student_username", "borrow_date", "return_date", "is_returned")
+
+# ----- Helper functions -----
+def isbn13(number: int) -> str:
+    """A valid ISBN-13 in the 978 prefix for a number below 10**9."""
+    digits = f"978{number:09d}"
+    check = -sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10
+    return f"{digits}{check}"
+
+def student_name(prefix: str, n: int) -> str:
+    return f"{prefix}student_{n}"
+
+def admin_name(prefix: str, n: int) -> str:
+    return f"{prefix}admin_{n}"
+
+def chunk_rng(plan: dict, table: str, chunk: int) -> random.Random:
+    return random.Random(f"{plan['seed']}:{table}:{chunk}")
+
+def popularity_stride(books: int) -> int:
+    """A step coprime with books: rank r is the book at (r * stride) % books, scattering popular titles."""
+    stride = max(1, int(books * 0.618)) | 1
+    while math.gcd(stride, books) != 1:
+        stride += 2
+    return stride
+
+_zipf_cache = {}
+
+def zipf_weights(books: int, exponent: float) -> list:
+    """Cumulative Zipf weights of popularity ranks 0..books-1 (built once per process)."""
+    key = (books, exponent)
+    if key not in _zipf_cache:
+        _zipf_cache.clear()
+        _zipf_cache[key] = list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, books + 1)))
+    return _zipf_cache[key]
+
+def copies_of(plan: dict, index: int) -> int:
+    """
+    Copies of the book at an index: --max-copies for the top 1% of titles by popularity,
+    then falling off with the Zipf weights down to one.
+    """
+    rank = index * plan["stride_inverse"] % plan["books"]
+    top = max(1, plan["books"] // 100)
+    return max(1, min(plan["max_copies"], round(plan["max_copies"] * (top / (rank + 1)) ** plan["zipf"])))
+
+def sample_books(rng: random.Random, plan: dict, count: int) -> list:
+    """count book indexes (0-based) drawn by Zipf popularity."""
+    cumulative, books = zipf_weights(plan["books"], plan["zipf"]), plan["books"]
+    total, stride = cumulative[-1], plan["stride"]
+    return [bisect_left(cumulative, rng.random() * total) * stride % books for _ in range(count)]
+
+# ----- Dummy files -----
+def dummy_pdf(rng: random.Random, size: int, pages: int = 3) -> bytes:
+    """A valid PDF with a few pages of text, padded with an unreferenced binary stream to about size bytes."""
+    font = 3 + 2 * pages
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               2: b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (3 + 2 * p) for p in range(pages))
+                  + b"] /Count %d >>" % pages,
+               font: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    for p in range(pages):
+        text = " ".join(rng.choice(TITLE_WORDS) for _ in range(12)).encode()
+        content = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text
+        objects[3 + 2 * p] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                              b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (font, 4 + 2 * p))
+        objects[4 + 2 * p] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content)
+
+    def assemble(padding: bytes) -> bytes:
+        body = dict(objects)
+        if padding:
+            body[font + 1] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(padding), padding)
+        out, offsets = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"), []
+        for number in sorted(body):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body[number])
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref)
+        return bytes(out)
+
+    padding = max(size - len(assemble(b"")) - 64, 0)
+    return assemble(rng.randbytes(padding))
+
+def dummy_cover(rng: random.Random, size: int) -> bytes:
+    """A small JPEG of colored blocks, padded after its end marker to about size bytes."""
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (300, 450), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(300), rng.randrange(450)
+        draw.rectangle((x, y, x + rng.randrange(20, 200), y + rng.randrange(20, 200)),
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    data = buffer.getvalue()
+    return data + rng.randbytes(max(size - len(data), 0))
+
+FILE_BUILDERS = {"pdfs": (dummy_pdf, "pdf"), "covers": (dummy_cover, "jpg")}
+
+def write_file(plan: dict, kind: str, n: int) -> str:
+    """Writes dummy file n of a kind into the blob store; returns its blob name."""
+    build, extension = FILE_BUILDERS[kind]
+    data = build(chunk_rng(plan, kind, n), plan["pdf_kb" if kind == "pdfs" else "cover_kb"] * 1024)
+    fd, temp_path = tempfile.mkstemp(dir=BLOB_KINDS[kind][0], prefix=TEMP_PREFIX)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return adopt_blob(temp_path, hashlib.sha256(data).hexdigest(), kind, extension)
+
+# ----- Row generators (one chunk each) -----
+def book_rows(plan: dict, chunk: int):
+    rng = chunk_rng(plan, "books", chunk)
+    first = chunk * plan["chunk_rows"]
+    pdfs, covers = plan["pdf_names"], plan["cover_names"]
+    as_of = datetime.combine(plan["as_of"], datetime.min.time())
+    for index in range(first, min(first + plan["chunk_rows"], plan["books"])):
+        book_id = plan["first_book_id"] + index
+        words = rng.sample(TITLE_WORDS, 6)
+        yield (book_id,
+               f"{words[0].title()} {words[1]} {words[2]}",
+               f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+               isbn13(book_id),
+               rng.choice(BOOK_CATEGORIES),
+               f"A book about {words[3]}, {words[4]} and {words[5]}.",
+               rng.choice(covers) if covers and rng.random() < plan["cover_share"] else None,
+               rng.choice(pdfs) if pdfs and rng.random() < plan["pdf_share"] else None,
+               copies_of(plan, index),
+               as_of - timedelta(seconds=rng.randrange(plan["days"] * 86400)))
+
+def user_rows(plan: dict, chunk: int):
+    first = chunk * plan["chunk_rows"]
+    for n in range(first + 1, min(first + plan["chunk_rows"], plan["students"]) + 1):
+        username = student_name(plan["prefix"], n)
+        yield username, plan["password_hash"], "Student", f"{username}@example.com"
+    if chunk == 0:
+        for n in range(1, plan["admins"] + 1):
+            username = admin_name(plan["prefix"], n)
+            yield username, plan["password_hash"], "Admin", f"{username}@example.com"
+
+def transaction_rows(plan: dict, chunk: int):
+    """
+    Loans of the chunk's students. Open loans only go to books whose index falls in
+    the chunk's residue class (index % chunks), so the chunk alone decides how many
+    copies of a book are out.
+    """
+    rng = chunk_rng(plan, "transactions", chunk)
+    per_chunk, chunks = plan["students_per_chunk"], plan["transaction_chunks"]
+    as_of, loan_days, days = plan["as_of"], plan["loan_days"], plan["days"]
+    lent = collections.Counter()
+    first = chunk * per_chunk
+    for n in range(first + 1, min(first + per_chunk, plan["students"]) + 1):
+        username = student_name(plan["prefix"], n)
+        seen = set()
+        loans = round(plan["loans_per_student"] * rng.expovariate(1.0))
+        for index in sample_books(rng, plan, loans):
+            borrow_date = as_of - timedelta(days=rng.randint(1, days))
+            if (index, borrow_date) not in seen:
+                seen.add((index, borrow_date))
+                yield (plan["first_book_id"] + index, username, borrow_date,
+                       borrow_date + timedelta(days=loan_days), True)
+        if rng.random() >= plan["active_share"]:
+            continue
+        holding = set()
+        for index in sample_books(rng, plan, rng.randint(1, OPEN_LOANS_MAX)):
+            # The chunk's book nearest in popularity, or the next one along when that is out
+            index = index - index % chunks + chunk
+            for _ in range(OPEN_LOAN_PROBES):
+                if index < plan["books"] and index not in holding and lent[index] < copies_of(plan, index):
+                    break
+                index = (index + chunks) % plan["books"] if index + chunks < plan["books"] else chunk
+            else:
+                continue
+            if rng.random() < plan["overdue"]:
+                age = loan_days + 1 + rng.randrange(60)
+            else:
+                age = rng.randrange(loan_days + 1)
+            borrow_date = as_of - timedelta(days=age)
+            if (index, borrow_date) in seen:
+                continue
+            lent[index] += 1
+            holding.add(index)
+            yield (plan["first_book_id"] + index, username, borrow_date,
+                   borrow_date + timedelta(days=loan_days), False)
+
+TABLES = {
+    "books": (book_rows, BOOK_COLUMNS),
+    "users": (user_rows, USER_COLUMNS),
+    "transactions": (transaction_rows, TRANSACTION_COLUMNS),
+}
+
+def load_chunk(dsn: str, plan: dict, table: str, chunk: int) -> int:
+    """Generates one chunk and COPYs it in its own transaction; returns the row count."""
+    generate_rows, columns = TABLES[table]
+    count = 0
+    with psycopg.connect(dsn) as conn:
+        with conn.cursor() as cursor:
+            with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in generate_rows(plan, chunk):
+                    copy.write_row(row)
+                    count += 1
+    return count
+
+# ----- Generation -----
+def make_plan(dsn: str, books: int, students: int, years: float, loans_per_year: float, active_share: float,
+              overdue: float, zipf: float, max_copies: int, admins: int, password: str, prefix: str, seed: int,
+              as_of: date, chunk_rows: int, pdf_files: int, pdf_kb: int, pdf_share: float,
+              cover_files: int, cover_kb: int, cover_share: float) -> dict:
+    """Everything the workers need, as plain picklable values."""
+    from dao.user_dao import hash_password
+
+    with psycopg.connect(dsn) as conn:
+        first_book_id = conn.execute("SELECT coalesce(max(id), 0) + 1 FROM books").fetchone()[0]
+        taken = conn.execute("SELECT username FROM users WHERE username = ANY(%s)",
+                             ([student_name(prefix, 1), admin_name(prefix, 1)],)).fetchone()
+    if taken:
+        raise ValueError(f"user {taken[0]} already exists; generate with another --prefix")
+    if first_book_id + books > 10 ** 9:
+        raise ValueError("book ids would exceed the 9 digits of the generated ISBNs")
+    loans_per_student = loans_per_year * years
+    students_per_chunk = max(1, int(chunk_rows // max(loans_per_student, 1)))
+    stride = popularity_stride(books) if books else 1
+    return {
+        "books": books, "students": students, "admins": admins, "prefix": prefix, "seed": seed,
+        "as_of": as_of, "days": max(1, round(years * 365)), "loan_days": LOAN_PERIOD_DAYS,
+        "loans_per_student": loans_per_student, "active_share": active_share, "overdue": overdue,
+        "zipf": zipf, "stride": stride, "stride_inverse": pow(stride, -1, books) if books else 1,
+        "max_copies": max_copies,
+        "password_hash": hash_password(password), "first_book_id": first_book_id, "chunk_rows": chunk_rows,
+        "students_per_chunk": students_per_chunk, "transaction_chunks": math.ceil(students / students_per_chunk),
+        "pdf_files": pdf_files, "pdf_kb": pdf_kb, "pdf_share": pdf_share, "pdf_names": [],
+        "cover_files": cover_files, "cover_kb": cover_kb, "cover_share": cover_share, "cover_names": [],
+    }
+
+def generate(dsn: str = None, books: int = 100_000, students: int = 10_000, years: float = 3,
+             loans_per_year: float = 12, active_share: float = 0.5, overdue: float = 0.2, zipf: float = 0.9,
+             max_copies: int = 5, admins: int = 1, password: str = "password", prefix: str = "gen_", seed: int = 42,
+             as_of: date = None, workers: int = None, chunk_rows: int = None,
+             pdf_files: int = 0, pdf_kb: int = 512, pdf_share: float = 0.1,
+             cover_files: int = 0, cover_kb: int = 100, cover_share: float = 0.5) -> dict:
+    """
+    Generates and loads the data; returns rows per table, the dummy file names per
+    kind ("pdfs", "covers") and the seconds spent in each phase.
+    """
+    dsn = dsn or DB_CONFIG["url"]
+    plan = make_plan(dsn, books, students, years, loans_per_year, active_share, overdue, zipf, max_copies, admins,
+                     password, prefix, seed, as_of or date.today(), chunk_rows or DATAGEN_CHUNK_ROWS,
+                     pdf_files, pdf_kb, pdf_share, cover_files, cover_kb, cover_share)
+    result = {"rows": {}, "files": {}, "seconds": {}}
+    start = time.perf_counter()
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        # Open loans can be older than the returned ones when the history is short
+        earliest = plan["as_of"] - timedelta(days=max(plan["days"], plan["loan_days"] + 60))
+        conn.execute("SELECT library_create_partitions('transactions', %s, %s)", (earliest, plan["as_of"]))
+
+    with ProcessPoolExecutor(max_workers=workers or DATAGEN_WORKERS) as pool:
+        phase = time.perf_counter()
+        for kind in ("pdfs", "covers"):
+            count = plan[f"{kind[:-1]}_files"]
+            names = list(pool.map(write_file, itertools.repeat(plan, count), itertools.repeat(kind, count),
+                                  range(count)))
+            plan[f"{kind[:-1]}_names"] = result["files"][kind] = names
+        result["seconds"]["files"] = round(time.perf_counter() - phase, 2)
+
+        # Transactions reference books and users, so each table is complete before the next starts
+        chunks = {"books": math.ceil(books / plan["chunk_rows"]),
+                  "users": max(1, math.ceil(students / plan["chunk_rows"])),
+                  "transactions": plan["transaction_chunks"]}
+        for table, count in chunks.items():
+            phase = time.perf_counter()
+            result["rows"][table] = sum(pool.map(load_chunk, itertools.repeat(dsn, count),
+                                                 itertools.repeat(plan, count), itertools.repeat(table, count),
+                                                 range(count)))
+            result["seconds"][table] = round(time.perf_counter() - phase, 2)
+
+    phase = time.perf_counter()
+    last_book_id = plan["first_book_id"] + books - 1
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute("SELECT setval(pg_get_serial_sequence('books', 'id'), (SELECT max(id) FROM books))")
+        for table in chunks:
+            conn.execute(f"ANALYZE {table}")
+        # One copy row per copy, as many of them out as the book has open loans
+        conn.execute("""
+            INSERT INTO book_copies (book_id, copy_no, status)
+            SELECT b.id, n, CASE WHEN n <= COALESCE(t.open_loans, 0) THEN 'loaned' ELSE 'shelf' END
+            FROM books b
+            LEFT JOIN (SELECT book_id, count(*) AS open_loans FROM transactions
+                       WHERE is_returned = FALSE AND book_id BETWEEN %s AND %s
+                       GROUP BY book_id) t ON t.book_id = b.id,
+            generate_series(1, b.copies_total) n
+            WHERE b.id BETWEEN %s AND %s
+        """, (plan["first_book_id"], last_book_id) * 2)
+        conn.execute("ANALYZE book_copies")
+    result["seconds"]["finish"] = round(time.perf_counter() - phase, 2)
+    result["seconds"]["total"] = round(time.perf_counter() - start, 2)
+    return result
+
+def add_arguments(parser) -> None:
+    """The generate() options (shared with benchmarks/seed.py)."""
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--students", type=int, default=10_000)
+    parser.add_argument("--years", type=float, default=3, help="years of loan history")
+    parser.add_argument("--loans-per-year", type=float, default=12, help="returned loans per student per year (mean)")
+    parser.add_argument("--active-share", type=float, default=0.5, help="share of students with open loans")
+    parser.add_argument("--overdue", type=float, default=0.2, help="share of open loans past their return date")
+    parser.add_argument("--zipf", type=float, default=0.9, help="Zipf exponent of book popularity")
+    parser.add_argument("--max-copies", type=int, default=5, help="copies of the most popular titles")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pdf-files", type=int, default=0, help="distinct dummy PDFs to write")
+    parser.add_argument("--pdf-kb", type=int, default=512)
+    parser.add_argument("--pdf-share", type=float, default=0.1, help="share of books with one of the PDFs")
+    parser.add_argument("--cover-files", type=int, default=0, help="distinct dummy covers to write")
+    parser.add_argument("--cover-kb", type=int, default=100)
+    parser.add_argument("--cover-share", type=float, default=0.5, help="share of books with one of the covers")
+
+def generate_options(args) -> dict:
+    return {name: getattr(args, name) for name in (
+        "books", "students", "years", "loans_per_year", "active_share", "overdue", "zipf", "max_copies", "seed",
+        "pdf_files", "pdf_kb", "pdf_share", "cover_files", "cover_kb", "cover_share")}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic books, students and loans.")
+    add_arguments(parser)
+    parser.add_argument("--dsn", default=DB_CONFIG["url"],
+                        help="Postgres connection string (defaults to $DATABASE_URL)")
+    parser.add_argument("--prefix", default="gen_", help="username prefix, e.g. gen_student_1")
+    parser.add_argument("--admins", type=int, default=1)
+    parser.add_argument("--password", default="password", help="password of every generated user")
+    parser.add_argument("--as-of", type=date.fromisoformat, help="date the loan history ends (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=DATAGEN_WORKERS)
+    parser.add_argument("--chunk-rows", type=int, default=DATAGEN_CHUNK_ROWS, help="rows per COPY")
+    args = parser.parse_args()
+
+    summary = generate(args.dsn, admins=args.admins, password=args.password, prefix=args.prefix,
+                       as_of=args.as_of, workers=args.workers, chunk_rows=args.chunk_rows, **generate_options(args))
+    print(summary["rows"], {kind: len(names) for kind, names in summary["files"].items()}, summary["seconds"])
@@ -0,0 +1,133 @@
+# exports.py
+"""
+Streaming CSV / JSON Lines exports of transactions, books and students.
+
+Rows come from a server-side cursor (dao.db.stream_rows) and are encoded in
+small chunks by a generator, so the admin download endpoints and the CLI use
+the same flat amount of memory whatever the size of the loan history.
+
+    python exports.py transactions --from 2024-01-01 --to 2024-12-31 --status returned --include-archive -o 2024.csv
+    python exports.py books --format jsonl --status available
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date
+from dao.book_dao import BookDAO, BOOK_STATUSES
+from dao.transaction_dao import TransactionDAO, TRANSACTION_STATUSES
+from dao.user_dao import UserDAO, STUDENT_STATUSES
+
+# Rows encoded per chunk handed to the response / written to the file
+CHUNK_ROWS = 500
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+EXPORTS = {
+    "transactions": {
+        "columns": ["id", "student_username", "email", "book_id", "title", "isbn",
+                    "borrow_date", "return_date", "is_returned"],
+        "statuses": TRANSACTION_STATUSES,
+        "filters": ("date_from", "date_to", "status", "include_archive"),
+        "rows": lambda **filters: TransactionDAO().iter_transactions(**filters),
+    },
+    "books": {
+        "columns": ["id", "title", "author", "isbn", "category", "description", "is_available",
+                    "cover_image", "pdf_file", "created_at"],
+        "statuses": BOOK_STATUSES,
+        "filters": ("category", "status"),
+        "rows": lambda **filters: BookDAO().iter_books(**filters),
+    },
+    "students": {
+        "columns": ["username", "email", "active_loans"],
+        "statuses": STUDENT_STATUSES,
+        "filters": ("status",),
+        "rows": lambda **filters: UserDAO().iter_students(**filters),
+    },
+}
+
+# ----- Helper functions -----
+def parse_filters(kind: str, args: dict) -> dict:
+    """
+    Validates export filters given as strings (query args or CLI options):
+    from / to (YYYY-MM-DD), status, category and archive ("1": include archived loans).
+    Raises ValueError with a readable message.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export '{kind}'")
+    export = EXPORTS[kind]
+    filters = {}
+    for key, name in (("from", "date_from"), ("to", "date_to")):
+        if args.get(key) and name in export["filters"]:
+            try:
+                filters[name] = date.fromisoformat(args[key])
+            except ValueError:
+                raise ValueError(f"'{key}' must be a date (YYYY-MM-DD)")
+    if filters.get("date_from") and filters.get("date_to") and filters["date_from"] > filters["date_to"]:
+        raise ValueError("'from' must not be after 'to'")
+    status = args.get("status")
+    if status:
+        if status not in export["statuses"]:
+            raise ValueError(f"'status' must be one of: {', '.join(export['statuses'])}")
+        filters["status"] = status
+    if args.get("category") and "category" in export["filters"]:
+        filters["category"] = args["category"]
+    if args.get("archive") == "1" and "include_archive" in export["filters"]:
+        filters["include_archive"] = True
+    return filters
+
+def _encode_value(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+def export_rows(kind: str, fmt: str = "csv", **filters):
+    """Yields the export as text chunks of CHUNK_ROWS rows (CSV starts with a header row)."""
+    columns = EXPORTS[kind]["columns"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(columns)
+    count = 0
+    for row in EXPORTS[kind]["rows"](**filters):
+        if fmt == "csv":
+            writer.writerow([_encode_value(row[column]) for column in columns])
+        else:
+            buffer.write(json.dumps({column: _encode_value(row[column]) for column in columns}) + "\n")
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_filename(kind: str, fmt: str) -> str:
+    return f"{kind}-{date.today().isoformat()}.{fmt}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export transactions, books or students as CSV / JSON Lines.")
+    parser.add_argument("kind", choices=sorted(EXPORTS))
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--from", dest="from_", metavar="YYYY-MM-DD", help="transactions borrowed on or after")
+    parser.add_argument("--to", metavar="YYYY-MM-DD", help="transactions borrowed on or before")
+    parser.add_argument("--status", help="transactions: open/returned/overdue, books: available/borrowed, "
+                                         "students: active/overdue")
+    parser.add_argument("--category", help="books only")
+    parser.add_argument("--include-archive", action="store_true",
+                        help="transactions: also archived loans (see loan_archive.py)")
+    parser.add_argument("-o", "--output", help="file to write (defaults to stdout)")
+    args = parser.parse_args()
+
+    try:
+        export_filters = parse_filters(args.kind, {"from": args.from_, "to": args.to, "status": args.status,
+                                                   "category": args.category,
+                                                   "archive": "1" if args.include_archive else None})
+    except ValueError as e:
+        parser.error(str(e))
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in export_rows(args.kind, args.format, **export_filters):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
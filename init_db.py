@@ -1,79 +1,20 @@
 import psycopg
-import hashlib
 from datetime import date, timedelta
 from config import DB_CONFIG
-
-# Note: For production, consider using a stronger hashing algorithm like bcrypt.
-def hash_password(password: str) -> str:
-    """Hashes a password using SHA-256."""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def column_exists(cursor, table: str, column: str) -> bool:
-    """Checks if a column exists in a given table using a parameterized query."""
-    cursor.execute("""
-        SELECT 1
-        FROM information_schema.columns
-        WHERE table_name=%s AND column_name=%s
-    """, (table, column))
-    return cursor.fetchone() is not None
+from migrations import migrate
+# Seeds use the same bcrypt hashing as registration (users seeded with the old SHA-256
+# hashes are upgraded on their next login)
+from dao.user_dao import hash_password
 
 def init_db():
     """Initializes the database with schema and sample data."""
+    migrate()
+
     # Connect directly to Render PostgreSQL
     conn = psycopg.connect(DB_CONFIG["url"])
     cur = conn.cursor()
 
     try:
-        # Users table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                username VARCHAR(50) PRIMARY KEY,
-                password VARCHAR(255) NOT NULL,
-                user_type VARCHAR(20) CHECK (user_type IN ('Admin','Student')),
-                email VARCHAR(100) UNIQUE
-            )
-        """)
-
-        # Books table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS books (
-                id SERIAL PRIMARY KEY,
-                title VARCHAR(255) NOT NULL,
-                author VARCHAR(255) NOT NULL,
-                isbn VARCHAR(50) UNIQUE NOT NULL,
-                is_available BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Extra book columns
-        extras = {
-            "category": "VARCHAR(100)",
-            "description": "TEXT",
-            "cover_image": "VARCHAR(255)",
-            "pdf_file": "VARCHAR(255)"
-        }
-        for col, col_type in extras.items():
-            if not column_exists(cur, "books", col):
-                # Using a safe method for ALTER TABLE
-                cur.execute(f"ALTER TABLE books ADD COLUMN {col} {col_type}")
-                print(f"🛠️ Added missing column '{col}' to books")
-
-        # Transactions table
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                book_id INT NOT NULL,
-                student_username VARCHAR(50) NOT NULL,
-                borrow_date DATE NOT NULL,
-                return_date DATE NOT NULL,
-                is_returned BOOLEAN DEFAULT FALSE,
-                FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
-                FOREIGN KEY (student_username) REFERENCES users(username) ON DELETE CASCADE,
-                UNIQUE (book_id, student_username, borrow_date) -- Prevents duplicate transactions for same borrow
-            )
-        """)
-
         # Default Admin
         cur.execute("""
             INSERT INTO users (username, password, user_type, email)
@@ -101,12 +42,12 @@ def init_db():
             ("Romantic Escapes", "Emily Rose", "Romance", "ISBN003",
              "A beautiful love story.", "romantic.jpg", "romantic.pdf"),
         ]
-        for title, author, category, isbn, desc, cover, pdf in books:
-            cur.execute("""
-                INSERT INTO books (title, author, category, isbn, description, cover_image, pdf_file)
-                VALUES (%s,%s,%s,%s,%s,%s,%s)
-                ON CONFLICT (isbn) DO NOTHING
-            """, (title, author, category, isbn, desc, cover, pdf))
+        # Larger catalogs: python catalog_import.py books.csv
+        cur.executemany("""
+            INSERT INTO books (title, author, category, isbn, description, cover_image, pdf_file)
+            VALUES (%s,%s,%s,%s,%s,%s,%s)
+            ON CONFLICT (isbn) DO NOTHING
+        """, books)
 
         # Sample Transactions
         transactions = [
@@ -124,6 +65,16 @@ def init_db():
                 ON CONFLICT (book_id, student_username, borrow_date) DO NOTHING
             """, (book_id, student_username, borrow_date, return_date, is_returned))
 
+        # One copy of each sample book, out with its open loan if it has one
+        cur.execute("""
+            INSERT INTO book_copies (book_id, copy_no, status)
+            SELECT b.id, 1, CASE WHEN EXISTS (SELECT 1 FROM transactions t
+                                              WHERE t.book_id = b.id AND t.is_returned = FALSE)
+                                 THEN 'loaned' ELSE 'shelf' END
+            FROM books b WHERE b.isbn = ANY(%s)
+            ON CONFLICT DO NOTHING
+        """, ([book[3] for book in books],))
+
         conn.commit()
         print("✅ DB initialized with schema + default admin + sample data")
 
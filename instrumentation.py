@@ -0,0 +1,375 @@
+# instrumentation.py
+"""
+Request-level query instrumentation, slow-query log and Prometheus metrics.
+
+Every statement run through the pools goes through InstrumentedCursor /
+InstrumentedAsyncCursor (see dao/db.py and dao/async_db.py), every DAO method
+through @instrument_dao, and every Flask request through instrument_app(app).
+Per request this records the number of statements, total database time, time
+spent waiting for a pooled connection, the slowest statement (with the shape
+of its parameters, never their values) and template render time, and prints
+one JSON line when the request ends (REQUEST_LOG):
+
+    {"event": "request", "method": "GET", "route": "/admin", "status": 200, "ms": 41.2,
+     "queries": 3, "db_ms": 12.5, "connect_ms": 0.1, "render_ms": 6.3, "slowest": {...}}
+
+Statements slower than SLOW_QUERY_MS are printed as "slow_query" events with
+their EXPLAIN plan (SLOW_QUERY_EXPLAIN).
+
+GET /metrics serves latency histograms per route and per DAO method, query
+counters and pool wait times in the Prometheus text format. Metrics live in
+each gunicorn worker; with METRICS_DIR set, workers also write snapshots there
+and /metrics sums them all (clear the directory when redeploying).
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import psycopg
+from psycopg.rows import tuple_row
+from flask import request, session, abort, Response, before_render_template, template_rendered
+from config import REQUEST_LOG, SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN, METRICS_DIR, METRICS_TOKEN
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name -> (type, help, label names)
+METRICS = {
+    "elibrary_http_request_duration_seconds": ("histogram", "Request latency per route.", ("method", "route")),
+    "elibrary_http_requests_total": ("counter", "Requests per route and status.", ("method", "route", "status")),
+    "elibrary_dao_call_duration_seconds": ("histogram", "DAO method latency.", ("dao", "method")),
+    "elibrary_db_queries_total": ("counter", "Statements executed per DAO method.", ("dao", "method")),
+    "elibrary_db_query_seconds_total": ("counter", "Time spent in statements per DAO method.", ("dao", "method")),
+    "elibrary_db_slow_queries_total": ("counter", "Statements slower than SLOW_QUERY_MS.", ("dao", "method")),
+    "elibrary_db_pool_wait_seconds": ("histogram", "Time waiting for a pooled connection.", ("pool",)),
+    "elibrary_template_render_seconds": ("histogram", "Template render time.", ("template",)),
+}
+
+# Statement types EXPLAIN accepts
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|VALUES)\b", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+STATEMENT_LOG_CHARS = 500
+
+# Stats of the request being served, and the DAO method running, in this context
+_request = contextvars.ContextVar("request_stats", default=None)
+_dao_method = contextvars.ContextVar("dao_method", default=("-", "-"))
+
+# ----- Metric registry (per process) -----
+class Registry:
+    """Counters and fixed-bucket histograms keyed by (metric name, label values)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, name: str, labels: tuple, amount: float = 1) -> None:
+        with self._lock:
+            self._series[(name, labels)] = self._series.get((name, labels), 0) + amount
+
+    def observe(self, name: str, labels: tuple, seconds: float) -> None:
+        """Histogram data: one count per bucket (non-cumulative), then +Inf, then the sum."""
+        with self._lock:
+            data = self._series.get((name, labels))
+            if data is None:
+                data = self._series[(name, labels)] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    data[index] += 1
+                    break
+            else:
+                data[-2] += 1
+            data[-1] += seconds
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[name, list(labels), list(data) if isinstance(data, list) else data]
+                    for (name, labels), data in self._series.items()]
+
+registry = Registry()
+_last_flush = [0.0]
+
+def _merge(snapshots) -> dict:
+    merged = {}
+    for snapshot in snapshots:
+        for name, labels, data in snapshot:
+            key = (name, tuple(labels))
+            if key not in merged:
+                merged[key] = list(data) if isinstance(data, list) else data
+            elif isinstance(data, list):
+                merged[key] = [a + b for a, b in zip(merged[key], data)]
+            else:
+                merged[key] += data
+    return merged
+
+def _label_text(names, values, le: str = None) -> str:
+    pairs = [(name, str(value)) for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(("le", le))
+    escaped = ('{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}" if pairs else ""
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format (summed over METRICS_DIR snapshots)."""
+    snapshots = [registry.snapshot()]
+    if METRICS_DIR:
+        flush_metrics(force=True)
+        snapshots = []
+        for name in os.listdir(METRICS_DIR):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(METRICS_DIR, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # being replaced right now
+    merged = _merge(snapshots)
+
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), data in sorted(merged.items()):
+            if metric != name:
+                continue
+            if kind == "counter":
+                lines.append(f"{name}{_label_text(label_names, labels)} {data:g}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, data):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(label_names, labels, f'{bound:g}')} {cumulative}")
+            cumulative += data[-2]
+            lines.append(f"{name}_bucket{_label_text(label_names, labels, '+Inf')} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(label_names, labels)} {data[-1]:.6f}")
+            lines.append(f"{name}_count{_label_text(label_names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def flush_metrics(force: bool = False) -> None:
+    """Writes this process's snapshot to METRICS_DIR (at most once a second unless forced)."""
+    now = time.monotonic()
+    if not METRICS_DIR or (not force and now - _last_flush[0] < 1):
+        return
+    _last_flush[0] = now
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(temp_path, os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+
+# ----- Per-request stats -----
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.connect_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_started = None
+        self.slowest = None
+        self.status = 500  # until after_request sees the response
+
+def params_shape(params):
+    """Types (and string lengths) of statement parameters: enough to reproduce a plan, no values."""
+    def shape(value):
+        if isinstance(value, str):
+            return f"str({len(value)})"
+        if isinstance(value, (list, tuple)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: shape(value) for key, value in params.items()}
+    return [shape(value) for value in params]
+
+def statement_text(query, cursor) -> str:
+    if not isinstance(query, str):
+        query = query.as_string(cursor)
+    return WHITESPACE.sub(" ", query).strip()[:STATEMENT_LOG_CHARS]
+
+def _record_statement(cursor, query, params, seconds: float):
+    """Counts a statement; returns its text if it is slow enough to be explained, else None."""
+    dao, method = _dao_method.get()
+    registry.inc("elibrary_db_queries_total", (dao, method))
+    registry.inc("elibrary_db_query_seconds_total", (dao, method), seconds)
+    stats = _request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+        if stats.slowest is None or seconds > stats.slowest["seconds"]:
+            stats.slowest = {"seconds": seconds, "statement": statement_text(query, cursor),
+                             "params": params_shape(params), "dao": f"{dao}.{method}"}
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        registry.inc("elibrary_db_slow_queries_total", (dao, method))
+        return statement_text(query, cursor)
+    return None
+
+def _log_slow(statement: str, params, seconds: float, plan) -> None:
+    dao, method = _dao_method.get()
+    print(json.dumps({"event": "slow_query", "ms": round(seconds * 1000, 2), "dao": f"{dao}.{method}",
+                      "statement": statement, "params": params_shape(params), "plan": plan}), flush=True)
+
+def record_pool_wait(pool: str, seconds: float) -> None:
+    registry.observe("elibrary_db_pool_wait_seconds", (pool,), seconds)
+    stats = _request.get()
+    if stats is not None:
+        stats.connect_seconds += seconds
+
+# ----- Cursors -----
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor that times every statement (used as the pools' cursor_factory)."""
+
+    def execute(self, query, params=None, **kwargs):
+        if not query:  # the pool's connection check; not a statement of the app
+            return super().execute(query, params, **kwargs)
+        start = time.perf_counter()
+        result = super().execute(query, params, **kwargs)
+        seconds = time.perf_counter() - start
+        slow = _record_statement(self, query, params, seconds)
+        if slow:
+            _log_slow(slow, params, seconds, self._explain(query, params, slow))
+        return result
+
+    def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        result = super().executemany(query, params_seq, **kwargs)
+        seconds = time.perf_counter() - start
+        if _record_statement(self, query, None, seconds):
+            _log_slow(statement_text(query, self), None, seconds, None)  # a batch: no single plan
+        return result
+
+    def _explain(self, query, params, text: str):
+        if not SLOW_QUERY_EXPLAIN or not EXPLAINABLE.match(text):
+            return None
+        try:
+            # In a savepoint, so a statement EXPLAIN rejects cannot abort the caller's transaction
+            with self.connection.transaction():
+                with psycopg.Cursor(self.connection, row_factory=tuple_row) as cursor:
+                    cursor.execute(b"EXPLAIN " + (query.encode() if isinstance(query, str)
+                                                  else query.as_bytes(self)), params)
+                    return [row[0] for row in cursor.fetchall()]
+        except psycopg.Error as e:
+            return [f"EXPLAIN failed: {e}"]
+
+class InstrumentedAsyncCursor(psycopg.AsyncCursor):
+    """Async twin of InstrumentedCursor (used by the async pool)."""
+
+    async def execute(self, query, params=None, **kwargs):
+        if not query:
+            return await super().execute(query, params, **kwargs)
+        start = time.perf_counter()
+        result = await super().execute(query, params, **kwargs)
+        seconds = time.perf_counter() - start
+        slow = _record_statement(self, query, params, seconds)
+        if slow:
+            _log_slow(slow, params, seconds, await self._explain(query, params, slow))
+        return result
+
+    async def _explain(self, query, params, text: str):
+        if not SLOW_QUERY_EXPLAIN or not EXPLAINABLE.match(text):
+            return None
+        try:
+            async with self.connection.transaction():
+                async with psycopg.AsyncCursor(self.connection, row_factory=tuple_row) as cursor:
+                    await cursor.execute(b"EXPLAIN " + (query.encode() if isinstance(query, str)
+                                                        else query.as_bytes(self)), params)
+                    return [row[0] for row in await cursor.fetchall()]
+        except psycopg.Error as e:
+            return [f"EXPLAIN failed: {e}"]
+
+# ----- DAO methods -----
+def instrument_dao(cls):
+    """Class decorator timing the public methods a DAO class defines, and tagging their statements."""
+    for name, function in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(function):
+            continue
+        setattr(cls, name, _timed(cls.__name__, name, function))
+    return cls
+
+def _timed(dao: str, method: str, function):
+    labels = (dao, method)
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            token = _dao_method.set(labels)
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                registry.observe("elibrary_dao_call_duration_seconds", labels, time.perf_counter() - start)
+                _dao_method.reset(token)
+        return wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _dao_method.set(labels)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            registry.observe("elibrary_dao_call_duration_seconds", labels, time.perf_counter() - start)
+            _dao_method.reset(token)
+    return wrapper
+
+# ----- Flask -----
+def instrument_app(app) -> None:
+    """Registers the request hooks, template timing and the /metrics endpoint."""
+    @app.before_request
+    def start_request_stats():
+        _request.set(RequestStats())
+
+    @app.after_request
+    def record_status(response):
+        stats = _request.get()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_stats(exc):
+        stats = _request.get()
+        if stats is None:
+            return
+        _request.set(None)
+        seconds = time.perf_counter() - stats.start
+        route = request.url_rule.rule if request.url_rule else "unmatched"  # bounded label values
+        registry.observe("elibrary_http_request_duration_seconds", (request.method, route), seconds)
+        registry.inc("elibrary_http_requests_total", (request.method, route, str(stats.status)))
+        flush_metrics()
+        if REQUEST_LOG and request.endpoint != "static":
+            slowest = stats.slowest
+            if slowest:
+                slowest = dict(slowest, ms=round(slowest.pop("seconds") * 1000, 2))
+            print(json.dumps({"event": "request", "method": request.method, "route": route,
+                              "path": request.path, "status": stats.status, "ms": round(seconds * 1000, 2),
+                              "queries": stats.queries, "db_ms": round(stats.db_seconds * 1000, 2),
+                              "connect_ms": round(stats.connect_seconds * 1000, 2),
+                              "render_ms": round(stats.render_seconds * 1000, 2), "slowest": slowest}),
+                  flush=True)
+
+    def render_started(sender, template, context, **extra):
+        stats = _request.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        stats = _request.get()
+        if stats is not None and stats.render_started is not None:
+            seconds = time.perf_counter() - stats.render_started
+            stats.render_started = None
+            stats.render_seconds += seconds
+            registry.observe("elibrary_template_render_seconds", (template.name,), seconds)
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        token = request.headers.get("Authorization", "")
+        if not ((METRICS_TOKEN and token == f"Bearer {METRICS_TOKEN}") or session.get('user_type') == 'Admin'):
+            abort(403)
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,287 @@
+# loan_archive.py
+"""
+Archival of the loan history.
+
+transactions is partitioned by borrow month (transactions_y2025m01, ...; see
+migrations 11-13 in migrations.py) and the listings read it alone unless asked to
+include the archive (TransactionDAO's include_archive). Each run:
+
+1. creates the partitions of the next TRANSACTION_PARTITIONS_AHEAD months, so new
+   loans always have one (so do the clock's hourly upkeep and the overdue run),
+2. moves the returned loans of every month before the last ARCHIVE_AFTER_MONTHS
+   to transactions_archive, partitioned the same way.
+
+A month without open loans is moved whole: its partition is detached concurrently,
+so borrows and returns carry on meanwhile, and attached to the archive without
+copying a row. A month that still has open loans keeps them in transactions and
+has its returned loans copied over; its partition follows once they are returned.
+A run that was interrupted half-way is completed by the next one.
+
+A database upgraded from the unpartitioned table keeps it as one partition,
+transactions_legacy, holding every loan up to the month after the upgrade. Its
+returned loans leave for the archive in batches of ARCHIVE_BATCH_SIZE, one
+transaction each, as their months pass the horizon; the table is dropped once
+its whole range has and no open loan is left in it.
+
+Moving a partition adds or drops the foreign key triggers on books and users, so
+each move locks both for a few milliseconds (no rows are scanned meanwhile). The
+job waits at most ARCHIVE_LOCK_TIMEOUT for those locks, well under Postgres's
+deadlock_timeout, and backs off and retries rather than stall or break borrows.
+
+The clock process runs it daily (maintenance.py); by hand:  python loan_archive.py [--after-months N] [--dry-run]
+"""
+import argparse
+import re
+import time
+from datetime import date, timedelta
+import psycopg
+from config import (DB_CONFIG, ARCHIVE_AFTER_MONTHS, TRANSACTION_PARTITIONS_AHEAD, ARCHIVE_BATCH_SIZE,
+                    ARCHIVE_LOCK_TIMEOUT, ARCHIVE_LOCK_RETRIES, ARCHIVE_LOCK_BACKOFF)
+from dao.transaction_dao import CREATE_PARTITIONS_SQL
+
+# Advisory lock key so two archive runs never move the same month
+ARCHIVE_JOB_LOCK = 7_310_002
+
+HOT_TABLE = "transactions"
+ARCHIVE_TABLE = "transactions_archive"
+LEGACY_TABLE = "transactions_legacy"  # the table from before partitioning (migration 13)
+LOAN_COLUMNS = "id, book_id, student_username, borrow_date, return_date, is_returned"
+PARTITION_MONTH = re.compile(r"_y(\d{4})m(\d{2})$")  # suffix given by library_create_partitions
+# Taken first by every move, always in the order borrows take them, so the two never deadlock
+LOCK_REFERENCED_SQL = "LOCK TABLE users, books IN {mode} MODE"
+
+# ----- Helper functions -----
+def partition_month(name: str) -> date:
+    year, month = PARTITION_MONTH.search(name).groups()
+    return date(int(year), int(month), 1)
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def partitions(conn, parent: str) -> dict:
+    """{first day of the month: (partition name, detach pending)} of a partitioned table's monthly partitions."""
+    rows = conn.execute("""
+        SELECT c.relname, h.inhdetachpending
+        FROM pg_inherits h JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = %s::regclass
+    """, (parent,)).fetchall()
+    return {partition_month(name): (name, pending) for name, pending in rows if PARTITION_MONTH.search(name)}
+
+def detached_partitions(conn) -> list:
+    """Former partitions of transactions that an interrupted run detached but did not archive."""
+    rows = conn.execute("""
+        SELECT c.relname FROM pg_class c
+        WHERE c.relkind = 'r' AND NOT c.relispartition AND c.relname ~ '^transactions_y[0-9]{4}m[0-9]{2}$'
+          AND c.relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = 'transactions'::regclass)
+    """).fetchall()
+    return [name for name, in rows]
+
+def with_lock_retries(conn, move, *args):
+    """Runs move(conn, *args), retrying with exponential backoff while books or users are too busy to lock."""
+    for attempt in range(ARCHIVE_LOCK_RETRIES + 1):
+        try:
+            return move(conn, *args)
+        except (psycopg.errors.LockNotAvailable, psycopg.errors.DeadlockDetected):
+            if attempt == ARCHIVE_LOCK_RETRIES:
+                raise
+            time.sleep(ARCHIVE_LOCK_BACKOFF * (2 ** attempt))
+
+def detach(conn, name: str) -> None:
+    """Detaches a partition of transactions without blocking borrows, or finishes a detach that was interrupted."""
+    pending = conn.execute("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = %s::regclass",
+                           (name,)).fetchone()[0]
+    conn.execute(f"ALTER TABLE {HOT_TABLE} DETACH PARTITION {name} {'FINALIZE' if pending else 'CONCURRENTLY'}")
+
+def create_partitions(conn) -> int:
+    return conn.execute(CREATE_PARTITIONS_SQL, (TRANSACTION_PARTITIONS_AHEAD,)).fetchone()[0]
+
+def create_archive_partitions(conn, first: date, last: date) -> None:
+    """Creates the archive's missing partitions from first's month to last's."""
+    with conn.transaction():
+        conn.execute(LOCK_REFERENCED_SQL.format(mode="SHARE ROW EXCLUSIVE"))
+        conn.execute("SELECT library_create_partitions(%s, %s, %s)", (ARCHIVE_TABLE, first, last))
+
+def copy_detached(conn, name: str) -> None:
+    """Copies a detached partition into the archive and empties it, in one transaction."""
+    with conn.transaction():
+        conn.execute(f"INSERT INTO {ARCHIVE_TABLE} ({LOAN_COLUMNS}) SELECT {LOAN_COLUMNS} FROM {name}")
+        conn.execute(f"TRUNCATE {name}")
+
+def drop_detached(conn, name: str) -> None:
+    with conn.transaction():
+        # Dropping the table drops its foreign key triggers on books and users
+        conn.execute(LOCK_REFERENCED_SQL.format(mode="ACCESS EXCLUSIVE"))
+        conn.execute(f"DROP TABLE {name}")
+
+def attach_to_archive(conn, name: str, month: date) -> None:
+    """Attaches a detached partition to the archive as its partition of that month."""
+    with conn.transaction():
+        # Attaching merges the table's foreign keys into the archive's, dropping their triggers
+        conn.execute(LOCK_REFERENCED_SQL.format(mode="ACCESS EXCLUSIVE"))
+        archived = ARCHIVE_TABLE + name[len(HOT_TABLE):]
+        conn.execute(f"ALTER TABLE {name} RENAME TO {archived}")
+        # DETACH ... CONCURRENTLY left a CHECK of the month's bounds, so no rows are scanned
+        conn.execute(f"ALTER TABLE {ARCHIVE_TABLE} ATTACH PARTITION {archived} "
+                     f"FOR VALUES FROM ('{month}') TO ('{next_month(month)}')")
+        # The open-loan indexes have no counterpart in the archive
+        unattached = conn.execute("""
+            SELECT i.indexrelid::regclass::text FROM pg_index i
+            WHERE i.indrelid = %s::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)
+        """, (archived,)).fetchall()
+        for index, in unattached:
+            conn.execute(f"DROP INDEX {index}")
+
+def archive_detached(conn, name: str) -> int:
+    """
+    Moves a partition detached from transactions into the archive: attached as the
+    archive's partition of that month, or copied into it if the archive already has one
+    (returned loans of the month were archived while others were still open). Only the
+    attach or drop itself runs under the lock on books and users; the rows are counted
+    and copied before. Returns the number of loans moved.
+    """
+    month = partition_month(name)
+    # Nothing writes to a detached partition, so the count holds
+    loans = conn.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+    if month in partitions(conn, ARCHIVE_TABLE):
+        with_lock_retries(conn, copy_detached, name)
+        with_lock_retries(conn, drop_detached, name)
+    else:
+        with_lock_retries(conn, attach_to_archive, name, month)
+    return loans
+
+def copy_returned(conn, name: str) -> int:
+    """Moves the returned loans of a partition of transactions row by row. Returns the number moved."""
+    with conn.transaction():
+        return conn.execute(f"""
+            WITH moved AS (
+                DELETE FROM {name} WHERE is_returned RETURNING {LOAN_COLUMNS}
+            )
+            INSERT INTO {ARCHIVE_TABLE} ({LOAN_COLUMNS}) SELECT {LOAN_COLUMNS} FROM moved
+        """).rowcount
+
+def archive_month(conn, name: str) -> tuple:
+    """Archives the returned loans of one partition of transactions. Returns (loans moved, open loans kept)."""
+    open_loans = conn.execute(f"SELECT count(*) FROM {name} WHERE is_returned = FALSE").fetchone()[0]
+    if not open_loans:
+        with_lock_retries(conn, detach, name)
+        return archive_detached(conn, name), 0
+    month = partition_month(name)
+    if month not in partitions(conn, ARCHIVE_TABLE):
+        with_lock_retries(conn, create_archive_partitions, month, month)
+    return with_lock_retries(conn, copy_returned, name), open_loans
+
+def copy_legacy_batch(conn, horizon: date) -> int:
+    """Moves up to ARCHIVE_BATCH_SIZE returned loans before horizon out of transactions_legacy, oldest first."""
+    with conn.transaction():
+        return conn.execute(f"""
+            WITH moved AS (
+                DELETE FROM {LEGACY_TABLE} WHERE (id, borrow_date) IN (
+                    SELECT id, borrow_date FROM {LEGACY_TABLE}
+                    WHERE is_returned AND borrow_date < %s
+                    ORDER BY borrow_date LIMIT %s
+                )
+                RETURNING {LOAN_COLUMNS}
+            )
+            INSERT INTO {ARCHIVE_TABLE} ({LOAN_COLUMNS}) SELECT {LOAN_COLUMNS} FROM moved
+        """, (horizon, ARCHIVE_BATCH_SIZE)).rowcount
+
+def archive_legacy(conn, horizon: date) -> tuple:
+    """
+    Archives the returned loans before horizon of transactions_legacy, one batch per
+    transaction, and drops the table once its range is past horizon and it is empty.
+    Returns (loans moved, open loans kept before horizon).
+    """
+    legacy = conn.execute("""
+        SELECT c.relispartition, pg_get_constraintdef(k.oid)
+        FROM pg_class c JOIN pg_constraint k ON k.conrelid = c.oid AND k.conname = 'transactions_legacy_bound'
+        WHERE c.oid = to_regclass(%s)
+    """, (LEGACY_TABLE,)).fetchone()
+    if legacy is None:
+        return 0, 0
+    attached, bound = legacy
+    bound = date.fromisoformat(re.search(r"\d{4}-\d{2}-\d{2}", bound).group())  # migration 11's CHECK
+    moved = 0
+    first = conn.execute(f"SELECT min(borrow_date) FROM {LEGACY_TABLE} WHERE is_returned AND borrow_date < %s",
+                         (horizon,)).fetchone()[0]
+    if first:
+        archived = partitions(conn, ARCHIVE_TABLE)
+        month = first.replace(day=1)
+        while month < horizon and month in archived:
+            month = next_month(month)
+        if month < horizon:
+            with_lock_retries(conn, create_archive_partitions, month, horizon - timedelta(days=1))
+        while True:
+            batch = with_lock_retries(conn, copy_legacy_batch, horizon)
+            moved += batch
+            if batch < ARCHIVE_BATCH_SIZE:
+                break
+    open_loans = conn.execute(f"SELECT count(*) FROM {LEGACY_TABLE} WHERE is_returned = FALSE AND borrow_date < %s",
+                              (horizon,)).fetchone()[0]
+    if bound <= horizon and not conn.execute(f"SELECT EXISTS (SELECT 1 FROM {LEGACY_TABLE})").fetchone()[0]:
+        # Nothing can be added to it any more: its dates are past
+        if attached:
+            with_lock_retries(conn, detach, LEGACY_TABLE)
+        with_lock_retries(conn, drop_detached, LEGACY_TABLE)
+    return moved, open_loans
+
+# ----- Job -----
+def archive_loans(conninfo: str = None, after_months: int = ARCHIVE_AFTER_MONTHS, dry_run: bool = False) -> dict:
+    """
+    Creates the upcoming partitions and archives the returned loans of every month before
+    the last after_months. Returns the counts: partitions_created, months archived,
+    loans_archived, open_loans_kept (in those months, left in transactions) and skipped
+    (another run is in progress). With dry_run nothing changes and the counts say what
+    would be archived.
+    """
+    result = {"partitions_created": 0, "months": 0, "loans_archived": 0, "open_loans_kept": 0, "skipped": False}
+    with psycopg.connect(conninfo or DB_CONFIG["url"], autocommit=True) as conn:
+        if not conn.execute("SELECT pg_try_advisory_lock(%s)", (ARCHIVE_JOB_LOCK,)).fetchone()[0]:
+            result["skipped"] = True
+            return result
+        try:
+            conn.execute("SELECT set_config('lock_timeout', %s, false)", (f"{int(ARCHIVE_LOCK_TIMEOUT * 1000)}ms",))
+            horizon = conn.execute("SELECT date_trunc('month', CURRENT_DATE - make_interval(months => %s))::date",
+                                   (after_months,)).fetchone()[0]
+            if dry_run:
+                returned, open_loans = conn.execute(f"""
+                    SELECT count(*) FILTER (WHERE is_returned), count(*) FILTER (WHERE is_returned = FALSE)
+                    FROM {HOT_TABLE} WHERE borrow_date < %s
+                """, (horizon,)).fetchone()
+                result.update(months=sum(1 for month in partitions(conn, HOT_TABLE) if month < horizon),
+                              loans_archived=returned, open_loans_kept=open_loans)
+                return result
+
+            result["partitions_created"] = with_lock_retries(conn, create_partitions)
+            for name, pending in partitions(conn, HOT_TABLE).values():
+                if pending:
+                    with_lock_retries(conn, detach, name)
+            for name in detached_partitions(conn):
+                result["loans_archived"] += archive_detached(conn, name)
+
+            moved, kept = archive_legacy(conn, horizon)
+            result["loans_archived"] += moved
+            result["open_loans_kept"] += kept
+            for month, (name, _) in sorted(partitions(conn, HOT_TABLE).items()):
+                if month >= horizon:
+                    break
+                moved, kept = archive_month(conn, name)
+                result["months"] += 1
+                result["loans_archived"] += moved
+                result["open_loans_kept"] += kept
+            if result["loans_archived"]:
+                # Autovacuum never analyzes a partitioned table itself, only its partitions
+                conn.execute(f"ANALYZE {HOT_TABLE}")
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (ARCHIVE_JOB_LOCK,))
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move returned loans older than a few months to the loan archive.")
+    parser.add_argument("--after-months", type=int, default=ARCHIVE_AFTER_MONTHS,
+                        help="months of loan history kept in transactions besides the current one")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be archived")
+    args = parser.parse_args()
+    if args.after_months < 0:
+        parser.error("--after-months must not be negative")
+    print(archive_loans(after_months=args.after_months, dry_run=args.dry_run))
@@ -0,0 +1,201 @@
+# mailer.py
+"""
+Background overdue-notice pipeline.
+
+The admin route only enqueues a job; the job runs on a background thread and
+sends the notices through SMTP_CONCURRENCY worker threads, each reusing one
+authenticated SMTP session for many messages. Transient failures are retried
+with exponential backoff and every notice's outcome is recorded in
+overdue_notifications, so a rerun only picks up what was not delivered.
+
+Can also be run from cron / a one-off dyno:  python mailer.py
+For local testing point it at a stand-in server, e.g. `python -m aiosmtpd -n -l localhost:8025`
+with SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_USE_TLS=0.
+"""
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from config import (EMAIL_ADDRESS, EMAIL_PASSWORD, SMTP_SERVER, SMTP_PORT, SMTP_USE_TLS, SMTP_TIMEOUT,
+                    SMTP_CONCURRENCY, SMTP_MAX_RETRIES, SMTP_RETRY_BACKOFF)
+from dao.notification_dao import NotificationDAO
+
+notification_dao = NotificationDAO()
+
+# One overdue job at a time per process; the advisory lock covers other workers
+_job_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="overdue-job")
+_job_state = {"running": False, "last_result": None}
+_job_state_lock = threading.Lock()
+
+# ----- Helper functions -----
+def build_overdue_message(notice: dict) -> EmailMessage:
+    """Builds the overdue notice for one pending loan row."""
+    msg = EmailMessage()
+    msg['Subject'] = f"Overdue notice for '{notice['title']}'"
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = notice['email']
+    msg.set_content(
+        f"Dear {notice['student_username']},\n"
+        f"Your borrowed book '{notice['title']}' was due on {notice['return_date']}. "
+        f"Please return it as soon as possible."
+    )
+    return msg
+
+def is_transient(error: Exception) -> bool:
+    """True for failures worth retrying: dropped connections, timeouts and 4xx replies."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+def delivery_status(error: Exception) -> str:
+    """
+    'rejected' when the server permanently refused this particular message/recipient,
+    otherwise 'failed' (retried on the next run, e.g. outages or bad credentials).
+    """
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)) and not is_transient(error):
+        return "rejected"
+    return "failed"
+
+# ----- SMTP session -----
+class SMTPSession:
+    """A lazily opened, reusable SMTP connection that reconnects after a drop."""
+
+    def __init__(self):
+        self.smtp = None
+
+    def _open(self):
+        smtp = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            smtp.ehlo()
+            if SMTP_USE_TLS:
+                smtp.starttls()
+                smtp.ehlo()
+            if EMAIL_ADDRESS and EMAIL_PASSWORD and smtp.has_extn("auth"):
+                smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        except Exception:
+            smtp.close()  # not stored yet, so nothing else would close it
+            raise
+        return smtp
+
+    def send(self, msg: EmailMessage) -> None:
+        if self.smtp is None:
+            self.smtp = self._open()
+        try:
+            self.smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+def send_with_retry(session: SMTPSession, msg: EmailMessage) -> None:
+    """Sends one message, retrying transient failures with exponential backoff."""
+    for attempt in range(SMTP_MAX_RETRIES + 1):
+        try:
+            session.send(msg)
+            return
+        except Exception as e:
+            if attempt == SMTP_MAX_RETRIES or not is_transient(e):
+                raise
+            time.sleep(SMTP_RETRY_BACKOFF * (2 ** attempt))
+
+# ----- Job -----
+def run_overdue_job() -> dict:
+    """
+    Sends every pending overdue notice and returns counts per outcome.
+    Safe to rerun: notices already sent (or permanently rejected) are skipped.
+    Rejected credentials stop the whole run ("error" in the result) instead of being
+    retried for every notice, which could get the sender account locked; the notices
+    not sent stay pending.
+    """
+    result = {"sent": 0, "failed": 0, "rejected": 0, "skipped": False}
+    with notification_dao.overdue_job_lock() as acquired:
+        if not acquired:
+            result["skipped"] = True  # another worker is already sending
+            return result
+
+        pending = notification_dao.get_pending_overdue()
+        work = queue.Queue()
+        for notice in pending:
+            work.put(notice)
+        result_lock = threading.Lock()
+        auth_failed = threading.Event()
+
+        def sender():
+            session = SMTPSession()
+            try:
+                while not auth_failed.is_set():
+                    try:
+                        notice = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        send_with_retry(session, build_overdue_message(notice))
+                        status, error = "sent", None
+                    except smtplib.SMTPAuthenticationError as e:
+                        with result_lock:
+                            if not auth_failed.is_set():
+                                auth_failed.set()
+                                result["error"] = f"SMTP login rejected: {e}"
+                                print(f"SMTP login rejected, stopping the overdue run: {e}")
+                        return
+                    except Exception as e:
+                        status = delivery_status(e)
+                        error = str(e)
+                        print(f"Failed to send overdue notice for transaction {notice['transaction_id']}: {e}")
+                    try:
+                        notification_dao.record_delivery(notice["transaction_id"], status, error)
+                    except Exception as e:
+                        print(f"Error recording overdue notice for transaction {notice['transaction_id']}: {e}")
+                    with result_lock:
+                        result[status] += 1
+            finally:
+                session.close()
+
+        workers = min(SMTP_CONCURRENCY, len(pending))
+        threads = [threading.Thread(target=sender, name=f"smtp-sender-{i}") for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return result
+
+def _run_in_background() -> None:
+    try:
+        result = run_overdue_job()
+    except Exception as e:
+        print(f"Overdue job failed: {e}")
+        result = {"error": str(e)}
+    with _job_state_lock:
+        _job_state["running"] = False
+        _job_state["last_result"] = result
+
+def enqueue_overdue_job() -> bool:
+    """
+    Starts an overdue run in the background and returns immediately.
+    Returns False if a run is already in progress in this process.
+    """
+    with _job_state_lock:
+        if _job_state["running"]:
+            return False
+        _job_state["running"] = True
+    _job_executor.submit(_run_in_background)
+    return True
+
+def job_status() -> dict:
+    """Returns whether a run is in progress and the result of the last one, for monitoring."""
+    with _job_state_lock:
+        return dict(_job_state)
+
+if __name__ == "__main__":
+    print(run_overdue_job())
@@ -0,0 +1,64 @@
+# maintenance.py
+"""
+Scheduled database upkeep: the Procfile's clock process.
+
+Runs each job at start-up and then every so often, so none of it waits for an
+admin to click "send overdue" or for a cron nobody set up:
+
+- partitions  creates the loan history's upcoming monthly partitions
+              (TransactionDAO.create_partitions), every MAINTENANCE_INTERVAL
+- holds       lapses ready holds not collected by their ready_until date, so the copy
+              moves on to the next student in line (HoldDAO.expire_holds), every MAINTENANCE_INTERVAL
+- archive     moves old returned loans to the archive (loan_archive.py), every ARCHIVE_INTERVAL
+
+A failing job is reported and tried again at its next turn. The jobs are safe to
+run from several processes at once. The release phase runs the partitions job
+once, so a deploy never starts without this month's partition.
+
+    python maintenance.py                   # the clock process
+    python maintenance.py --once partitions
+"""
+import argparse
+import time
+from config import MAINTENANCE_INTERVAL, ARCHIVE_INTERVAL
+from dao.hold_dao import HoldDAO
+from dao.transaction_dao import TransactionDAO
+from loan_archive import archive_loans
+
+transaction_dao = TransactionDAO()
+hold_dao = HoldDAO()
+
+# name -> (seconds between runs, job)
+JOBS = {
+    "partitions": (MAINTENANCE_INTERVAL, transaction_dao.create_partitions),
+    "holds": (MAINTENANCE_INTERVAL, hold_dao.expire_holds),
+    "archive": (ARCHIVE_INTERVAL, archive_loans),
+}
+
+# ----- Helper functions -----
+def run_job(name: str) -> None:
+    try:
+        print(f"Maintenance job {name}: {JOBS[name][1]()}", flush=True)
+    except Exception as e:
+        print(f"Error running maintenance job {name}: {e}", flush=True)
+
+def run_forever() -> None:
+    """Runs every job now and then each one again once its interval has passed."""
+    due = dict.fromkeys(JOBS, 0.0)
+    while True:
+        for name, (interval, _) in JOBS.items():
+            if time.monotonic() >= due[name]:
+                run_job(name)
+                due[name] = time.monotonic() + interval
+        time.sleep(max(0.0, min(due.values()) - time.monotonic()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the scheduled database upkeep.")
+    parser.add_argument("--once", nargs="+", choices=sorted(JOBS), metavar="JOB",
+                        help=f"run these jobs once and exit ({', '.join(JOBS)})")
+    args = parser.parse_args()
+    if args.once:
+        for job in args.once:
+            run_job(job)
+    else:
+        run_forever()
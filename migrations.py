@@ -0,0 +1,741 @@
+# migrations.py
+"""
+Versioned schema migrations.
+
+Each migration runs once and is recorded in schema_migrations. Statements are
+written to be idempotent (IF NOT EXISTS / OR REPLACE) so databases created by the
+old ad-hoc init_db.py upgrade cleanly. Index-only migrations are built with
+CREATE INDEX CONCURRENTLY outside a transaction, so they do not block writes on
+a live catalog; an index left INVALID by an interrupted build is dropped and rebuilt.
+A migration's transaction waits at most LOCK_TIMEOUT for each lock and is retried
+if it times out.
+
+Run directly (e.g. as the release command):  python migrations.py
+"""
+import time
+import psycopg
+from config import DB_CONFIG
+
+# Advisory lock key so two releases/workers never migrate at the same time
+MIGRATION_LOCK = 7_310_000
+# A migration's statements give up waiting for a lock after LOCK_TIMEOUT (well under Postgres's
+# deadlock_timeout) and are retried, so they never stall live traffic for long or deadlock with it
+LOCK_TIMEOUT = "200ms"
+LOCK_RETRIES = 10
+
+# ----- Migration Class -----
+class Migration:
+    """
+    A numbered schema change.
+    statements: SQL run in one transaction.
+    indexes: (name, "ON table ...") pairs (or "UNIQUE ON table ...") built concurrently, outside a transaction.
+    optional: failures are reported and the migration retried on the next run instead of aborting.
+    """
+
+    def __init__(self, version: int, name: str, statements=(), indexes=(), optional: bool = False):
+        self.version = version
+        self.name = name
+        self.statements = list(statements)
+        self.indexes = list(indexes)
+        self.optional = optional
+
+MIGRATIONS = [
+    Migration(1, "base schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username VARCHAR(50) PRIMARY KEY,
+            password VARCHAR(255) NOT NULL,
+            user_type VARCHAR(20) CHECK (user_type IN ('Admin','Student')),
+            email VARCHAR(100) UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS books (
+            id SERIAL PRIMARY KEY,
+            title VARCHAR(255) NOT NULL,
+            author VARCHAR(255) NOT NULL,
+            isbn VARCHAR(50) UNIQUE NOT NULL,
+            is_available BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS category VARCHAR(100)",
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS description TEXT",
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS cover_image VARCHAR(255)",
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS pdf_file VARCHAR(255)",
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id SERIAL PRIMARY KEY,
+            book_id INT NOT NULL,
+            student_username VARCHAR(50) NOT NULL,
+            borrow_date DATE NOT NULL,
+            return_date DATE NOT NULL,
+            is_returned BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
+            FOREIGN KEY (student_username) REFERENCES users(username) ON DELETE CASCADE,
+            UNIQUE (book_id, student_username, borrow_date) -- Prevents duplicate transactions for same borrow
+        )
+        """,
+    ]),
+    Migration(2, "full-text search and keyset pagination", [
+        # Weighted full-text document kept up to date by Postgres on every write
+        """
+        ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(isbn, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'C')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_books_search_vector ON books USING GIN (search_vector)",
+        "CREATE INDEX IF NOT EXISTS idx_books_created_at_id ON books (created_at DESC, id DESC)",
+    ]),
+    # Typo-tolerant search; pg_trgm is not installable everywhere
+    Migration(3, "trigram search", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS idx_books_title_trgm ON books USING GIN (title gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS idx_books_author_trgm ON books USING GIN (author gin_trgm_ops)",
+    ], optional=True),
+    Migration(4, "overdue notification state", [
+        """
+        CREATE TABLE IF NOT EXISTS overdue_notifications (
+            transaction_id INT PRIMARY KEY,
+            status VARCHAR(20) NOT NULL CHECK (status IN ('sent','failed','rejected')),
+            attempts INT NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+        """,
+    ]),
+    # Atomic borrow: one round-trip, serialized per student, reports why a borrow failed
+    Migration(5, "atomic borrow function", [
+        """
+            CREATE OR REPLACE FUNCTION library_borrow(p_book_id INT, p_username VARCHAR, p_max_active INT, p_loan_days INT)
+            RETURNS TABLE (status TEXT, transaction_id INT) AS $$
+            DECLARE
+                v_active INT;
+                v_tx INT;
+            BEGIN
+                -- Lock the student row so concurrent borrows by the same student see each other's loans
+                PERFORM 1 FROM users WHERE username = p_username FOR UPDATE;
+                IF NOT FOUND THEN
+                    RETURN QUERY SELECT 'unknown_student'::TEXT, NULL::INT;
+                    RETURN;
+                END IF;
+
+                -- transactions has one row per (book, student, day)
+                IF EXISTS (SELECT 1 FROM transactions
+                           WHERE book_id = p_book_id AND student_username = p_username AND borrow_date = CURRENT_DATE) THEN
+                    RETURN QUERY SELECT 'borrowed_today'::TEXT, NULL::INT;
+                    RETURN;
+                END IF;
+
+                SELECT count(*) INTO v_active
+                FROM transactions WHERE student_username = p_username AND is_returned = FALSE;
+                IF v_active >= p_max_active THEN
+                    RETURN QUERY SELECT 'limit_reached'::TEXT, NULL::INT;
+                    RETURN;
+                END IF;
+
+                -- Conditional update: only one concurrent borrower can flip the flag
+                UPDATE books SET is_available = FALSE WHERE id = p_book_id AND is_available = TRUE;
+                IF NOT FOUND THEN
+                    IF EXISTS (SELECT 1 FROM books WHERE id = p_book_id) THEN
+                        RETURN QUERY SELECT 'unavailable'::TEXT, NULL::INT;
+                    ELSE
+                        RETURN QUERY SELECT 'missing'::TEXT, NULL::INT;
+                    END IF;
+                    RETURN;
+                END IF;
+
+                INSERT INTO transactions (book_id, student_username, borrow_date, return_date)
+                VALUES (p_book_id, p_username, CURRENT_DATE, CURRENT_DATE + p_loan_days)
+                RETURNING id INTO v_tx;
+                RETURN QUERY SELECT 'ok'::TEXT, v_tx;
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+    ]),
+    Migration(6, "hot query indexes", indexes=[
+        # get_student_transactions: WHERE student_username=... ORDER BY borrow_date DESC
+        ("idx_transactions_student_borrow_date", "ON transactions (student_username, borrow_date DESC)"),
+        # library_borrow's active-loan count and return_book
+        ("idx_transactions_open_by_student", "ON transactions (student_username, book_id) WHERE is_returned = FALSE"),
+        # get_overdue_transactions / overdue notices: open loans past their return date
+        ("idx_transactions_open_return_date", "ON transactions (return_date) WHERE is_returned = FALSE"),
+        # joins from books, ON DELETE CASCADE and per-book history
+        ("idx_transactions_book_id", "ON transactions (book_id)"),
+        # recent transactions and borrows-per-day stats
+        ("idx_transactions_borrow_date", "ON transactions (borrow_date DESC, id DESC)"),
+        # check_borrow_status: books.pdf_file=...
+        ("idx_books_pdf_file", "ON books (pdf_file)"),
+        # catalog filtered by category, newest first
+        ("idx_books_category_created_at", "ON books (category, created_at DESC, id DESC)"),
+        # catalog "available only", newest first
+        ("idx_books_available_created_at", "ON books (created_at DESC, id DESC) WHERE is_available"),
+    ]),
+    # Reference checks before a shared cover is removed (blob_store.py); pdf_file is indexed above
+    Migration(7, "cover reference index", indexes=[
+        ("idx_books_cover_image", "ON books (cover_image)"),
+    ]),
+    # Text of uploaded PDFs, page by page (pdf_indexer.py). Keyed by stored file name:
+    # a PDF shared by several books is indexed once
+    Migration(8, "pdf full-text index", [
+        """
+        CREATE TABLE IF NOT EXISTS pdf_documents (
+            pdf_file VARCHAR(255) PRIMARY KEY,
+            content_key VARCHAR(64) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            page_count INT,
+            error TEXT,
+            indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pdf_pages (
+            pdf_file VARCHAR(255) NOT NULL REFERENCES pdf_documents(pdf_file) ON DELETE CASCADE,
+            page_no INT NOT NULL,
+            content TEXT NOT NULL,
+            content_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+            PRIMARY KEY (pdf_file, page_no)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_pdf_pages_content_vector ON pdf_pages USING GIN (content_vector)",
+    ]),
+    Migration(9, "login throttling", [
+        """
+        CREATE TABLE IF NOT EXISTS login_failures (
+            key VARCHAR(320) PRIMARY KEY,
+            failures INT NOT NULL,
+            window_start TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_login_failures_window_start ON login_failures (window_start)",
+    ]),
+    # Several copies per title, one book_copies row each: a copy is on the 'shelf', 'loaned' or 'held'
+    # for a ready hold. A borrow claims one copy with FOR UPDATE SKIP LOCKED, so concurrent borrowers
+    # of the same title each take a different copy without waiting, and the books row is not written.
+    # Copies are interchangeable, so a return or an expired hold moves any copy in that state.
+    # Availability is looked up in the copies, replacing books.is_available. Students queue for a
+    # title whose copies are all out; a returned copy goes to the oldest hold and is kept for
+    # HOLD_PICKUP_DAYS. Returns, holds and copy-count changes take the books row lock among themselves.
+    Migration(10, "book copies and holds", [
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS copies_total INT NOT NULL DEFAULT 1",
+        """
+        CREATE TABLE IF NOT EXISTS book_copies (
+            book_id INT NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            copy_no INT NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'shelf' CHECK (status IN ('shelf','loaned','held')),
+            PRIMARY KEY (book_id, copy_no)
+        )
+        """,
+        # Borrows claim, and the catalog looks up, the copies on the shelf
+        "CREATE INDEX IF NOT EXISTS idx_book_copies_shelf ON book_copies (book_id) WHERE status = 'shelf'",
+        # Borrows and returns write books.is_available until this commits; reads go on
+        "LOCK TABLE books IN SHARE MODE",
+        # Every open loan has a copy out
+        """
+        UPDATE books b SET copies_total = l.loans
+        FROM (SELECT book_id, count(*) AS loans FROM transactions WHERE is_returned = FALSE GROUP BY book_id) l
+        WHERE l.book_id = b.id AND l.loans > b.copies_total
+        """,
+        """
+        INSERT INTO book_copies (book_id, copy_no, status)
+        SELECT b.id, n, CASE WHEN n <= COALESCE(l.loans, 0) THEN 'loaned' ELSE 'shelf' END
+        FROM books b
+        LEFT JOIN (SELECT book_id, count(*) AS loans FROM transactions WHERE is_returned = FALSE GROUP BY book_id) l
+            ON l.book_id = b.id,
+        generate_series(1, b.copies_total) n
+        ON CONFLICT DO NOTHING
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS holds (
+            id SERIAL PRIMARY KEY,
+            book_id INT NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            student_username VARCHAR(50) NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+            status VARCHAR(20) NOT NULL DEFAULT 'waiting'
+                CHECK (status IN ('waiting','ready','fulfilled','cancelled','expired')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ready_until DATE
+        )
+        """,
+        # One open hold per student and title; the queue is served in id order
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_open_by_book_student
+        ON holds (book_id, student_username) WHERE status IN ('waiting','ready')
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds (book_id, id) WHERE status = 'waiting'",
+        "CREATE INDEX IF NOT EXISTS idx_holds_open_by_student ON holds (student_username) WHERE status IN ('waiting','ready')",
+        "CREATE INDEX IF NOT EXISTS idx_holds_ready_until ON holds (ready_until) WHERE status = 'ready'",
+        # Hands p_copies copies of a book in the p_from state ('loaned' or 'held') to the oldest waiting
+        # holds, the rest back to the shelf. Returns the number of holds made ready. The caller holds
+        # the book row lock.
+        """
+            CREATE OR REPLACE FUNCTION library_release_copies(p_book_id INT, p_copies INT, p_from VARCHAR,
+                                                              p_pickup_days INT)
+            RETURNS INT AS $$
+            DECLARE
+                v_copies INT[];
+                v_ready INT;
+            BEGIN
+                -- A copy locked meanwhile is being claimed by a borrower collecting another hold
+                v_copies := ARRAY(SELECT copy_no FROM book_copies
+                                  WHERE book_id = p_book_id AND status = p_from
+                                  ORDER BY copy_no LIMIT p_copies
+                                  FOR UPDATE SKIP LOCKED);
+
+                WITH next_holds AS (
+                    SELECT id FROM holds
+                    WHERE book_id = p_book_id AND status = 'waiting'
+                    ORDER BY id LIMIT cardinality(v_copies)
+                    FOR UPDATE
+                )
+                UPDATE holds SET status = 'ready', ready_until = CURRENT_DATE + p_pickup_days
+                WHERE id IN (SELECT id FROM next_holds);
+                GET DIAGNOSTICS v_ready = ROW_COUNT;
+
+                UPDATE book_copies SET status = CASE WHEN copy_no = ANY (v_copies[1:v_ready]) THEN 'held'
+                                                     ELSE 'shelf' END
+                WHERE book_id = p_book_id AND copy_no = ANY (v_copies);
+                RETURN v_ready;
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION library_borrow(p_book_id INT, p_username VARCHAR, p_max_active INT, p_loan_days INT)
+            RETURNS TABLE (status TEXT, transaction_id INT) AS $$
+            DECLARE
+                v_active INT;
+                v_from VARCHAR := 'shelf';
+                v_tx INT;
+            BEGIN
+                -- Lock the student row so concurrent borrows by the same student see each other's loans
+                PERFORM 1 FROM users WHERE username = p_username FOR UPDATE;
+                IF NOT FOUND THEN
+                    RETURN QUERY SELECT 'unknown_student'::TEXT, NULL::INT;
+                    RETURN;
+                END IF;
+
+                -- transactions has one row per (book, student, day)
+                IF EXISTS (SELECT 1 FROM transactions
+                           WHERE book_id = p_book_id AND student_username = p_username AND borrow_date = CURRENT_DATE) THEN
+                    RETURN QUERY SELECT 'borrowed_today'::TEXT, NULL::INT;
+                    RETURN;
+                END IF;
+
+                IF EXISTS (SELECT 1 FROM transactions
+                           WHERE book_id = p_book_id AND student_username = p_username AND is_returned = FALSE) THEN
+                    RETURN QUERY SELECT 'already_borrowed'::TEXT, NULL::INT;
+                    RETURN;
+                END IF;
+
+                SELECT count(*) INTO v_active
+                FROM transactions WHERE student_username = p_username AND is_returned = FALSE;
+                IF v_active >= p_max_active THEN
+                    RETURN QUERY SELECT 'limit_reached'::TEXT, NULL::INT;
+                    RETURN;
+                END IF;
+
+                -- A ready hold for this student is collected with one of the copies kept for holds
+                UPDATE holds h SET status = 'fulfilled'
+                WHERE h.book_id = p_book_id AND h.student_username = p_username AND h.status = 'ready';
+                IF FOUND THEN
+                    v_from := 'held';
+                END IF;
+
+                -- Claim one copy, skipping those other borrowers are claiming: nobody waits on anybody
+                UPDATE book_copies c SET status = 'loaned'
+                WHERE c.book_id = p_book_id AND c.copy_no = (
+                    SELECT copy_no FROM book_copies
+                    WHERE book_id = p_book_id AND book_copies.status = v_from
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED);
+                IF NOT FOUND THEN
+                    IF v_from = 'held' THEN
+                        RAISE EXCEPTION 'no copy held for the ready hold on book %', p_book_id;
+                    ELSIF EXISTS (SELECT 1 FROM books WHERE id = p_book_id) THEN
+                        RETURN QUERY SELECT 'unavailable'::TEXT, NULL::INT;
+                    ELSE
+                        RETURN QUERY SELECT 'missing'::TEXT, NULL::INT;
+                    END IF;
+                    RETURN;
+                END IF;
+
+                INSERT INTO transactions (book_id, student_username, borrow_date, return_date)
+                VALUES (p_book_id, p_username, CURRENT_DATE, CURRENT_DATE + p_loan_days)
+                RETURNING id INTO v_tx;
+                RETURN QUERY SELECT 'ok'::TEXT, v_tx;
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION library_return(p_book_id INT, p_username VARCHAR, p_pickup_days INT)
+            RETURNS TABLE (status TEXT, holds_ready INT) AS $$
+            DECLARE
+                v_returned INT;
+            BEGIN
+                UPDATE transactions SET is_returned = TRUE
+                WHERE book_id = p_book_id AND student_username = p_username AND is_returned = FALSE;
+                GET DIAGNOSTICS v_returned = ROW_COUNT;
+                IF v_returned = 0 THEN
+                    RETURN QUERY SELECT 'not_borrowed'::TEXT, 0;
+                    RETURN;
+                END IF;
+                -- Waits for holds being placed, so a hold queued meanwhile is not passed over
+                PERFORM 1 FROM books WHERE id = p_book_id FOR UPDATE;
+                RETURN QUERY SELECT 'ok'::TEXT, library_release_copies(p_book_id, v_returned, 'loaned', p_pickup_days);
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION library_hold(p_book_id INT, p_username VARCHAR, p_max_holds INT)
+            RETURNS TEXT AS $$
+            BEGIN
+                PERFORM 1 FROM users WHERE username = p_username FOR UPDATE;
+                IF NOT FOUND THEN
+                    RETURN 'unknown_student';
+                END IF;
+
+                -- Shares the row with other holds but not with library_return, which hands copies to the queue
+                PERFORM 1 FROM books WHERE id = p_book_id FOR SHARE;
+                IF NOT FOUND THEN
+                    RETURN 'missing';
+                ELSIF EXISTS (SELECT 1 FROM book_copies WHERE book_id = p_book_id AND status = 'shelf') THEN
+                    RETURN 'available';
+                ELSIF EXISTS (SELECT 1 FROM transactions
+                              WHERE book_id = p_book_id AND student_username = p_username AND is_returned = FALSE) THEN
+                    RETURN 'already_borrowed';
+                ELSIF EXISTS (SELECT 1 FROM holds
+                              WHERE book_id = p_book_id AND student_username = p_username
+                                AND status IN ('waiting','ready')) THEN
+                    RETURN 'already_held';
+                ELSIF (SELECT count(*) FROM holds
+                       WHERE student_username = p_username AND status IN ('waiting','ready')) >= p_max_holds THEN
+                    RETURN 'limit_reached';
+                END IF;
+
+                INSERT INTO holds (book_id, student_username) VALUES (p_book_id, p_username);
+                RETURN 'ok';
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION library_cancel_hold(p_book_id INT, p_username VARCHAR, p_pickup_days INT)
+            RETURNS BOOLEAN AS $$
+            DECLARE
+                v_hold RECORD;
+            BEGIN
+                PERFORM 1 FROM books WHERE id = p_book_id FOR UPDATE;
+                SELECT id, status INTO v_hold FROM holds
+                WHERE book_id = p_book_id AND student_username = p_username AND status IN ('waiting','ready')
+                FOR UPDATE;
+                IF NOT FOUND THEN
+                    RETURN FALSE;
+                END IF;
+                UPDATE holds SET status = 'cancelled' WHERE id = v_hold.id;
+                IF v_hold.status = 'ready' THEN
+                    PERFORM library_release_copies(p_book_id, 1, 'held', p_pickup_days);
+                END IF;
+                RETURN TRUE;
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        """
+            CREATE OR REPLACE FUNCTION library_expire_holds(p_pickup_days INT)
+            RETURNS INT AS $$
+            DECLARE
+                v_hold RECORD;
+                v_expired INT := 0;
+            BEGIN
+                FOR v_hold IN SELECT id, book_id FROM holds
+                              WHERE status = 'ready' AND ready_until < CURRENT_DATE ORDER BY book_id, id LOOP
+                    PERFORM 1 FROM books WHERE id = v_hold.book_id FOR UPDATE;
+                    UPDATE holds SET status = 'expired' WHERE id = v_hold.id AND status = 'ready';
+                    IF FOUND THEN
+                        PERFORM library_release_copies(v_hold.book_id, 1, 'held', p_pickup_days);
+                        v_expired := v_expired + 1;
+                    END IF;
+                END LOOP;
+                RETURN v_expired;
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        # Only copies on the shelf can be removed; added copies go to the hold queue first
+        """
+            CREATE OR REPLACE FUNCTION library_set_copies(p_book_id INT, p_copies INT, p_pickup_days INT)
+            RETURNS TEXT AS $$
+            DECLARE
+                v_total INT;
+                v_removed INT[];
+            BEGIN
+                IF p_copies < 1 THEN
+                    RETURN 'invalid';
+                END IF;
+                SELECT copies_total INTO v_total FROM books WHERE id = p_book_id FOR UPDATE;
+                IF NOT FOUND THEN
+                    RETURN 'missing';
+                END IF;
+                IF p_copies < v_total THEN
+                    -- A copy a borrower is claiming right now is not on the shelf any more
+                    v_removed := ARRAY(SELECT copy_no FROM book_copies
+                                       WHERE book_id = p_book_id AND status = 'shelf'
+                                       ORDER BY copy_no DESC LIMIT v_total - p_copies
+                                       FOR UPDATE SKIP LOCKED);
+                    IF cardinality(v_removed) < v_total - p_copies THEN
+                        RETURN 'in_use';
+                    END IF;
+                    DELETE FROM book_copies WHERE book_id = p_book_id AND copy_no = ANY (v_removed);
+                    UPDATE books SET copies_total = p_copies WHERE id = p_book_id;
+                ELSIF p_copies > v_total THEN
+                    -- New copies come in as if just returned
+                    INSERT INTO book_copies (book_id, copy_no, status)
+                    SELECT p_book_id, last.copy_no + n, 'loaned'
+                    FROM (SELECT COALESCE(max(copy_no), 0) AS copy_no FROM book_copies WHERE book_id = p_book_id) last,
+                         generate_series(1, p_copies - v_total) n;
+                    UPDATE books SET copies_total = p_copies WHERE id = p_book_id;
+                    PERFORM library_release_copies(p_book_id, p_copies - v_total, 'loaned', p_pickup_days);
+                END IF;
+                RETURN 'ok';
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        # Also drops idx_books_available_created_at; the catalog's "available only" pages walk
+        # idx_books_created_at_id and look each book's copies up in idx_book_copies_shelf
+        "ALTER TABLE books DROP COLUMN IF EXISTS is_available",
+    ]),
+    # Loan history partitioned by borrow month. transactions keeps the open loans and the recent
+    # months; returned loans older than ARCHIVE_AFTER_MONTHS move to transactions_archive
+    # (loan_archive.py), which queries only read when asked to, through transactions_all.
+    # The existing table becomes one partition, transactions_legacy, covering every date up to the
+    # end of next month, without copying it or scanning it under a lock: 11 builds the unique index
+    # the partitioned primary key needs, concurrently, and adds the partition bound as a CHECK that
+    # is not validated yet; 12 validates it, which blocks no reads or writes; 13 swaps the tables
+    # in the catalog only. loan_archive.py drains transactions_legacy in batches as its months age out.
+    Migration(11, "loan history partition bound", [
+        # Next month included: loans are entered for today, even if 13 runs after the month turns
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conrelid = 'transactions'::regclass AND conname = 'transactions_legacy_bound') THEN
+                EXECUTE format('ALTER TABLE transactions ADD CONSTRAINT transactions_legacy_bound '
+                               'CHECK (borrow_date < %L) NOT VALID',
+                               (date_trunc('month', CURRENT_DATE) + interval '2 months')::date);
+            END IF;
+        END $$
+        """,
+    ], indexes=[
+        ("transactions_id_borrow_date_key", "UNIQUE ON transactions (id, borrow_date)"),
+    ]),
+    Migration(12, "loan history partition bound check", [
+        "ALTER TABLE transactions VALIDATE CONSTRAINT transactions_legacy_bound",
+    ]),
+    Migration(13, "partitioned loan history", [
+        # Creates the missing monthly partitions <parent>_yYYYYmMM from p_from's month to p_to's
+        """
+            CREATE OR REPLACE FUNCTION library_create_partitions(p_parent TEXT, p_from DATE, p_to DATE)
+            RETURNS INT AS $$
+            DECLARE
+                v_schema TEXT;
+                v_month DATE := date_trunc('month', p_from);
+                v_legacy_end DATE;
+                v_name TEXT;
+                v_created INT := 0;
+            BEGIN
+                SELECT n.nspname INTO v_schema
+                FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE c.oid = p_parent::regclass;
+                -- The dates before the end of <parent>_legacy's range are stored there
+                SELECT (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([0-9-]+)''\\)'))[1]::date
+                INTO v_legacy_end
+                FROM pg_inherits h JOIN pg_class c ON c.oid = h.inhrelid
+                WHERE h.inhparent = p_parent::regclass AND c.relname = p_parent || '_legacy';
+                v_month := GREATEST(v_month, v_legacy_end);
+                WHILE v_month <= p_to LOOP
+                    v_name := p_parent || to_char(v_month, '"_y"YYYY"m"MM');
+                    -- Qualified: a partition of the same name in another schema on the search_path does not count
+                    IF to_regclass(format('%I.%I', v_schema, v_name)) IS NULL THEN
+                        EXECUTE format('CREATE TABLE %I.%I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)',
+                                       v_schema, v_name, p_parent::regclass, v_month, (v_month + interval '1 month')::date);
+                        v_created := v_created + 1;
+                    END IF;
+                    v_month := v_month + interval '1 month';
+                END LOOP;
+                RETURN v_created;
+            END;
+            $$ LANGUAGE plpgsql
+        """,
+        # Attaching merges the foreign keys, which locks books and users too: take every lock up front
+        "LOCK TABLE users, books, transactions IN ACCESS EXCLUSIVE MODE",
+        # The old table keeps its rows, indexes and constraints under new names; the partitioned one
+        # takes over the names, and the id sequence carries on
+        """
+        ALTER TABLE transactions
+            DROP CONSTRAINT IF EXISTS transactions_pkey,
+            ADD CONSTRAINT transactions_legacy_pkey PRIMARY KEY USING INDEX transactions_id_borrow_date_key
+        """,
+        """
+        ALTER TABLE transactions RENAME CONSTRAINT transactions_book_id_student_username_borrow_date_key
+            TO transactions_legacy_book_id_student_username_borrow_date_key
+        """,
+        """
+        DO $$
+        DECLARE
+            v_index TEXT;
+        BEGIN
+            FOREACH v_index IN ARRAY ARRAY['student_borrow_date', 'open_by_student', 'open_return_date',
+                                           'book_id', 'borrow_date'] LOOP
+                EXECUTE format('ALTER INDEX IF EXISTS %I RENAME TO %I',
+                               'idx_transactions_' || v_index, 'idx_transactions_legacy_' || v_index);
+            END LOOP;
+        END $$
+        """,
+        "ALTER TABLE transactions RENAME TO transactions_legacy",
+        "ALTER SEQUENCE transactions_id_seq OWNED BY NONE",
+        # The partition key must be part of every unique constraint
+        """
+        CREATE TABLE transactions (
+            id INT NOT NULL DEFAULT nextval('transactions_id_seq'),
+            book_id INT NOT NULL,
+            student_username VARCHAR(50) NOT NULL,
+            borrow_date DATE NOT NULL,
+            return_date DATE NOT NULL,
+            is_returned BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (id, borrow_date),
+            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
+            FOREIGN KEY (student_username) REFERENCES users(username) ON DELETE CASCADE,
+            UNIQUE (book_id, student_username, borrow_date) -- Prevents duplicate transactions for same borrow
+        ) PARTITION BY RANGE (borrow_date)
+        """,
+        "ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id",
+        # Migration 6's indexes, on every partition
+        "CREATE INDEX idx_transactions_student_borrow_date ON transactions (student_username, borrow_date DESC)",
+        """
+        CREATE INDEX idx_transactions_open_by_student ON transactions (student_username, book_id)
+        WHERE is_returned = FALSE
+        """,
+        "CREATE INDEX idx_transactions_open_return_date ON transactions (return_date) WHERE is_returned = FALSE",
+        "CREATE INDEX idx_transactions_book_id ON transactions (book_id)",
+        "CREATE INDEX idx_transactions_borrow_date ON transactions (borrow_date DESC, id DESC)",
+        # The validated CHECK implies the partition bound, so nothing is scanned, and the old table's
+        # indexes and constraints match the new ones, so they are attached rather than rebuilt.
+        # A new database has no loans to keep
+        """
+        DO $$
+        DECLARE
+            v_bound DATE;
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM transactions_legacy) THEN
+                DROP TABLE transactions_legacy;
+                RETURN;
+            END IF;
+            SELECT (regexp_match(pg_get_constraintdef(oid), '[0-9]{4}-[0-9]{2}-[0-9]{2}'))[1]::date INTO v_bound
+            FROM pg_constraint
+            WHERE conrelid = 'transactions_legacy'::regclass AND conname = 'transactions_legacy_bound';
+            EXECUTE format('ALTER TABLE transactions ATTACH PARTITION transactions_legacy '
+                           'FOR VALUES FROM (MINVALUE) TO (%L)', v_bound);
+        END $$
+        """,
+        # From last month (init_db.py's samples go back a few days) to three months ahead; the
+        # clock process then keeps TRANSACTION_PARTITIONS_AHEAD months ready (maintenance.py)
+        "SELECT library_create_partitions('transactions', CURRENT_DATE - 31, CURRENT_DATE + 92)",
+        # Same columns and constraints, so a whole month can be moved by re-attaching its partition.
+        # It only ever holds returned loans: no open-loan indexes
+        """
+        CREATE TABLE IF NOT EXISTS transactions_archive (
+            id INT NOT NULL,
+            book_id INT NOT NULL,
+            student_username VARCHAR(50) NOT NULL,
+            borrow_date DATE NOT NULL,
+            return_date DATE NOT NULL,
+            is_returned BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (id, borrow_date),
+            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
+            FOREIGN KEY (student_username) REFERENCES users(username) ON DELETE CASCADE,
+            UNIQUE (book_id, student_username, borrow_date)
+        ) PARTITION BY RANGE (borrow_date)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_archive_student_borrow_date
+        ON transactions_archive (student_username, borrow_date DESC)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_transactions_archive_book_id ON transactions_archive (book_id)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_archive_borrow_date
+        ON transactions_archive (borrow_date DESC, id DESC)
+        """,
+        # The whole loan history, for the queries that opt in to the archive
+        """
+        CREATE OR REPLACE VIEW transactions_all AS
+            SELECT id, book_id, student_username, borrow_date, return_date, is_returned FROM transactions
+            UNION ALL
+            SELECT id, book_id, student_username, borrow_date, return_date, is_returned FROM transactions_archive
+        """,
+    ]),
+]
+
+# ----- Runner -----
+def _build_index(conn, name: str, definition: str) -> None:
+    """Builds one index concurrently, replacing a leftover INVALID index of the same name."""
+    invalid = conn.execute("""
+        SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    """, (name,)).fetchone()
+    if invalid:
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    unique = "UNIQUE " if definition.startswith("UNIQUE ") else ""
+    conn.execute(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} {definition.removeprefix(unique)}")
+
+def _run_statements(conn, migration: Migration) -> None:
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            with conn.transaction():
+                conn.execute("SELECT set_config('lock_timeout', %s, true)", (LOCK_TIMEOUT,))
+                for statement in migration.statements:
+                    conn.execute(statement)
+            return
+        except (psycopg.errors.LockNotAvailable, psycopg.errors.DeadlockDetected):
+            if attempt == LOCK_RETRIES:
+                raise
+            time.sleep(0.5 * (attempt + 1))
+
+def _apply(conn, migration: Migration) -> None:
+    if migration.statements:
+        _run_statements(conn, migration)
+    for name, definition in migration.indexes:
+        _build_index(conn, name, definition)
+    conn.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                 (migration.version, migration.name))
+
+def migrate(conninfo: str = None) -> list:
+    """Applies every pending migration in order. Returns the versions applied."""
+    applied_now = []
+    with psycopg.connect(conninfo or DB_CONFIG["url"], autocommit=True) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+        try:
+            done = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                try:
+                    _apply(conn, migration)
+                except psycopg.Error as e:
+                    if not migration.optional:
+                        raise
+                    print(f"⚠️ Skipped optional migration {migration.version} ({migration.name}): {e}")
+                    continue
+                applied_now.append(migration.version)
+                print(f"🛠️ Applied migration {migration.version}: {migration.name}")
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK,))
+    return applied_now
+
+if __name__ == "__main__":
+    migrate()
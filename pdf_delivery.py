@@ -0,0 +1,111 @@
+# pdf_delivery.py
+"""
+PDF delivery for /download/pdf, once the route has authorized the request.
+
+PDF_DELIVERY_MODE selects how the bytes reach the client:
+
+  direct      (default) The app answers conditional requests itself (ETag /
+              Last-Modified -> 304) and single byte ranges (Range / If-Range ->
+              206), and hands the open file to the server's wsgi.file_wrapper.
+              Under gunicorn that means os.sendfile(), a zero-copy transfer,
+              for whole files and for ranges alike.
+  x-accel     nginx streams the file: the app only answers with an
+              X-Accel-Redirect to PDF_ACCEL_PREFIX, which nginx must map to the
+              PDF folder as an internal location, e.g.
+                  location /protected-pdfs/ { internal; alias /app/static/uploads/pdfs/; }
+  x-sendfile  Apache (mod_xsendfile) / lighttpd stream the file named in an
+              X-Sendfile header.
+  flask       Flask's send_from_directory, the previous behaviour (ranges are
+              copied through Python).
+
+In the proxy modes the worker is free as soon as the headers are sent, and the
+proxy handles ranges and validators itself.
+"""
+import os
+from urllib.parse import quote
+from flask import Response, request, send_from_directory, abort
+from config import PDF_DELIVERY_MODE, PDF_ACCEL_PREFIX
+from blob_store import is_blob_name
+
+DELIVERY_MODES = ("direct", "x-accel", "x-sendfile", "flask")
+
+# Read size for the pure-Python fallback of partial responses
+BLOCK_SIZE = 64 * 1024
+
+# ----- Helper functions -----
+def file_etag(filename: str, stat: os.stat_result) -> str:
+    """
+    The content digest for content-addressed files, otherwise a cheap validator from
+    modification time and size (the file is never hashed per request).
+    """
+    if is_blob_name(filename):
+        return filename.split(".", 1)[0]
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def _read_range(f, length: int):
+    """Yields exactly length bytes from f's current position, then closes it."""
+    try:
+        while length > 0:
+            chunk = f.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+def _file_body(f, start: int, length: int, size: int):
+    """
+    Body for the byte range [start, start + length) of an open file.
+    wsgi.file_wrapper sends from the current offset to EOF (zero-copy under
+    gunicorn); gunicorn also stops at Content-Length, so it can serve any range.
+    Other servers get the wrapper only when the range runs to the end of the file.
+    """
+    f.seek(start)
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    to_eof = start + length == size
+    if wrapper and (to_eof or request.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn")):
+        return wrapper(f, BLOCK_SIZE)
+    return _read_range(f, length)
+
+# ----- Delivery -----
+def send_pdf(folder: str, filename: str, mode: str = None) -> Response:
+    """Sends an already-authorized PDF from folder using the configured delivery mode."""
+    mode = mode or PDF_DELIVERY_MODE
+    if mode == "flask":
+        return send_from_directory(folder, filename)
+
+    path = os.path.join(folder, filename)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        abort(404)
+
+    response = Response(mimetype="application/pdf", direct_passthrough=True)
+    response.headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+    # Per-user authorization: browsers may keep a copy, shared caches must not, and every use is
+    # revalidated so a returned loan stops the PDF from opening. The ETag keeps that a cheap 304.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    if mode == "x-accel":
+        response.headers["X-Accel-Redirect"] = f"{PDF_ACCEL_PREFIX.rstrip('/')}/{quote(filename)}"
+        return response
+    if mode == "x-sendfile":
+        response.headers["X-Sendfile"] = os.path.abspath(path)
+        return response
+
+    response.set_etag(file_etag(filename, stat))
+    response.last_modified = int(stat.st_mtime)
+    response.content_length = stat.st_size
+    # Resolves 304 / 206 / 416 from the request headers (a satisfied Range sets status and Content-Range)
+    response.make_conditional(request.environ, accept_ranges=True, complete_length=stat.st_size)
+    if response.status_code == 304 or request.method == "HEAD":
+        return response
+
+    start, length = 0, stat.st_size
+    if response.status_code == 206:
+        start = response.content_range.start
+        length = response.content_range.stop - start
+    response.response = _file_body(open(path, "rb"), start, length, stat.st_size)
+    return response
@@ -0,0 +1,158 @@
+# pdf_indexer.py
+"""
+Full-text index of the uploaded PDFs, page by page (pdf_documents / pdf_pages,
+searched by PdfIndexDAO.search_pages).
+
+Text is extracted with pypdf in a pool of worker processes (extraction is
+CPU-bound), one PDF per task. Each worker streams the pages of its PDF into
+Postgres with COPY as they are extracted, so neither the worker nor this
+process ever holds a whole book's text.
+
+Indexing is incremental: a PDF is (re)indexed only when its content key
+changes, i.e. its digest for content-addressed uploads, or modification time
+and size for files stored under their original names. A PDF that cannot be read
+is recorded as failed and skipped until it changes. New uploads are indexed in
+the background (PDF_INDEX_ON_UPLOAD); everything else, e.g. after a catalog
+import, with:
+
+    python pdf_indexer.py [--force] [--retry-failed] [--workers N]
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pypdf import PdfReader
+from config import PDF_INDEX_WORKERS, PDF_INDEX_ON_UPLOAD, PDF_INDEX_MAX_PAGE_CHARS
+from blob_store import PDF_FOLDER
+from pdf_delivery import file_etag
+from dao.db import create_pool, get_pool, set_pool
+from dao.pdf_index_dao import PdfIndexDAO
+
+pdf_index_dao = PdfIndexDAO()
+
+WHITESPACE = re.compile(r"\s+")
+
+# Workers are spawned, not forked: the web process has threads (pools, listeners) a fork would copy mid-state
+_mp_context = multiprocessing.get_context("spawn")
+
+_background_pool = None
+_state = {"pending": 0, "indexed": 0, "unchanged": 0, "failed": 0, "last_error": None}
+_state_lock = threading.Lock()
+
+# ----- Helper functions -----
+def content_key(pdf_file: str) -> str:
+    """Changes whenever the stored file changes. Raises FileNotFoundError for missing files."""
+    return file_etag(pdf_file, os.stat(os.path.join(PDF_FOLDER, pdf_file)))
+
+def extract_pages(path: str):
+    """Yields (page_no, text) for every page with text, one page at a time."""
+    reader = PdfReader(path)
+    if reader.is_encrypted:
+        reader.decrypt("")  # owner-password-only PDFs open with an empty user password
+    for page_no, page in enumerate(reader.pages, start=1):
+        text = WHITESPACE.sub(" ", (page.extract_text() or "").replace("\x00", " ")).strip()
+        if text:
+            yield page_no, text[:PDF_INDEX_MAX_PAGE_CHARS]
+
+# ----- Worker processes -----
+def _init_worker(conninfo: str) -> None:
+    # One connection per worker, to the same database as the parent
+    set_pool(create_pool(conninfo, min_size=1, max_size=1))
+
+def _index_file(pdf_file: str, key: str, only_if_changed: bool = False) -> tuple:
+    """Indexes one PDF. Returns (pdf_file, outcome, pages, error) with outcome indexed / unchanged / failed."""
+    if only_if_changed and pdf_index_dao.get_content_key(pdf_file) == key:
+        return pdf_file, "unchanged", None, None
+    try:
+        pages = pdf_index_dao.replace_pages(pdf_file, key, extract_pages(os.path.join(PDF_FOLDER, pdf_file)))
+        return pdf_file, "indexed", pages, None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        pdf_index_dao.record_failure(pdf_file, key, error)
+        return pdf_file, "failed", None, error
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context,
+                               initializer=_init_worker, initargs=(get_pool().conninfo,))
+
+# ----- Batch indexing -----
+def index_pdfs(force: bool = False, retry_failed: bool = False, workers: int = PDF_INDEX_WORKERS) -> dict:
+    """
+    Indexes every referenced PDF that is new or changed since it was last indexed
+    (all of them with force; failed ones again with retry_failed), and drops the text
+    of PDFs no book references any more. Returns counts per outcome.
+    """
+    summary = {"indexed": 0, "pages": 0, "unchanged": 0, "failed": 0, "missing": 0,
+               "purged": pdf_index_dao.purge_unreferenced()}
+    pending = []
+    for row in pdf_index_dao.get_index_state():
+        try:
+            key = content_key(row["pdf_file"])
+        except (FileNotFoundError, ValueError):
+            summary["missing"] += 1
+            continue
+        if force or row["content_key"] != key or (retry_failed and row["status"] == "failed"):
+            pending.append((row["pdf_file"], key))
+        else:
+            summary["unchanged"] += 1
+    if not pending:
+        return summary
+
+    with _process_pool(min(workers, len(pending))) as pool:
+        for pdf_file, outcome, pages, error in pool.map(_index_file, *zip(*pending)):
+            summary[outcome] += 1
+            summary["pages"] += pages or 0
+            if error:
+                print(f"Error indexing {pdf_file}: {error}")
+    return summary
+
+# ----- Background indexing of uploads -----
+def _record_outcome(future) -> None:
+    try:
+        pdf_file, outcome, _, error = future.result()
+        last_error = f"{pdf_file}: {error}" if error else None
+    except Exception as e:
+        outcome, last_error = "failed", str(e)
+        print(f"Error in PDF indexing worker: {e}")
+    with _state_lock:
+        _state["pending"] -= 1
+        _state[outcome] += 1
+        _state["last_error"] = last_error or _state["last_error"]
+
+def enqueue_pdf_index(pdf_file: str) -> bool:
+    """Indexes a newly stored PDF in the background worker pool. Returns False if not queued."""
+    global _background_pool
+    if not PDF_INDEX_ON_UPLOAD or not pdf_file:
+        return False
+    try:
+        key = content_key(pdf_file)
+    except (FileNotFoundError, ValueError):
+        return False
+    with _state_lock:
+        if _background_pool is None:
+            _background_pool = _process_pool(PDF_INDEX_WORKERS)
+        try:
+            future = _background_pool.submit(_index_file, pdf_file, key, True)
+        except BrokenProcessPool:
+            # A worker that died (e.g. killed for memory) breaks the whole pool: start a new one
+            _background_pool.shutdown(wait=False)
+            _background_pool = _process_pool(PDF_INDEX_WORKERS)
+            future = _background_pool.submit(_index_file, pdf_file, key, True)
+        _state["pending"] += 1
+    future.add_done_callback(_record_outcome)
+    return True
+
+def index_status() -> dict:
+    with _state_lock:
+        return dict(_state)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the text of uploaded PDFs for in-book search.")
+    parser.add_argument("--force", action="store_true", help="re-index every PDF")
+    parser.add_argument("--retry-failed", action="store_true", help="retry PDFs that could not be read before")
+    parser.add_argument("--workers", type=int, default=PDF_INDEX_WORKERS)
+    args = parser.parse_args()
+    print(index_pdfs(args.force, args.retry_failed, args.workers))
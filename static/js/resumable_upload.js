@@ -0,0 +1,92 @@
+// Sends large files of upload forms in chunks to /admin/uploads (see uploads.py) before the form is submitted.
+// File inputs opt in with data-resumable="<kind>", data-resumable-field="<hidden field for the upload id>"
+// and data-resumable-url="<url of the start endpoint>". Interrupted uploads resume from the server's offset,
+// also after a page reload when the same file is chosen again.
+(function () {
+  const THRESHOLD = 8 * 1024 * 1024;  // smaller files go with the form (UPLOAD_CHUNK_SIZE default)
+  const MAX_RETRIES = 5;
+
+  const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+  async function json(response) {
+    const body = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      const error = new Error(body.error || response.statusText);
+      error.status = response.status;
+      throw error;
+    }
+    return body;
+  }
+
+  async function upload(input, file, progress) {
+    const base = input.dataset.resumableUrl;
+    const key = ['resumable', input.dataset.resumable, file.name, file.size, file.lastModified].join(':');
+    let state = null;
+    if (localStorage.getItem(key)) {
+      state = await fetch(`${base}/${localStorage.getItem(key)}`).then(json).catch(() => null);
+    }
+    if (!state) {
+      state = await fetch(base, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({kind: input.dataset.resumable, filename: file.name, size: file.size}),
+      }).then(json);
+      localStorage.setItem(key, state.id);
+    }
+    let retries = 0;
+    while (!state.complete) {
+      progress(state.offset / file.size);
+      try {
+        state = await fetch(`${base}/${state.id}`, {
+          method: 'PATCH',
+          headers: {'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': state.offset},
+          body: file.slice(state.offset, state.offset + state.chunk_size),
+        }).then(json);
+        retries = 0;
+      } catch (error) {
+        // Network errors and offset conflicts are retried from the offset the server reports
+        if ((error.status && error.status !== 409) || ++retries > MAX_RETRIES) {
+          localStorage.removeItem(key);
+          throw error;
+        }
+        await sleep(1000 * 2 ** (retries - 1));
+        state = await fetch(`${base}/${state.id}`).then(json);
+      }
+    }
+    progress(1);
+    localStorage.removeItem(key);
+    return state.id;
+  }
+
+  document.querySelectorAll('form').forEach((form) => {
+    const inputs = form.querySelectorAll('input[type=file][data-resumable]');
+    if (!inputs.length) return;
+    form.addEventListener('submit', async (event) => {
+      const pending = [...inputs].filter((input) => input.files.length && input.files[0].size > THRESHOLD);
+      if (!pending.length) return;
+      event.preventDefault();
+      const buttons = form.querySelectorAll('button[type=submit]');
+      buttons.forEach((button) => { button.disabled = true; });
+      try {
+        for (const input of pending) {
+          const status = document.createElement('div');
+          status.className = 'form-text';
+          input.after(status);
+          const id = await upload(input, input.files[0], (done) => {
+            status.textContent = `Uploading ${input.files[0].name}: ${Math.floor(done * 100)}%`;
+          });
+          const hidden = document.createElement('input');
+          hidden.type = 'hidden';
+          hidden.name = input.dataset.resumableField;
+          hidden.value = id;
+          form.appendChild(hidden);
+          input.value = '';  // the file itself is no longer sent with the form
+        }
+        form.submit();
+      } catch (error) {
+        alert(`Upload failed: ${error.message}`);
+        buttons.forEach((button) => { button.disabled = false; });
+      }
+    });
+  });
+})();
@@ -0,0 +1,189 @@
+# thumbnails.py
+"""
+Resized WebP / JPEG copies of uploaded covers, sized for the places the
+templates show them, so catalog pages no longer download full-size originals.
+
+Each entry of SIZES is a display box in CSS pixels. A variant is scaled to
+just cover its box (the templates crop with object-fit: cover), at 1x and 2x
+for high-density screens, and never upscaled. Files are written next to the
+covers in COVER_FOLDER/thumbs as "<cover stem>-<width>x<height>.<webp|jpg>".
+
+Thumbnails are made in a background worker after an upload (enqueue_thumbnails),
+so the admin request does not wait for image decoding. Until they exist, the
+templates fall back to the original cover. Existing covers are processed with:
+
+    python thumbnails.py backfill [--force] [--workers N]
+"""
+import argparse
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import url_for
+from PIL import Image, ImageOps
+from config import THUMBNAIL_WORKERS
+from blob_store import COVER_FOLDER, THUMB_FOLDER, TEMP_PREFIX, cover_stem
+from dao.book_dao import BookDAO
+
+# Display boxes (width, height) in CSS pixels; 0 leaves that side free
+SIZES = {
+    "card": (400, 200),   # view_books.html: height 200px, about the card width
+    "row": (0, 60),       # dashboard_admin.html table: height 60px
+}
+DENSITIES = (1, 2)
+
+# extension -> (Pillow format, save options)
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+_state = {"pending": 0, "generated": 0, "failed": 0, "last_error": None}
+_pending = set()
+_state_lock = threading.Lock()
+
+# ----- Helper functions -----
+def thumbnail_name(cover: str, box: tuple, density: int, extension: str) -> str:
+    width, height = box
+    return f"{cover_stem(cover)}-{width * density}x{height * density}.{extension}"
+
+def _variants(cover: str):
+    """Yields (box, density, extension, file name) for every thumbnail of a cover."""
+    for box in SIZES.values():
+        for density in DENSITIES:
+            for extension in FORMATS:
+                yield box, density, extension, thumbnail_name(cover, box, density, extension)
+
+def _fit(image: Image.Image, box: tuple, density: int) -> Image.Image:
+    """Scales the image down so it just covers box * density (never up)."""
+    width, height = box[0] * density, box[1] * density
+    scale = max(width / image.width, height / image.height)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+def _save(image: Image.Image, extension: str, name: str) -> None:
+    """Writes the image atomically: a half-written thumbnail is never served."""
+    fmt, options = FORMATS[extension]
+    if fmt == "JPEG" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    fd, temp_path = tempfile.mkstemp(dir=THUMB_FOLDER, prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as target:
+            image.save(target, fmt, **options)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, os.path.join(THUMB_FOLDER, name))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+# ----- Generation -----
+def generate_thumbnails(cover: str, force: bool = False) -> int:
+    """
+    Writes the missing (or, with force, all) thumbnails of a cover in COVER_FOLDER.
+    Returns the number of files written.
+    """
+    source = os.path.join(COVER_FOLDER, cover)
+    missing = [variant for variant in _variants(cover)
+               if force or not os.path.exists(os.path.join(THUMB_FOLDER, variant[3]))]
+    if not missing:
+        return 0
+    with Image.open(source) as original:
+        # JPEGs are decoded at a reduced scale (1/2 .. 1/8) when still larger than every box
+        largest = (max(box[0] * density for box, density, _, _ in missing),
+                   max(box[1] * density for box, density, _, _ in missing))
+        original.draft("RGB", largest)
+        original.seek(0)  # first frame of animated GIFs
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+        resized = {}
+        for box, density, extension, name in missing:
+            key = (box, density)
+            if key not in resized:
+                resized[key] = _fit(image, box, density)
+            _save(resized[key], extension, name)
+    return len(missing)
+
+def _run_in_background(cover: str) -> None:
+    try:
+        generate_thumbnails(cover)
+        outcome = {"generated": 1}
+    except Exception as e:
+        print(f"Error generating thumbnails for {cover}: {e}")
+        outcome = {"failed": 1, "last_error": f"{cover}: {e}"}
+    with _state_lock:
+        _pending.discard(cover)
+        _state["pending"] -= 1
+        _state["generated"] += outcome.get("generated", 0)
+        _state["failed"] += outcome.get("failed", 0)
+        _state["last_error"] = outcome.get("last_error", _state["last_error"])
+
+def enqueue_thumbnails(cover: str) -> None:
+    """Generates a cover's thumbnails in the background (no-op if already queued)."""
+    if not cover:
+        return
+    with _state_lock:
+        if cover in _pending:
+            return
+        _pending.add(cover)
+        _state["pending"] += 1
+    _executor.submit(_run_in_background, cover)
+
+def thumbnail_status() -> dict:
+    with _state_lock:
+        return dict(_state)
+
+# ----- Templates -----
+def cover_sources(cover: str, size: str) -> dict | None:
+    """
+    srcset values for a cover shown in one of SIZES: {"webp": ..., "jpg": ..., "src": ...},
+    or None while its thumbnails do not exist yet (the template then uses the original).
+    """
+    box = SIZES[size]
+    sources = {}
+    for extension in FORMATS:
+        candidates = []
+        for density in DENSITIES:
+            name = thumbnail_name(cover, box, density, extension)
+            if not os.path.exists(os.path.join(THUMB_FOLDER, name)):
+                return None
+            candidates.append(f"{url_for('static', filename='uploads/covers/thumbs/' + name)} {density}x")
+        sources[extension] = ", ".join(candidates)
+    sources["src"] = url_for("static", filename="uploads/covers/thumbs/" + thumbnail_name(cover, box, 1, "jpg"))
+    return sources
+
+# ----- Backfill -----
+def backfill(force: bool = False, workers: int = THUMBNAIL_WORKERS) -> dict:
+    """Generates thumbnails for every cover referenced by a book."""
+    summary = {"covers": 0, "files_written": 0, "missing": 0, "failed": 0}
+
+    def process(cover):
+        try:
+            return "files_written", generate_thumbnails(cover, force)
+        except FileNotFoundError:
+            return "missing", 1
+        except Exception as e:
+            print(f"Error generating thumbnails for {cover}: {e}")
+            return "failed", 1
+
+    covers = list(BookDAO().iter_file_references("cover_image"))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for key, count in pool.map(process, covers):
+            summary[key] += count
+    summary["covers"] = len(covers)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cover thumbnail maintenance.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--force", action="store_true", help="regenerate thumbnails that already exist")
+    parser.add_argument("--workers", type=int, default=THUMBNAIL_WORKERS)
+    args = parser.parse_args()
+    print(backfill(args.force, args.workers))
@@ -0,0 +1,317 @@
+# uploads.py
+"""
+Streaming, size-limited uploads of covers and PDFs.
+
+Form uploads: UploadRequest (the app's request class) gives Werkzeug's form
+parser an UploadSpool for every file part, so each chunk of the request body is
+written straight to a temp file in the blob folder it is headed for, hashed on
+the way and checked against the size limit of its kind. The file signature
+(magic bytes) is checked as soon as the first bytes arrive, so a mislabelled
+or oversized file is refused without being written out in full. save_upload()
+then only renames the finished file into the blob store (blob_store.adopt_blob).
+
+Resumable uploads: large scans are sent in UPLOAD_CHUNK_SIZE pieces to the
+/admin/uploads endpoints (see static/js/resumable_upload.js). Each chunk is a
+short request appended at its offset, so an interrupted upload resumes from
+the last byte the server has, and no worker is held for the whole transfer.
+Sessions live in RESUMABLE_FOLDER and expire after UPLOAD_SESSION_TTL seconds.
+"""
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from flask import Request
+from werkzeug.exceptions import (Conflict, LengthRequired, NotFound, RequestEntityTooLarge,
+                                 UnsupportedMediaType)
+from config import (MAX_UPLOAD_SIZE, MAX_COVER_SIZE, MAX_PDF_SIZE, UPLOAD_CHUNK_SIZE,
+                    UPLOAD_SESSION_TTL, UPLOAD_FOLDER)
+from blob_store import BASE_DIR, BLOB_KINDS, CHUNK_SIZE, TEMP_PREFIX, adopt_blob, blob_name
+
+# kind -> accepted file extensions
+EXTENSIONS = {
+    "covers": {"png", "jpg", "jpeg", "gif"},
+    "pdfs": {"pdf"},
+}
+SIZE_LIMITS = {"covers": MAX_COVER_SIZE, "pdfs": MAX_PDF_SIZE}
+
+# extension -> accepted leading bytes
+SIGNATURES = {
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "jpg": (b"\xff\xd8\xff",),
+    "jpeg": (b"\xff\xd8\xff",),
+    "gif": (b"GIF87a", b"GIF89a"),
+}
+# PDF readers accept "%PDF-" anywhere in the first kilobyte
+PDF_MARKER = b"%PDF-"
+HEAD_SIZE = 1024
+
+RESUMABLE_FOLDER = os.path.join(BASE_DIR, UPLOAD_FOLDER, "resumable")
+os.makedirs(RESUMABLE_FOLDER, exist_ok=True)
+
+# ----- Helper functions -----
+def file_extension(filename: str) -> str:
+    return filename.rsplit(".", 1)[1].lower() if filename and "." in filename else ""
+
+def kind_of(filename: str) -> str | None:
+    """"covers" or "pdfs" from the file extension, None for other files."""
+    extension = file_extension(filename)
+    return next((kind for kind, extensions in EXTENSIONS.items() if extension in extensions), None)
+
+def signature_matches(extension: str, head: bytes) -> bool:
+    if extension == "pdf":
+        return PDF_MARKER in head[:HEAD_SIZE]
+    return head.startswith(SIGNATURES.get(extension, (b"",)))
+
+def _too_large(kind: str | None, limit: int) -> RequestEntityTooLarge:
+    label = {"covers": "Cover images", "pdfs": "PDF files"}.get(kind, "Uploads")
+    return RequestEntityTooLarge(f"{label} are limited to {limit / (1024 * 1024):.3g} MB.")
+
+def _not_matching(extension: str) -> UnsupportedMediaType:
+    return UnsupportedMediaType(f"The file content does not match its .{extension} extension.")
+
+# ----- Form uploads -----
+class UploadSpool:
+    """
+    Temp file a file part of a form is streamed into, hashed and size-checked as it is written.
+    Covers and PDFs are spooled inside their blob folder so save_upload() is a plain rename;
+    other files (catalog imports) go to the system temp directory. Removed on close unless kept.
+    """
+    def __init__(self, filename: str):
+        self.extension = file_extension(filename)
+        self.kind = kind_of(filename)
+        self.max_size = SIZE_LIMITS.get(self.kind, MAX_UPLOAD_SIZE)
+        folder = BLOB_KINDS[self.kind][0] if self.kind else None
+        fd, self.path = tempfile.mkstemp(dir=folder, prefix=TEMP_PREFIX)
+        self.file = os.fdopen(fd, "w+b")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.kept = False
+
+    def write(self, data: bytes) -> int:
+        # A refused part is removed at once: Werkzeug never hands it to the request to close
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.close()
+            raise _too_large(self.kind, self.max_size)
+        if len(self.head) < HEAD_SIZE:
+            self.head += data[:HEAD_SIZE - len(self.head)]
+            if len(self.head) == HEAD_SIZE and self.kind and not signature_matches(self.extension, self.head):
+                self.close()
+                raise _not_matching(self.extension)
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def check_signature(self) -> None:
+        if self.kind and not signature_matches(self.extension, self.head):
+            raise _not_matching(self.extension)
+
+    def keep(self) -> str:
+        """Flushes and closes the file, which the caller now owns; returns its path."""
+        self.file.close()
+        self.kept = True
+        return self.path
+
+    def close(self) -> None:
+        self.file.close()
+        if not self.kept:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # read / seek / tell ... for FileStorage.save() and other readers
+        return getattr(self.file, name)
+
+class UploadRequest(Request):
+    """Request class that spools file uploads through UploadSpool instead of Werkzeug's buffer."""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadSpool(filename or "")
+
+def save_upload(upload, kind: str) -> str:
+    """
+    Stores an uploaded file (werkzeug FileStorage with an allowed extension) as a blob
+    and returns its name. Raises UnsupportedMediaType / RequestEntityTooLarge.
+    """
+    spool = upload.stream
+    if not isinstance(spool, UploadSpool):
+        # Parsed by a plain Request (e.g. outside the app): spool it now
+        spool = UploadSpool(upload.filename)
+        try:
+            while chunk := upload.stream.read(CHUNK_SIZE):
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+    if spool.kind != kind:
+        raise _not_matching(spool.extension)
+    spool.check_signature()  # files shorter than HEAD_SIZE
+    digest = spool.sha256.hexdigest()
+    return adopt_blob(spool.keep(), digest, kind, spool.extension)
+
+# ----- Resumable uploads -----
+def _session_paths(upload_id: str) -> tuple:
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except (TypeError, ValueError):
+        raise NotFound("Unknown upload.")
+    base = os.path.join(RESUMABLE_FOLDER, upload_id)
+    return f"{base}.json", f"{base}.part"
+
+def _load_session(upload_id: str, username: str) -> dict:
+    meta_path, _ = _session_paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise NotFound("Unknown or expired upload.")
+    if meta["username"] != username:
+        raise NotFound("Unknown or expired upload.")
+    return meta
+
+def _save_session(meta: dict) -> None:
+    meta_path, _ = _session_paths(meta["id"])
+    fd, temp_path = tempfile.mkstemp(dir=RESUMABLE_FOLDER, prefix=TEMP_PREFIX)
+    with os.fdopen(fd, "w") as f:
+        json.dump(meta, f)
+    os.replace(temp_path, meta_path)
+
+def _session_state(meta: dict, offset: int) -> dict:
+    return {"id": meta["id"], "offset": offset, "size": meta["size"], "chunk_size": UPLOAD_CHUNK_SIZE,
+            "complete": meta.get("name") is not None, "name": meta.get("name")}
+
+def expire_sessions() -> int:
+    """Removes resumable uploads not touched for UPLOAD_SESSION_TTL seconds."""
+    removed = 0
+    cutoff = time.time() - UPLOAD_SESSION_TTL
+    for entry in os.scandir(RESUMABLE_FOLDER):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def start_resumable(kind: str, filename: str, size: int, username: str) -> dict:
+    """Opens a resumable upload of size bytes; raises on a bad kind / extension / size."""
+    if kind not in EXTENSIONS or file_extension(filename) not in EXTENSIONS[kind]:
+        raise UnsupportedMediaType(f"Allowed files: {', '.join(sorted(EXTENSIONS.get(kind, ())))}.")
+    if size <= 0:
+        raise LengthRequired("The upload size is required.")
+    if size > SIZE_LIMITS[kind]:
+        raise _too_large(kind, SIZE_LIMITS[kind])
+    expire_sessions()
+    meta = {"id": uuid.uuid4().hex, "kind": kind, "extension": file_extension(filename), "size": size,
+            "username": username, "name": None}
+    open(_session_paths(meta["id"])[1], "xb").close()
+    _save_session(meta)
+    return _session_state(meta, 0)
+
+def resumable_status(upload_id: str, username: str) -> dict:
+    meta = _load_session(upload_id, username)
+    part_path = _session_paths(upload_id)[1]
+    offset = meta["size"] if meta["name"] else os.path.getsize(part_path)
+    return _session_state(meta, offset)
+
+def append_chunk(upload_id: str, offset: int, stream, length: int, username: str) -> dict:
+    """
+    Appends length bytes read from stream at offset. A wrong offset (a retried or
+    concurrent chunk) raises Conflict; the client then asks for the current offset.
+    The last chunk stores the finished file as a blob and returns its name.
+    """
+    meta = _load_session(upload_id, username)
+    if meta["name"]:
+        return _session_state(meta, meta["size"])
+    if length is None:
+        raise LengthRequired("Chunks need a Content-Length.")
+    if length > UPLOAD_CHUNK_SIZE:
+        raise RequestEntityTooLarge(f"Chunks are limited to {UPLOAD_CHUNK_SIZE} bytes.")
+    part_path = _session_paths(upload_id)[1]
+    try:
+        part = open(part_path, "r+b")
+    except FileNotFoundError:
+        raise NotFound("Unknown or expired upload.")
+    with part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise Conflict("Another chunk of this upload is being written.")
+            raise
+        current = part.seek(0, os.SEEK_END)
+        if offset != current:
+            raise Conflict(f"Upload is at offset {current}.")
+        if current + length > meta["size"]:
+            raise RequestEntityTooLarge("The chunk goes past the declared upload size.")
+        try:
+            remaining = length
+            while remaining:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                part.write(chunk)
+                remaining -= len(chunk)
+        finally:
+            # Whatever arrived before a disconnect stays: the client resumes after it
+            part.flush()
+            current = part.tell()
+            for path in _session_paths(upload_id):
+                os.utime(path)  # the session stays alive while chunks arrive
+
+        if current < meta["size"] and current < HEAD_SIZE:
+            return _session_state(meta, current)
+        part.seek(0)
+        if not signature_matches(meta["extension"], part.read(HEAD_SIZE)):
+            _discard(upload_id)
+            raise _not_matching(meta["extension"])
+        if current < meta["size"]:
+            return _session_state(meta, current)
+        digest = _part_digest(part)
+        # Saved before the .part file is renamed away, so resumable_status always finds one or the other
+        meta["name"] = blob_name(digest, meta["extension"])
+        _save_session(meta)
+        try:
+            adopt_blob(part_path, digest, meta["kind"], meta["extension"])
+        except Exception:
+            meta["name"] = None
+            _save_session(meta)
+            raise
+    return _session_state(meta, meta["size"])
+
+def _part_digest(part) -> str:
+    part.seek(0)
+    sha256 = hashlib.sha256()
+    while chunk := part.read(CHUNK_SIZE):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+def _discard(upload_id: str) -> None:
+    for path in _session_paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def cancel_resumable(upload_id: str, username: str) -> None:
+    _load_session(upload_id, username)
+    _discard(upload_id)
+
+def claim_resumable(upload_id: str, kind: str, username: str) -> str | None:
+    """
+    The blob name of a finished resumable upload, for the form that started it.
+    The session is closed; None if it is unknown, unfinished or of another kind.
+    """
+    try:
+        meta = _load_session(upload_id, username)
+    except NotFound:
+        return None
+    if meta["kind"] != kind or not meta["name"]:
+        return None
+    _discard(upload_id)
+    return meta["name"]
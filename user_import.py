@@ -0,0 +1,118 @@
+# user_import.py
+"""
+Bulk user import from CSV or JSON Lines, with already-hashed passwords.
+
+Accounts migrated from another system keep their credentials: each record
+carries a password_hash in a scheme UserDAO can verify (bcrypt, or the legacy
+unsalted SHA-256 hex digest), which is stored as is. Nothing is hashed during
+the import; legacy and lower-cost hashes are upgraded to bcrypt at
+BCRYPT_ROUNDS the first time each user logs in. Rows are inserted in batches of
+IMPORT_BATCH_SIZE; existing usernames (and emails) are skipped, never overwritten.
+
+CSV files need a header row with at least username and password_hash; optional
+columns are user_type (Student or Admin, default Student) and email. JSON Lines
+files hold one object per line with the same keys.
+
+    python user_import.py users.csv
+    python user_import.py users.jsonl --batch-size 10000
+"""
+import argparse
+import time
+from config import IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS
+from catalog_import import FORMATS, detect_format, iter_records
+from dao.user_dao import UserDAO, hash_scheme
+
+user_dao = UserDAO()
+
+# Column limits from the users table (see migrations.py)
+REQUIRED_FIELDS = {"username": 50, "password_hash": 255}
+USER_TYPES = {"student": "Student", "admin": "Admin"}
+EMAIL_LIMIT = 100
+
+# ----- Helper functions -----
+def validate_record(line_no: int, record: dict) -> tuple:
+    """
+    Returns the staging row for a record, as expected by UserDAO.import_users.
+    Raises ValueError with a readable message for invalid records.
+    """
+    values = {}
+    for field, limit in REQUIRED_FIELDS.items():
+        value = str(record.get(field) or "").strip()
+        if not value:
+            raise ValueError(f"{field} is required")
+        if len(value) > limit:
+            raise ValueError(f"{field} is longer than {limit} characters")
+        if "\x00" in value or "\ufffd" in value:
+            raise ValueError(f"{field} contains a NUL character or invalid UTF-8")
+        values[field] = value
+    if hash_scheme(values["password_hash"]) is None:
+        raise ValueError("password_hash is not a bcrypt or SHA-256 hex hash")
+
+    user_type = USER_TYPES.get(str(record.get("user_type") or "student").strip().lower())
+    if user_type is None:
+        raise ValueError("user_type must be Student or Admin")
+    email = str(record.get("email") or "").strip() or None
+    if email and (len(email) > EMAIL_LIMIT or "@" not in email):
+        raise ValueError("email is not a valid address")
+    return line_no, values["username"], values["password_hash"], user_type, email
+
+# ----- Import -----
+def import_users(stream, fmt: str, batch_size: int = None) -> dict:
+    """
+    Imports every record of a text stream ("csv" or "jsonl") and returns a summary:
+    inserted / skipped / failed counts, the first IMPORT_MAX_ERRORS (line, error)
+    pairs and the elapsed time.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    result = {"rows": 0, "inserted": 0, "skipped": 0, "failed": 0, "errors": [], "seconds": 0.0}
+    start = time.perf_counter()
+
+    def report(line_no, error):
+        result["failed"] += 1
+        if len(result["errors"]) < IMPORT_MAX_ERRORS:
+            result["errors"].append((line_no, error))
+
+    def flush(batch):
+        outcome = user_dao.import_users(batch)
+        result["inserted"] += outcome["inserted"]
+        result["skipped"] += len(outcome["skipped"])
+
+    batch = []
+    for line_no, record in iter_records(stream, fmt, REQUIRED_FIELDS):
+        result["rows"] += 1
+        if isinstance(record, str):
+            report(line_no, record)
+            continue
+        try:
+            batch.append(validate_record(line_no, record))
+        except ValueError as e:
+            report(line_no, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+def import_file(path: str, fmt: str = None, batch_size: int = None) -> dict:
+    """Imports a CSV / JSON Lines file from disk (format taken from the extension unless given)."""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise ValueError("Unsupported file type; use .csv or .jsonl")
+    # Undecodable bytes are replaced so validate_record rejects just the affected rows
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as stream:
+        return import_users(stream, fmt, batch_size)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import users with pre-hashed passwords.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    summary = import_file(args.path, args.format, args.batch_size)
+    for line_no, error in summary.pop("errors"):
+        print(f"line {line_no}: {error}")
+    print(summary)